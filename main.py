@@ -2,11 +2,12 @@ import sys
 import json
 import os
 from PyQt5.QtWidgets import QApplication, QFileDialog, QMessageBox
-from PyQt5.QtCore import Qt, QLocale, QFile, QTextStream
+from PyQt5.QtCore import Qt, QLocale, QFile, QTextStream, QThreadPool
 from PyQt5.QtGui import QIcon
 
-from ui.main_window import MainWindow
-from utils.file_manager import set_data_directory
+from ui.main_window import MainWindow, DEFAULT_SEARCH_DEBOUNCE_MS
+from utils.file_manager import set_data_directory, recover_interrupted_writes, checkpoint_writes, get_record_cache_stats
+from utils.storage_backend import STORAGE_JSON
 from utils.general import make_all_labels_copyable, resource_path
 
 CONFIG_FILE = "config.json"
@@ -72,10 +73,13 @@ def main():
             sys.exit(1) # Exit the application
 
     # Set the data directory for the rest of the application to use
-    if not set_data_directory(data_path):
+    if not set_data_directory(data_path, config.get("storage_backend", STORAGE_JSON)):
         QMessageBox.critical(None, "خطأ", f"لا يمكن الوصول إلى أو إنشاء مجلد البيانات:\n{data_path}")
         sys.exit(1)
 
+    # Replay the journal: finish any save that was cut off by a crash or power loss
+    recover_interrupted_writes()
+
 
 
 
@@ -86,7 +90,7 @@ def main():
 
     
     # Create an instance of the MainWindow
-    main_window = MainWindow()
+    main_window = MainWindow(search_debounce_ms=config.get("search_debounce_ms", DEFAULT_SEARCH_DEBOUNCE_MS))
 
     make_all_labels_copyable(main_window)
 
@@ -94,8 +98,19 @@ def main():
     main_window.show()
 
     # Start the Qt event loop
+    exit_code = app.exec_()
+
+    # Let a case list load still under way stop before the files are synced
+    main_window.case_list_loader.cancel()
+    QThreadPool.globalInstance().waitForDone()
+
+    # Sync the journaled saves into the case files, so the next start has nothing to replay
+    checkpoint_writes()
+    stats = get_record_cache_stats()
+    print(f"Record cache: {stats.hits} hits, {stats.misses} misses, {stats.entries}/{stats.capacity} entries")
+
     # sys.exit() ensures a clean exit, passing the application's exit status
-    sys.exit(app.exec_())
+    sys.exit(exit_code)
 
 # --- Entry Point Check ---
 # This ensures that main() is called only when the script is executed directly (not when it's imported as a module into another script).
@@ -0,0 +1,84 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.case_filter import CaseFilterEngine
+from utils.records import CaseSummary
+from utils.search_index import TrigramIndex
+
+NAMES = ["أحمد", "محمد", "سارة", "مريم", "يوسف", "علي", "هدى", "خالد"]
+DIAGNOSES = ["توحد", "متلازمة داون", "تأخر نمو", "فرط حركة"]
+
+
+def _summaries(count=400):
+    return [CaseSummary(f"{number} - case", number, f"{NAMES[number % 8]} {NAMES[number // 8 % 8]}",
+                        DIAGNOSES[number % 4], "2018-01-01", "ذكر", NAMES[number // 64 % 8], NAMES[number % 5],
+                        0, 0, True)
+            for number in range(count)]
+
+
+def _record_searches(monkeypatch):
+    searches = []
+    search = TrigramIndex.search
+
+    def recording_search(self, query, within=None):
+        searches.append((query, within))
+        return search(self, query, within)
+    monkeypatch.setattr(TrigramIndex, "search", recording_search)
+    return searches
+
+
+def test_first_keystroke_searches_the_postings(monkeypatch):
+    engine = CaseFilterEngine()
+    engine.set_summaries(_summaries())
+    engine.filter("", "", "")
+    searches = _record_searches(monkeypatch)
+    engine.filter("محم", "", "")
+    assert searches == [("محم", None)]
+
+
+def test_narrowing_searches_the_previous_matches(monkeypatch):
+    engine = CaseFilterEngine()
+    engine.set_summaries(_summaries())
+    rows = engine.filter("محم", "", "")
+    searches = _record_searches(monkeypatch)
+    engine.filter("محمد", "", "")
+    assert [within for _, within in searches] == [{engine._folders[row] for row in rows}]
+
+
+def test_incremental_results_match_fresh_searches():
+    summaries = _summaries()
+    engine = CaseFilterEngine()
+    engine.set_summaries(summaries)
+    for name_text in ["", "م", "مح", "محم", "محمد", "محمد ", "محمد س", "محمد سا"]:
+        for diagnosis_text in ["", "ت", "تو", "توحد"]:
+            fresh = CaseFilterEngine()
+            fresh.set_summaries(summaries)
+            assert engine.filter(name_text, "", diagnosis_text) == fresh.filter(name_text, "", diagnosis_text)
+
+
+def test_fuzzy_search_ranks_among_the_filtered_cases():
+    summaries = _summaries()
+    engine = CaseFilterEngine()
+    engine.set_summaries(summaries)
+    exact = engine.filter("احمد", "", "داون")
+    assert len(exact) > 5
+    fuzzy = engine.filter("احمد", "", "داون", fuzzy=True, fuzzy_limit=5)
+    assert len(fuzzy) == 5
+    assert all("داون" in summaries[row].diagnosis for row in fuzzy)
+
+
+def test_merged_batches_match_one_index():
+    summaries = _summaries()
+    merged = CaseFilterEngine()
+    for start in range(0, len(summaries), 64):
+        batch = CaseFilterEngine()
+        batch.set_summaries(summaries[start:start + 64])
+        merged.merge(batch)
+    indexed = CaseFilterEngine()
+    indexed.set_summaries(summaries)
+    for query in [("", "", ""), ("محم", "", ""), ("احمد", "3-8", "داون"), ("", "", "توحد")]:
+        assert merged.filter(*query) == indexed.filter(*query)
+    assert merged.filter("", "", "", age_order="youngest") == indexed.filter("", "", "", age_order="youngest")
+    assert merged.filter("احمد", "", "", fuzzy=True) == indexed.filter("احمد", "", "", fuzzy=True)
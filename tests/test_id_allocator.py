@@ -0,0 +1,38 @@
+"""The case ID allocator's recovery from a corrupt case_ids.json.
+
+Run from the repository root with: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import id_allocator
+from utils.case_layout import sharded_folder_name
+from utils.id_allocator import CASE_IDS_FILENAME, CaseIdAllocator
+
+
+def _corrupt_case_ids(data_dir):
+    with open(os.path.join(data_dir, CASE_IDS_FILENAME), 'w', encoding='utf-8') as f:
+        f.write('{"version": 2, "next_id": 4')
+
+
+def test_corrupt_file_is_rebuilt_from_the_case_folders(tmp_path):
+    for folder in ["3 - سارة - 2019-05-01", "7 - علي - 2020-01-01", sharded_folder_name(12)]:
+        os.makedirs(tmp_path / folder)
+    _corrupt_case_ids(tmp_path)
+    allocator = CaseIdAllocator(str(tmp_path))
+    assert allocator.reserve() == 13
+    assert allocator._load() == (14, [[3, 3], [7, 7], [12, 13]])
+
+
+def test_corrupt_file_raises_when_the_folders_cannot_be_listed(tmp_path, monkeypatch):
+    _corrupt_case_ids(tmp_path)
+
+    def unlistable(data_dir, layout):
+        raise PermissionError(data_dir)
+    monkeypatch.setattr(id_allocator, "iter_case_folders", unlistable)
+    with pytest.raises(ValueError):
+        CaseIdAllocator(str(tmp_path)).reserve()
@@ -0,0 +1,176 @@
+"""Several processes saving and editing cases in one data directory at the same time.
+
+Run from the repository root with: python -m pytest tests
+"""
+import json
+import multiprocessing
+import os
+import queue
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import file_manager
+from utils.atomic_io import STAGING_DIRNAME
+from utils.case_layout import case_id_of_folder
+from utils.id_allocator import CASE_IDS_FILENAME, CaseIdAllocator
+from utils.journal import JOURNAL_FILENAME
+from utils.locks import LOCKS_DIRNAME
+
+WORKERS = 6
+CASES_PER_WORKER = 12
+SHARED_CASES = 2
+SHARED_EDITS_PER_WORKER = 5
+SAVE_ATTEMPTS = 200
+
+
+def _case_data(case_id, child_name, diagnosis="توحد"):
+    return {
+        "case_id": case_id,
+        "child_name": {"value": child_name, "ar_key": "اسم الطفل"},
+        "dob": {"value": "2019-05-01", "ar_key": "تاريخ الميلاد"},
+        "diagnosis": {"value": diagnosis, "ar_key": "التشخيص"},
+    }
+
+
+def _survey_data(note):
+    return {
+        "survey_type": "استبيان المهارات الحركية",
+        "survey_date": "2024-06-01",
+        "motor_notes": {"value": note, "ar_key": "ملاحظات"},
+    }
+
+
+def _edit_case(case_id, edit):
+    """Loads a case, applies edit(case_data) and saves it with its revision, retrying after conflicts."""
+    for _ in range(SAVE_ATTEMPTS):
+        folder = file_manager.find_existing_case_folder(case_id)
+        case_data = file_manager.load_case_data_from_json(folder)
+        revision = case_data.get(file_manager.REVISION_KEY, 0)
+        edit(case_data)
+        success, message = file_manager.save_case_data_to_json(case_data, expected_revision=revision)
+        if success:
+            return
+    raise AssertionError(f"Could not save case {case_id}: {message}")
+
+
+def _worker(data_dir, worker_no, shared_ids, results):
+    file_manager.set_data_directory(data_dir)
+    saved = []
+    for number in range(CASES_PER_WORKER):
+        # As if another instance of the app started up while the others are saving
+        file_manager.recover_interrupted_writes()
+        case_id = file_manager.get_next_case_id()
+        child_name = f"طفل {worker_no} {number}"
+        success, message = file_manager.save_case_data_to_json(_case_data(case_id, child_name))
+        assert success, message
+        saved.append([case_id, child_name, f"ملاحظة {worker_no}-{number} للعملية"])
+
+        if number % 3 == 0:
+            # Renaming the child moves the case folder
+            child_name += " معدل"
+            _edit_case(case_id, lambda case_data, name=child_name: case_data["child_name"].update(value=name))
+            saved[-1][1] = child_name
+        folder = file_manager.find_existing_case_folder(case_id)
+        success, message = file_manager.save_survey_data_to_json(folder, _survey_data(saved[-1][2]))
+        assert success, message
+
+        if number < SHARED_EDITS_PER_WORKER:
+            for shared_id in shared_ids:
+                def count_edit(case_data, key=f"edits_{worker_no}"):
+                    field = case_data.setdefault(key, {"value": 0, "ar_key": key})
+                    field["value"] += 1
+                _edit_case(shared_id, count_edit)
+    file_manager.checkpoint_writes()
+    results.put((worker_no, saved))
+
+
+def _replay_index(path):
+    """Returns {key: entry} of an append-only index file, replaying its put and del lines."""
+    entries = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        next(f)  # Version header
+        for line in f:
+            entry = json.loads(line)
+            key = entry.get("folder"), entry.get("file")
+            if entry["op"] == "del":
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+    return entries
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path / "data")
+
+
+def test_concurrent_saves(data_dir):
+    file_manager.set_data_directory(data_dir)
+    shared_ids = []
+    for number in range(SHARED_CASES):
+        case_id = file_manager.get_next_case_id()
+        assert file_manager.save_case_data_to_json(_case_data(case_id, f"حالة مشتركة {number}"))[0]
+        shared_ids.append(case_id)
+    file_manager.checkpoint_writes()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(data_dir, worker_no, shared_ids, results))
+                 for worker_no in range(WORKERS)]
+    for process in processes:
+        process.start()
+    saved = {}
+    while len(saved) < WORKERS:
+        try:
+            worker_no, worker_cases = results.get(timeout=1)
+        except queue.Empty:
+            assert all(process.exitcode in (None, 0) for process in processes), "A worker process failed"
+            continue
+        saved[worker_no] = worker_cases
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    # Every allocated ID is unique and recorded as used in case_ids.json
+    cases = [case for worker_cases in saved.values() for case in worker_cases]
+    all_ids = [int(case_id) for case_id, _, _ in cases] + [int(case_id) for case_id in shared_ids]
+    assert len(set(all_ids)) == len(all_ids) == WORKERS * CASES_PER_WORKER + SHARED_CASES
+    next_id, used_ranges = CaseIdAllocator(data_dir)._load()
+    assert next_id > max(all_ids)
+    assert all(any(first <= case_id <= last for first, last in used_ranges) for case_id in all_ids)
+
+    # Nothing is left in the journal, the lock folder or the staging folder
+    assert os.path.getsize(os.path.join(data_dir, JOURNAL_FILENAME)) == 0
+    assert os.listdir(os.path.join(data_dir, LOCKS_DIRNAME)) == []
+    assert os.listdir(os.path.join(data_dir, STAGING_DIRNAME)) == []
+    assert os.path.exists(os.path.join(data_dir, CASE_IDS_FILENAME))
+
+    # Every save reached the files, and no edit of the shared cases was lost
+    file_manager.set_data_directory(data_dir)
+    folders = set(file_manager.get_all_case_folders())
+    assert len(folders) == len(all_ids)
+    for case_id, child_name, note in cases:
+        folder = file_manager.find_existing_case_folder(case_id)
+        assert file_manager.load_case_data_from_json(folder)["child_name"]["value"] == child_name
+        surveys = file_manager.load_surveys_for_case(folder)
+        assert [survey["motor_notes"]["value"] for survey in surveys] == [note]
+    for shared_id in shared_ids:
+        case_data = file_manager.load_case_data_from_json(file_manager.find_existing_case_folder(shared_id))
+        for worker_no in range(WORKERS):
+            assert case_data[f"edits_{worker_no}"]["value"] == SHARED_EDITS_PER_WORKER
+
+    # The index files only list cases and surveys that exist, and the indexes built from them are complete
+    for (folder, _), entry in _replay_index(os.path.join(data_dir, file_manager.CASE_INDEX_FILENAME)).items():
+        assert folder in folders
+        assert str(entry["case_id"]) == case_id_of_folder(folder)
+    summaries = {summary.folder: summary for summary in file_manager.get_case_summaries()}
+    assert set(summaries) == folders
+    for case_id, child_name, note in cases:
+        folder = file_manager.find_existing_case_folder(case_id)
+        assert summaries[folder].child_name == child_name
+        assert [match[0] for match in file_manager.search_surveys(note)] == [folder]
+    for (folder, filename), _ in _replay_index(os.path.join(data_dir, "survey_index.jsonl")).items():
+        assert os.path.exists(os.path.join(data_dir, folder, "surveys", filename))
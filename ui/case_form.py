@@ -647,10 +647,15 @@ class CaseForm(QDialog):
 
         if not self.case_data_to_load:
             case_data["case_id"] = get_next_case_id()
+            if not case_data["case_id"]:
+                QMessageBox.critical(self, "خطأ في الحفظ", "تعذر الحصول على رقم جديد للحالة، ربما يستخدمه مستخدم آخر الآن. الرجاء المحاولة مرة أخرى.")
+                return
         else:
             case_data["case_id"] = self.case_data_to_load.get("case_id")
 
-        success, message_or_path = save_case_data_to_json(case_data)
+        # Editing fails instead of overwriting if someone else saved the case in the meantime
+        expected_revision = self.case_data_to_load.get("_revision", 0) if self.case_data_to_load else None
+        success, message_or_path = save_case_data_to_json(case_data, expected_revision)
 
         if success:
             QMessageBox.information(self, "تم الحفظ", message_or_path)
@@ -0,0 +1,109 @@
+import threading
+
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal
+
+from utils.case_filter import CaseFilterEngine
+from utils.file_manager import iter_case_summaries, load_survey_index, CASE_SUMMARY_BATCH_SIZE
+
+
+class _LoaderSignals(QObject):
+    # Emitted from the worker thread; every signal carries the load it belongs to
+    batch_loaded = pyqtSignal(int, object, object)
+    finished = pyqtSignal(int, bool)
+    failed = pyqtSignal(int, str)
+
+
+class _LoadCaseListTask(QRunnable):
+    def __init__(self, load_id, signals, cancelled, batch_size):
+        super().__init__()
+        self.load_id = load_id
+        self.signals = signals
+        self.cancelled = cancelled
+        self.batch_size = batch_size
+
+    def run(self):
+        try:
+            for summaries in iter_case_summaries(self.batch_size):
+                if self.cancelled.is_set():
+                    break
+                summaries = [summary for summary in summaries if summary.valid]
+                # Indexed here, so the GUI thread only merges the batch into its engine
+                batch_index = CaseFilterEngine()
+                batch_index.set_summaries(summaries)
+                self.signals.batch_loaded.emit(self.load_id, summaries, batch_index)
+            if not self.cancelled.is_set():
+                load_survey_index()
+        except Exception as e:
+            print(f"Error loading the case list: {e}")
+            self.signals.failed.emit(self.load_id, str(e))
+            return
+        self.signals.finished.emit(self.load_id, self.cancelled.is_set())
+
+
+class CaseListLoader(QObject):
+    """Loads the case summaries on a QThreadPool worker, so the window stays responsive.
+
+    The summaries arrive in batches through batch_loaded, in list order, as the
+    data directory is scanned, each with a CaseFilterEngine indexing just that
+    batch, for CaseFilterEngine.merge(); finished(cancelled) follows the last batch.
+    start() cancels a load still under way, and batches of a cancelled or
+    superseded load are dropped, so a refresh never mixes two loads.
+    """
+    started = pyqtSignal()
+    batch_loaded = pyqtSignal(object, object)
+    finished = pyqtSignal(bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, batch_size=CASE_SUMMARY_BATCH_SIZE):
+        super().__init__(parent)
+        self.batch_size = batch_size
+        self.loaded_count = 0
+        self._load_id = 0
+        self._cancelled = None  # threading.Event of the current load, None when idle
+        # Queued, so the slots run on the GUI thread whichever thread emits
+        self._signals = _LoaderSignals()
+        self._signals.batch_loaded.connect(self._on_batch_loaded, Qt.QueuedConnection)
+        self._signals.finished.connect(self._on_finished, Qt.QueuedConnection)
+        self._signals.failed.connect(self._on_failed, Qt.QueuedConnection)
+
+    def is_loading(self):
+        return self._cancelled is not None
+
+    def start(self):
+        """Starts loading all case summaries, cancelling a load still under way."""
+        self._stop()
+        self._load_id += 1
+        self._cancelled = threading.Event()
+        self.loaded_count = 0
+        self.started.emit()
+        QThreadPool.globalInstance().start(_LoadCaseListTask(self._load_id, self._signals, self._cancelled, self.batch_size))
+
+    def cancel(self):
+        """Stops the current load after the batch being read; the batches delivered so far stay valid."""
+        if self._stop():
+            self.finished.emit(True)
+
+    def _stop(self):
+        if self._cancelled is None:
+            return False
+        self._cancelled.set()
+        self._cancelled = None
+        return True
+
+    def _on_batch_loaded(self, load_id, summaries, batch_index):
+        if load_id != self._load_id or self._cancelled is None:
+            return
+        self.loaded_count += len(summaries)
+        self.batch_loaded.emit(summaries, batch_index)
+
+    def _on_finished(self, load_id, cancelled):
+        if load_id != self._load_id or self._cancelled is None:
+            return
+        self._cancelled = None
+        self.finished.emit(cancelled)
+
+    def _on_failed(self, load_id, message):
+        if load_id != self._load_id or self._cancelled is None:
+            return
+        self._cancelled = None
+        self.failed.emit(message)
@@ -0,0 +1,202 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QAbstractProxyModel, QModelIndex
+
+from utils.case_filter import age_in_years
+
+# Role returning the CaseSummary behind a row (Qt.UserRole returns its folder name)
+CASE_SUMMARY_ROLE = Qt.UserRole + 1
+
+
+class CaseListModel(QAbstractListModel):
+    """List model over the CaseSummary tuples of the case index.
+
+    Rows are only turned into display strings when the view asks for them, so a
+    view with uniform item sizes only formats the rows that are on screen.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._summaries = []
+        self._rows = {}  # {folder_name: row}
+        self._display_cache = {}  # {row: display string}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._summaries)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        summary = self._summaries[row]
+        if role == Qt.DisplayRole:
+            text = self._display_cache.get(row)
+            if text is None:
+                text = self._display_text(summary)
+                self._display_cache[row] = text
+            return text
+        if role == Qt.UserRole:
+            return summary.folder
+        if role == CASE_SUMMARY_ROLE:
+            return summary
+        return None
+
+    def _display_text(self, summary):
+        child_name = summary.child_name or "اسم غير متوفر"
+        diagnosis = summary.diagnosis or "تشخيص غير متوفر"
+        age = age_in_years(summary.dob)
+        age_display = "N/A" if age is None else str(age)
+        return f"{child_name} - (العمر: {age_display}، التشخيص: {diagnosis})"
+
+    def set_summaries(self, summaries):
+        """Replaces all rows with the given case summaries."""
+        self.beginResetModel()
+        self._summaries = list(summaries)
+        self._rows = {summary.folder: row for row, summary in enumerate(self._summaries)}
+        self._display_cache = {}
+        self.endResetModel()
+
+    def add_summaries(self, summaries):
+        """Updates the rows of cases already in the model and appends the others in one insertion."""
+        new_summaries = []
+        for summary in summaries:
+            if summary.folder in self._rows:
+                self.upsert_summary(summary)
+            else:
+                new_summaries.append(summary)
+        if not new_summaries:
+            return
+        first = len(self._summaries)
+        self.beginInsertRows(QModelIndex(), first, first + len(new_summaries) - 1)
+        for row, summary in enumerate(new_summaries, first):
+            self._summaries.append(summary)
+            self._rows[summary.folder] = row
+        self.endInsertRows()
+
+    def upsert_summary(self, summary):
+        """Updates the row of a saved case, or appends it if it is not in the model yet."""
+        row = self._rows.get(summary.folder)
+        if row is None:
+            row = len(self._summaries)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._summaries.append(summary)
+            self._rows[summary.folder] = row
+            self.endInsertRows()
+            return
+        self._summaries[row] = summary
+        self._display_cache.pop(row, None)
+        index = self.index(row, 0)
+        self.dataChanged.emit(index, index)
+
+    def remove_summary(self, folder_name):
+        """Removes the row of a deleted case."""
+        row = self._rows.get(folder_name)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._summaries[row]
+        self._rows = {summary.folder: r for r, summary in enumerate(self._summaries)}
+        self._display_cache = {}
+        self.endRemoveRows()
+
+    def summary_at(self, row):
+        return self._summaries[row]
+
+    def row_of(self, folder_name):
+        """Returns the row of a case folder, or None if it is not in the model."""
+        return self._rows.get(folder_name)
+
+
+class CaseFilterProxyModel(QAbstractProxyModel):
+    """Shows the subset of CaseListModel rows chosen by the filter engine.
+
+    A filter change swaps the list of visible source rows in a single reset, so
+    its cost does not depend on the number of cases hidden by the filter. Rows
+    that only extend the visible list, e.g. a loaded batch under an unchanged
+    filter, are inserted instead, which keeps the selection and scroll position.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._source_rows = []
+        self._proxy_rows = None  # {source_row: proxy_row}, built on demand
+
+    def setSourceModel(self, source_model):
+        super().setSourceModel(source_model)
+        source_model.modelAboutToBeReset.connect(self.beginResetModel)
+        source_model.modelReset.connect(self._show_all_source_rows)
+        source_model.dataChanged.connect(self._forward_data_changed)
+        source_model.rowsAboutToBeRemoved.connect(self._source_rows_about_to_be_removed)
+        source_model.rowsRemoved.connect(self.endResetModel)
+        self.set_visible_rows(range(source_model.rowCount()))
+
+    def set_visible_rows(self, source_rows):
+        """Shows only the given source rows, in the given order."""
+        source_rows = list(source_rows)
+        shown = len(self._source_rows)
+        if len(source_rows) >= shown and source_rows[:shown] == self._source_rows:
+            if len(source_rows) > shown:
+                self.beginInsertRows(QModelIndex(), shown, len(source_rows) - 1)
+                self._source_rows = source_rows
+                if self._proxy_rows is not None:
+                    for proxy_row in range(shown, len(source_rows)):
+                        self._proxy_rows[source_rows[proxy_row]] = proxy_row
+                self.endInsertRows()
+            return
+        self.beginResetModel()
+        self._source_rows = source_rows
+        self._proxy_rows = None
+        self.endResetModel()
+
+    def _show_all_source_rows(self):
+        self._source_rows = list(range(self.sourceModel().rowCount()))
+        self._proxy_rows = None
+        self.endResetModel()
+
+    def _source_rows_about_to_be_removed(self, parent, first, last):
+        # Drop the removed rows and shift the following ones; rows appended to the
+        # source stay hidden until the owner applies its filter again.
+        self.beginResetModel()
+        removed = last - first + 1
+        self._source_rows = [row if row < first else row - removed
+                             for row in self._source_rows if not first <= row <= last]
+        self._proxy_rows = None
+
+    def _forward_data_changed(self, top_left, bottom_right, roles=()):
+        for source_row in range(top_left.row(), bottom_right.row() + 1):
+            proxy_index = self.mapFromSource(self.sourceModel().index(source_row, 0))
+            if proxy_index.isValid():
+                self.dataChanged.emit(proxy_index, proxy_index, roles)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._source_rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 1
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or column != 0 or not 0 <= row < len(self._source_rows):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        if index is None:
+            return super().parent()  # QObject.parent()
+        return QModelIndex()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self._source_rows[proxy_index.row()], 0)
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        if self._proxy_rows is None:
+            self._proxy_rows = {source_row: proxy_row for proxy_row, source_row in enumerate(self._source_rows)}
+        proxy_row = self._proxy_rows.get(source_index.row())
+        if proxy_row is None:
+            return QModelIndex()
+        return self.createIndex(proxy_row, 0)
@@ -1,5 +1,5 @@
-import json
 import os
+from collections import Counter
 from datetime import datetime
 from PyQt5.QtWidgets import (
     QDialog, QFormLayout, QLabel, QScrollArea, QPushButton,
@@ -36,7 +36,8 @@ except ImportError:
 
 from .case_form import CaseForm
 from .pdf_exporter import export_survey_to_pdf_with_custom_path
-from utils.file_manager import load_surveys_for_case, load_case_data_from_json, delete_survey_file, register_fonts
+from utils.records import SurveyHandle
+from utils.file_manager import load_survey_headers, load_survey_by_handle, load_case_data_from_json, delete_survey_file, register_fonts, find_existing_case_folder
 from utils.general import make_all_labels_copyable, resource_path
 
 class SurveyDetailViewer(QDialog):
@@ -48,6 +49,9 @@ class SurveyDetailViewer(QDialog):
         self.setGeometry(250, 50, 800, 600)        
         self.setWindowFlags(self.windowFlags() | Qt.WindowMinimizeButtonHint | Qt.WindowMaximizeButtonHint)
         self.setWindowState(Qt.WindowMaximized)
+        # The viewer is parented to the case viewer; without this it (and the survey
+        # it shows) would stay in memory until the case viewer is closed
+        self.setAttribute(Qt.WA_DeleteOnClose)
 
         layout = QVBoxLayout(self)
         
@@ -80,7 +84,7 @@ class SurveyDetailViewer(QDialog):
         scroll_layout.addRow(QLabel("تاريخ الاستبيان:"), QLabel(self.survey_data.get("survey_date", "-")))
 
 
-        skip_keys = ['survey_type', 'survey_date', 'submission_timestamp', 'case_id', 'child_name', 'dob', 'gender', '_filename']
+        skip_keys = ['survey_type', 'survey_date', 'submission_timestamp', 'case_id', 'child_name', 'dob', 'gender', '_filename', '_revision']
         for key, value_dict in self.survey_data.items():
             if key not in skip_keys and isinstance(value_dict, dict):
                 label = value_dict.get('ar_key', key)
@@ -101,6 +105,10 @@ class SurveyDetailViewer(QDialog):
         layout.addLayout(self.button_box)
         make_all_labels_copyable(self)
 
+    def done(self, result):
+        super().done(result)
+        self.survey_data = None  # Released as soon as the viewer closes
+
     def edit_survey(self):
         survey_type = self.survey_data.get("survey_type")
         edit_form = None
@@ -173,7 +181,7 @@ class SurveyDetailViewer(QDialog):
 
 
 class SurveySelectionDialog(QDialog):
-    """A dialog to allow users to select which surveys to export."""
+    """A dialog to allow users to select which surveys (given as SurveyHeader tuples) to export."""
     def __init__(self, surveys, parent=None):
         super().__init__(parent)
         self.setWindowTitle("تحديد الاستبيانات للتصدير")
@@ -203,9 +211,7 @@ class SurveySelectionDialog(QDialog):
 
         # Individual survey checkboxes
         for survey in self.surveys:
-            survey_type = survey.get("survey_type", "غير معروف")
-            survey_date = survey.get("survey_date", "غير معروف")
-            display_text = f"{survey_type} - {survey_date}"
+            display_text = f"{survey.survey_type} - {survey.survey_date}"
             
             checkbox = QCheckBox(display_text)
             checkbox.setChecked(False) # Default not to selected
@@ -235,7 +241,7 @@ class SurveySelectionDialog(QDialog):
             checkbox.setChecked(is_checked)
 
     def get_selected_surveys(self):
-        """Return a list of survey data for the checked items."""
+        """Return the SurveyHeader of the checked items."""
         selected = []
         for i, checkbox in enumerate(self.checkboxes):
             if checkbox.isChecked():
@@ -601,33 +607,43 @@ class CaseViewer(QDialog):
 
     def load_and_display_surveys(self):
         self.survey_list_widget.clear()
-        surveys = load_surveys_for_case(self.case_folder_name)
-        if surveys:
-            for survey_data in surveys:
-                survey_type = survey_data.get("survey_type", "غير معروف")
-                survey_date = survey_data.get("survey_date", "غير معروف")
-                item_text = f'{survey_type} - {survey_date}'
+        # Only the survey headers are listed; a survey is loaded when it is opened
+        headers = load_survey_headers(self.case_folder_name)
+        if headers:
+            # Repeated assessments of a type are numbered from the earliest
+            type_counts = Counter()
+            assessment_numbers = {}
+            for header in sorted(headers, key=lambda header: (header.survey_date, header.submission_timestamp)):
+                type_counts[header.survey_type] += 1
+                assessment_numbers[header.filename] = type_counts[header.survey_type]
+            for header in headers:
+                item_text = f'{header.survey_type} - {header.survey_date}'
+                if type_counts[header.survey_type] > 1:
+                    item_text += f' (التقييم {assessment_numbers[header.filename]})'
                 list_item = QListWidgetItem(item_text)
-                list_item.setData(Qt.UserRole, json.dumps(survey_data, ensure_ascii=False))
+                list_item.setData(Qt.UserRole, SurveyHandle(self.case_folder_name, header.filename))
                 self.survey_list_widget.addItem(list_item)
         else:
             self.survey_list_widget.addItem("لا توجد استبيانات مسجلة لهذه الحالة.")
             self.survey_list_widget.setEnabled(False)
 
     def view_selected_survey(self, item):
-        try:
-            survey_data_str = item.data(Qt.UserRole)
-            if not survey_data_str: return
-            survey_data = json.loads(survey_data_str)
-            detail_viewer = SurveyDetailViewer(survey_data, self.case_folder_name, parent=self)
-            if detail_viewer.exec_() == QDialog.Accepted:
-                self.load_and_display_surveys()
-        except (json.JSONDecodeError, TypeError) as e:
-            QMessageBox.warning(self, "خطأ", f"لا يمكن عرض تفاصيل الاستبيان. البيانات غير صالحة: {e}")
+        handle = item.data(Qt.UserRole)
+        if not handle: return
+        survey_data = load_survey_by_handle(handle)
+        if survey_data is None:
+            QMessageBox.warning(self, "خطأ", "لا يمكن عرض تفاصيل الاستبيان. ربما حُذف أو أن بياناته غير صالحة.")
+            self.load_and_display_surveys()
+            return
+        detail_viewer = SurveyDetailViewer(survey_data, self.case_folder_name, parent=self)
+        if detail_viewer.exec_() == QDialog.Accepted:
+            self.load_and_display_surveys()
 
     def edit_case_data(self):
         edit_form = CaseForm(parent=self, case_data_to_load=self.case_data)
         if edit_form.exec_() == QDialog.Accepted:
+            # Editing the child's name or date of birth moves the case to another folder
+            self.case_folder_name = find_existing_case_folder(self.case_data.get("case_id")) or self.case_folder_name
             updated_case_data = load_case_data_from_json(self.case_folder_name)
             if updated_case_data:
                 self.case_data = updated_case_data
@@ -676,13 +692,16 @@ class CaseViewer(QDialog):
             except:
                 return text
         try:
-            all_surveys = load_surveys_for_case(self.case_folder_name)
+            all_surveys = load_survey_headers(self.case_folder_name)
 
             # Show the selection dialog
             selection_dialog = SurveySelectionDialog(all_surveys, self)
             surveys_to_export = []
             if selection_dialog.exec_() == QDialog.Accepted:
-                surveys_to_export = selection_dialog.get_selected_surveys()
+                # Only the selected surveys are loaded
+                surveys_to_export = [load_survey_by_handle(SurveyHandle(self.case_folder_name, header.filename))
+                                     for header in selection_dialog.get_selected_surveys()]
+                surveys_to_export = [survey for survey in surveys_to_export if survey is not None]
             else:
                 return # User cancelled
 
@@ -740,7 +759,7 @@ class CaseViewer(QDialog):
             case_table_data = [
                 [Paragraph(pdf_ar_fix(self.case_data.get("case_id", "-")), cell_style), Paragraph(pdf_ar_fix("رقم الحالة"), cell_style_bold)]
             ]
-            skip_fields = ['case_id', 'child_name']
+            skip_fields = ['case_id', 'child_name', '_revision']
             for key, value in self.case_data.items():
                 if key not in skip_fields and value:
                     if isinstance(value, dict):
@@ -758,7 +777,7 @@ class CaseViewer(QDialog):
             story.append(table)
             
                         
-            skip_fields = ['survey_type', 'survey_date', 'submission_timestamp', 'case_id', 'child_name', 'dob', 'gender', '_filename']
+            skip_fields = ['survey_type', 'survey_date', 'submission_timestamp', 'case_id', 'child_name', 'dob', 'gender', '_filename', '_revision']
             if surveys_to_export:
                 for i, survey in enumerate(surveys_to_export, 1):
                     story.append(PageBreak())
@@ -1,25 +1,36 @@
 from PyQt5.QtWidgets import (
     QMainWindow, QPushButton, QVBoxLayout, QWidget, 
-    QListWidget, QMessageBox, QHBoxLayout, QLabel, QDialog,
-    QLineEdit, QInputDialog, QFrame
+    QListView, QMessageBox, QHBoxLayout, QLabel, QDialog,
+    QLineEdit, QInputDialog, QFrame, QCheckBox, QComboBox, QProgressBar
 )
 
 from PyQt5.QtGui import QIcon
 
-from PyQt5.QtCore import Qt, QSize
-import shutil
+from PyQt5.QtCore import Qt, QSize, QTimer
 
 from .case_form import CaseForm
 from .case_viewer import CaseViewer
-from utils.file_manager import get_all_case_folders, load_case_data_from_json, get_data_directory
+from .case_list_model import CaseListModel, CaseFilterProxyModel
+from .case_list_loader import CaseListLoader
+from .survey_search_dialog import SurveySearchDialog
+from utils.file_manager import (
+    load_case_data_from_json, delete_case_folder, case_exists,
+    add_case_change_listener, get_case_survey_types, add_survey_change_listener
+)
+from utils.case_filter import CaseFilterEngine, AGE_ORDER_YOUNGEST, AGE_ORDER_OLDEST
+from utils.case_facets import FACET_DIAGNOSIS, FACET_GENDER, FACET_AGE, FACET_SURVEYS
 from utils.general import resource_path
 import os
-from datetime import datetime, date
 
+# Delay between the last keystroke in a search box and re-filtering the case list
+DEFAULT_SEARCH_DEBOUNCE_MS = 150
+
+# Most frequent values shown per facet next to the search boxes
+FACET_DISPLAY_LIMIT = 5
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, search_debounce_ms=DEFAULT_SEARCH_DEBOUNCE_MS):
         super().__init__()
 
         # --- Window Properties ---
@@ -44,6 +55,12 @@ class MainWindow(QMainWindow):
 
         self.btn_create_case.clicked.connect(self.open_new_case_form)
         self.button_header_layout.addWidget(self.btn_create_case)
+
+        # --- "Search Surveys" Button ---
+        self.btn_search_surveys = QPushButton("البحث في الاستبيانات")
+        self.btn_search_surveys.setToolTip("البحث في إجابات الاستبيانات لكل الحالات")
+        self.btn_search_surveys.clicked.connect(self.open_survey_search)
+        self.button_header_layout.addWidget(self.btn_search_surveys)
         
         self.button_header_layout.addStretch(1)
         self.main_layout.addLayout(self.button_header_layout)
@@ -98,6 +115,13 @@ class MainWindow(QMainWindow):
 
         # In MainWindow.__init__, replace the entire search section with this block.
 
+        # Typing restarts this timer; the list is filtered once the user pauses.
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(search_debounce_ms)
+        self.filter_timer.timeout.connect(self.apply_combined_filter)
+        self.case_filter_engine = CaseFilterEngine()
+
         # --- Search/Filter Section ---
         self.search_layout = QHBoxLayout()
         self.search_label = QLabel("بحث باسم الحالة:")
@@ -106,28 +130,39 @@ class MainWindow(QMainWindow):
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("أَدخِل اسم الحالة أو جزء منه...")
         self.search_input.setFixedWidth(300)
-        # Connect to the single, combined filter function
-        self.search_input.textChanged.connect(self.apply_combined_filter)
+        # Connect to the single, debounced combined filter
+        self.search_input.textChanged.connect(self.filter_timer.start)
         self.search_input.setClearButtonEnabled(True)
         self.search_layout.addWidget(self.search_input)
 
+        # Opt-in typo-tolerant search, listing the closest names first
+        self.fuzzy_search_checkbox = QCheckBox("بحث تقريبي")
+        self.fuzzy_search_checkbox.setToolTip("عرض أقرب الأسماء حتى مع وجود أخطاء إملائية")
+        self.fuzzy_search_checkbox.stateChanged.connect(self.apply_combined_filter)
+        self.search_layout.addWidget(self.fuzzy_search_checkbox)
+
         self.search_layout.addStretch(1)
+        # Case counts of the filtered list, one facet per search row
+        self.gender_facet_label = QLabel()
+        self.search_layout.addWidget(self.gender_facet_label)
         self.main_layout.addLayout(self.search_layout)
 
 
         self.age_search_layout = QHBoxLayout()
-        self.age_search_label = QLabel("بحث بالعمر (سنين):")
+        self.age_search_label = QLabel("بحث بالعمر:")
         self.age_search_layout.addWidget(self.age_search_label)
 
         self.age_search_input = QLineEdit()
-        self.age_search_input.setPlaceholderText("أَدخِل العمر بالسنين فقط...")
+        self.age_search_input.setPlaceholderText("بالسنين مثل 5 أو 4-7، أو بالأشهر مثل 36ش أو <36ش")
         self.age_search_input.setFixedWidth(300)
-        # Connect to the same combined filter function
-        self.age_search_input.textChanged.connect(self.apply_combined_filter)
+        # Connect to the same debounced combined filter
+        self.age_search_input.textChanged.connect(self.filter_timer.start)
         self.age_search_input.setClearButtonEnabled(True)
         self.age_search_layout.addWidget(self.age_search_input)
 
         self.age_search_layout.addStretch(1)
+        self.age_facet_label = QLabel()
+        self.age_search_layout.addWidget(self.age_facet_label)
         self.main_layout.addLayout(self.age_search_layout)
 
 
@@ -138,12 +173,14 @@ class MainWindow(QMainWindow):
         self.diagnosis_search_input = QLineEdit()
         self.diagnosis_search_input.setPlaceholderText("أَدخِل التشخيص أو جزء منه...")
         self.diagnosis_search_input.setFixedWidth(300)
-        # Connect to the same combined filter function
-        self.diagnosis_search_input.textChanged.connect(self.apply_combined_filter)
+        # Connect to the same debounced combined filter
+        self.diagnosis_search_input.textChanged.connect(self.filter_timer.start)
         self.diagnosis_search_input.setClearButtonEnabled(True)
         self.diagnosis_search_layout.addWidget(self.diagnosis_search_input)
 
         self.diagnosis_search_layout.addStretch(1)
+        self.diagnosis_facet_label = QLabel()
+        self.diagnosis_search_layout.addWidget(self.diagnosis_facet_label)
         self.main_layout.addLayout(self.diagnosis_search_layout)
 
 
@@ -156,12 +193,56 @@ class MainWindow(QMainWindow):
         self.main_layout.addWidget(self.separator)
 
         # --- Case List Area ---
+        self.case_list_header_layout = QHBoxLayout()
         self.case_list_label = QLabel("الحالات المسجلة:")
-        self.main_layout.addWidget(self.case_list_label)
-
-        self.case_list_widget = QListWidget()
-        self.case_list_widget.itemDoubleClicked.connect(self.open_selected_case)
-        self.main_layout.addWidget(self.case_list_widget)
+        self.case_list_header_layout.addWidget(self.case_list_label)
+        self.survey_facet_label = QLabel()
+        self.case_list_header_layout.addWidget(self.survey_facet_label)
+        self.case_list_header_layout.addStretch(1)
+
+        self.sort_label = QLabel("ترتيب:")
+        self.case_list_header_layout.addWidget(self.sort_label)
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItem("الافتراضي", None)
+        self.sort_combo.addItem("العمر (الأصغر أولاً)", AGE_ORDER_YOUNGEST)
+        self.sort_combo.addItem("العمر (الأكبر أولاً)", AGE_ORDER_OLDEST)
+        self.sort_combo.currentIndexChanged.connect(self.apply_combined_filter)
+        self.case_list_header_layout.addWidget(self.sort_combo)
+        self.main_layout.addLayout(self.case_list_header_layout)
+
+        # Shown while the case list is loaded in the background
+        self.case_list_progress_layout = QHBoxLayout()
+        self.case_list_progress_bar = QProgressBar()
+        self.case_list_progress_bar.setRange(0, 0)  # The number of cases is not known in advance
+        self.case_list_progress_bar.setTextVisible(False)
+        self.case_list_progress_bar.setFixedWidth(200)
+        self.case_list_progress_layout.addWidget(self.case_list_progress_bar)
+        self.case_list_progress_label = QLabel()
+        self.case_list_progress_layout.addWidget(self.case_list_progress_label)
+        self.btn_cancel_loading = QPushButton("إيقاف التحميل")
+        self.btn_cancel_loading.setToolTip("إيقاف تحميل باقي الحالات")
+        self.case_list_progress_layout.addWidget(self.btn_cancel_loading)
+        self.case_list_progress_layout.addStretch(1)
+        self.case_list_progress_widget = QWidget()
+        self.case_list_progress_widget.setLayout(self.case_list_progress_layout)
+        self.case_list_progress_widget.hide()
+        self.main_layout.addWidget(self.case_list_progress_widget)
+
+        # The list view only renders the rows on screen; filtering only changes the proxy's row mapping.
+        self.case_list_model = CaseListModel(self)
+        self.case_filter_model = CaseFilterProxyModel(self)
+        self.case_filter_model.setSourceModel(self.case_list_model)
+
+        self.case_list_view = QListView()
+        self.case_list_view.setModel(self.case_filter_model)
+        self.case_list_view.setUniformItemSizes(True)
+        self.case_list_view.doubleClicked.connect(self.open_selected_case)
+        self.main_layout.addWidget(self.case_list_view)
+
+        # Shown instead of list items when there is nothing to list
+        self.case_list_status_label = QLabel()
+        self.case_list_status_label.hide()
+        self.main_layout.addWidget(self.case_list_status_label)
         
         # --- Buttons for Case List ---
         self.case_buttons_layout = QHBoxLayout()
@@ -199,15 +280,24 @@ class MainWindow(QMainWindow):
         self.main_layout.addLayout(self.case_buttons_layout)
 
 
-        # Store all cases data for filtering
-        self.all_cases_data = []
-
         # --- Styling if required ---
         self.setStyleSheet("""""")
 
         # --- Initial Population of Case List ---
+        # Cases are read on a worker thread and appear batch by batch; the refresh
+        # button goes through the same loader
+        self.case_list_loader = CaseListLoader(self)
+        self.case_list_loader.started.connect(self.on_case_list_loading_started)
+        self.case_list_loader.batch_loaded.connect(self.on_case_batch_loaded)
+        self.case_list_loader.finished.connect(self.on_case_list_loading_finished)
+        self.case_list_loader.failed.connect(self.on_case_list_loading_failed)
+        self.btn_cancel_loading.clicked.connect(self.case_list_loader.cancel)
         self.populate_case_list()
 
+        # Saved and deleted cases are applied to the list as they happen
+        add_case_change_listener(self.on_case_changed)
+        add_survey_change_listener(self.on_survey_changed)
+
     def open_new_case_form(self):
         """Opens the CaseForm dialog for creating a new case."""
         # Pass self as parent, so the dialog is modal to the main window
@@ -215,8 +305,7 @@ class MainWindow(QMainWindow):
         # exec_() makes the dialog blocking
         result = self.case_form_dialog.exec_()
         if result == QDialog.Accepted:
-            print("New case form accepted. Refreshing list.")
-            self.populate_case_list() # Refresh the list if a new case was saved
+            print("New case form accepted. The list was updated on save.")
         else:
             print("New case form cancelled or closed.")
 
@@ -274,234 +363,164 @@ class MainWindow(QMainWindow):
 
     def populate_case_list(self):
         """
-        Clears and repopulates the list of saved cases from the data directory.
-        It calculates the age dynamically and prepares data for filtering.
+        Clears the list and reloads the case summaries from the case index in the
+        background; the rows are added and filtered as they arrive.
         """
-        self.case_list_widget.clear()
-        self.all_cases_data = []  # Clear the master list of case data
-
-        case_folders = get_all_case_folders()
-        if not case_folders:
-            self.case_list_widget.addItem("لا توجد حالات مسجلة حاليًا.")
-            self.case_list_widget.setEnabled(False)
-            self.btn_open_case.setEnabled(False)
-            self.btn_remove_case.setEnabled(False)
-            return # Exit the function early
-        
-        # If we have cases, enable the buttons
-        self.case_list_widget.setEnabled(True)
-        self.btn_open_case.setEnabled(True)
-        self.btn_remove_case.setEnabled(True)
-        
-        for folder_name in case_folders:
-            case_data = load_case_data_from_json(folder_name)
-            
-            if not case_data:
-                # If case.json is missing or corrupt, add a placeholder and skip
-                self.case_list_widget.addItem(f"خطأ في تحميل بيانات المجلد: {folder_name}")
-                continue
-
-            # Safely get all data with fallbacks for missing keys
-            child_name = case_data.get("child_name", {}).get("value", "اسم غير متوفر")
-            diagnosis = case_data.get("diagnosis", {}).get("value", "تشخيص غير متوفر")
-            dob_str = case_data.get("dob", {}).get("value", "")
-            case_id = case_data.get("case_id", "N/A")
-
-            # --- Dynamically calculate age in years ---
-            age_in_years = "N/A"
-            if dob_str:
-                try:
-                    # Convert the date string to a date object
-                    dob_date = datetime.strptime(dob_str, "%Y-%m-%d").date()
-                    today = date.today()
-                    # Calculate age
-                    age = today.year - dob_date.year - ((today.month, today.day) < (dob_date.month, dob_date.day))
-                    age_in_years = str(age)
-                except (ValueError, TypeError):
-                    # Handle cases where dob_str is empty or has an invalid format
-                    age_in_years = "N/A"
-            
-            # Create the string that will be displayed in the list
-            display_name = f"{child_name} - (العمر: {age_in_years}، التشخيص: {diagnosis})"
-
-            # Store all necessary data for filtering and display in our master list
-            self.all_cases_data.append({
-                'folder_name': folder_name,
-                'child_name': child_name,
-                'diagnosis': diagnosis,
-                'age_in_years': age_in_years,
-                'display_name': display_name
-            })
-
-        # After processing all folders, apply the combined filter.
-        # This will populate the list widget with the correct items.
+        self.case_list_model.set_summaries([])
+        self.case_filter_engine.set_summaries([])
+        self.case_list_loader.start()
         self.apply_combined_filter()
 
 
+    def on_case_list_loading_started(self):
+        self.case_list_progress_label.setText("جارٍ تحميل الحالات...")
+        self.case_list_progress_widget.show()
 
-    def filter_case_list(self):
-        """Filters the case list based on the search input."""
-        search_text = self.search_input.text().strip()
-        
-        # If search is empty, show all cases
-        if not search_text:
-            self.populate_case_list()
-            return
-        
-        # Clear the current list
-        self.case_list_widget.clear()
-        
-        # Filter cases based on search text
-        filtered_cases = []
-        for case in self.all_cases_data:
-            if search_text.lower() in case['child_name'].lower():
-                filtered_cases.append(case)
-        
-        if not filtered_cases:
-            self.case_list_widget.addItem("لا توجد نتائج مطابقة للبحث.")
-            self.case_list_widget.setEnabled(False)
-            self.btn_open_case.setEnabled(False)
-            self.btn_remove_case.setEnabled(False)
-        else:
-            self.case_list_widget.setEnabled(True)
-            self.btn_open_case.setEnabled(True)
-            self.btn_remove_case.setEnabled(True)
-            
-            for case in filtered_cases:
-                self.case_list_widget.addItem(case['display_name'])
-                # Store the folder name with the item
-                self.case_list_widget.item(self.case_list_widget.count() - 1).setData(Qt.UserRole, case['folder_name'])
 
+    def on_case_batch_loaded(self, summaries, batch_index):
+        """Adds a batch of loaded cases, indexed by the loader, to the list and re-applies the current filters."""
+        self.case_list_model.add_summaries(summaries)
+        self.case_filter_engine.merge(batch_index)
+        self.case_list_progress_label.setText(f"جارٍ تحميل الحالات... ({self.case_list_loader.loaded_count})")
+        self.apply_combined_filter()
 
-    def age_filter_case_list(self):
-        """Filters the case list based on the search input."""
-        search_text = self.age_search_input.text().strip()
-        
-        # If search is empty, show all cases
-        if not search_text:
-            self.populate_case_list()
-            return
-        
-        # Clear the current list
-        self.case_list_widget.clear()
-        
-        # Filter cases based on search text
-        filtered_cases = []
-        for case in self.all_cases_data:
-            print(case['age_years_display'])
-            if search_text.lower() in case['age_years_display'].lower():
-                filtered_cases.append(case)
-        
-        if not filtered_cases:
-            self.case_list_widget.addItem("لا توجد نتائج مطابقة للبحث.")
-            self.case_list_widget.setEnabled(False)
-            self.btn_open_case.setEnabled(False)
-            self.btn_remove_case.setEnabled(False)
-        else:
-            self.case_list_widget.setEnabled(True)
-            self.btn_open_case.setEnabled(True)
-            self.btn_remove_case.setEnabled(True)
-            
-            for case in filtered_cases:
-                self.case_list_widget.addItem(case['display_name'])
-                # Store the folder name with the item
-                self.case_list_widget.item(self.case_list_widget.count() - 1).setData(Qt.UserRole, case['folder_name'])
-
-    def diagnosis_filter_case_list(self):
-        """Filters the case list based on the search input."""
-        search_text = self.diagnosis_search_input.text().strip()
-        
-        # If search is empty, show all cases
-        if not search_text:
-            self.populate_case_list()
-            return
-        
-        # Clear the current list
-        self.case_list_widget.clear()
-        
-        # Filter cases based on search text
-        filtered_cases = []
-        for case in self.all_cases_data:
-            if search_text.lower() in case['diagnosis_display'].lower():
-                filtered_cases.append(case)
-        
-        if not filtered_cases:
-            self.case_list_widget.addItem("لا توجد نتائج مطابقة للبحث.")
-            self.case_list_widget.setEnabled(False)
-            self.btn_open_case.setEnabled(False)
-            self.btn_remove_case.setEnabled(False)
+
+    def on_case_list_loading_finished(self, cancelled):
+        self.case_list_progress_widget.hide()
+        if cancelled:
+            self.case_list_label.setText(f"الحالات المسجلة (تم تحميل {self.case_list_model.rowCount()} حالة فقط):")
         else:
-            self.case_list_widget.setEnabled(True)
-            self.btn_open_case.setEnabled(True)
-            self.btn_remove_case.setEnabled(True)
-            
-            for case in filtered_cases:
-                self.case_list_widget.addItem(case['display_name'])
-                # Store the folder name with the item
-                self.case_list_widget.item(self.case_list_widget.count() - 1).setData(Qt.UserRole, case['folder_name'])
+            self.case_list_label.setText("الحالات المسجلة:")
+        for case_folder_name, survey_types in get_case_survey_types().items():
+            # After a cancelled load, only the cases loaded so far are listed
+            if self.case_list_model.row_of(case_folder_name) is not None:
+                self.case_filter_engine.update_survey_types(case_folder_name, survey_types)
+        self.update_facet_labels()
 
 
+    def on_case_list_loading_failed(self, message):
+        self.case_list_progress_widget.hide()
+        QMessageBox.warning(self, "خطأ", f"تعذر تحميل قائمة الحالات:\n{message}")
+
 
     def apply_combined_filter(self):
         """
         Filters the case list based on the current text in all search fields.
         """
-        # 1. Get the search text from all three input fields
-        name_search_text = self.search_input.text().strip().lower()
-        age_search_text = self.age_search_input.text().strip()
-        diagnosis_search_text = self.diagnosis_search_input.text().strip().lower()
-
-        # 2. Start with the full list of cases
-        # We create a copy to avoid modifying the original list
-        filtered_cases = list(self.all_cases_data)
-
-        # 3. Apply each filter sequentially if its search box is not empty
-        if name_search_text:
-            filtered_cases = [
-                case for case in filtered_cases 
-                if name_search_text in case.get('child_name', '').lower()
-            ]
-
-        if age_search_text:
-            filtered_cases = [
-                case for case in filtered_cases 
-                if age_search_text == case.get('age_in_years', 'N/A')
-            ]
-
-        if diagnosis_search_text:
-            filtered_cases = [
-                case for case in filtered_cases 
-                if diagnosis_search_text in case.get('diagnosis', '').lower()
-            ]
-
-        # 4. Update the QListWidget with the final filtered results
-        self.case_list_widget.clear()
-        
-        if not filtered_cases:
-            self.case_list_widget.addItem("لا توجد نتائج مطابقة للبحث.")
-            self.case_list_widget.setEnabled(False)
-            self.btn_open_case.setEnabled(False)
-            self.btn_remove_case.setEnabled(False)
+        self.filter_timer.stop()
+        current_folder = self.selected_case_folder()
+        visible_rows = self.case_filter_engine.filter(
+            self.search_input.text(),
+            self.age_search_input.text(),
+            self.diagnosis_search_input.text(),
+            fuzzy=self.fuzzy_search_checkbox.isChecked(),
+            age_order=self.sort_combo.currentData()
+        )
+        self.case_filter_model.set_visible_rows(visible_rows)
+        if current_folder and not self.case_list_view.currentIndex().isValid():
+            # The filter changed and the list was reset; keep the case selected if it is still listed
+            self.select_case_folder(current_folder)
+        self.update_case_list_state()
+        self.update_facet_labels()
+
+
+    def on_case_changed(self, case_folder_name, summary):
+        """Applies a saved (summary) or deleted (None) case to the list without reloading all cases."""
+        if summary is None:
+            self.case_list_model.remove_summary(case_folder_name)
+            self.case_filter_engine.remove_summary(case_folder_name)
+        elif summary.valid:
+            self.case_list_model.upsert_summary(summary)
+            self.case_filter_engine.update_summary(summary)
+        self.apply_combined_filter()
+
+
+    def on_survey_changed(self, case_folder_name, survey_types):
+        """Updates the survey counts after a survey of a case was saved or deleted."""
+        self.case_filter_engine.update_survey_types(case_folder_name, survey_types)
+        self.update_facet_labels()
+
+
+    def update_facet_labels(self):
+        """Shows the case counts per diagnosis, gender, age and survey for the filtered list."""
+        facet_counts = self.case_filter_engine.facet_counts()
+        self.gender_facet_label.setText(self.format_facet_counts("الجنس", facet_counts[FACET_GENDER]))
+        self.age_facet_label.setText(self.format_facet_counts("العمر", facet_counts[FACET_AGE]))
+        self.diagnosis_facet_label.setText(self.format_facet_counts("التشخيص", facet_counts[FACET_DIAGNOSIS]))
+        self.survey_facet_label.setText(self.format_facet_counts("الاستبيانات", facet_counts[FACET_SURVEYS]))
+
+
+    def format_facet_counts(self, title, counts):
+        """Formats [(value, count), ...] as "title: value (count)، ..." with the most frequent values."""
+        if not counts:
+            return ""
+        parts = [f"{value} ({count})" for value, count in counts[:FACET_DISPLAY_LIMIT]]
+        if len(counts) > FACET_DISPLAY_LIMIT:
+            parts.append("...")
+        return f"{title}: " + "، ".join(parts)
+
+
+    def update_case_list_state(self):
+        """Enables the list and its buttons only when there are rows to show."""
+        if self.case_list_model.rowCount() == 0 and self.case_list_loader.is_loading():
+            message = "جارٍ تحميل الحالات..."
+        elif self.case_list_model.rowCount() == 0:
+            message = "لا توجد حالات مسجلة حاليًا."
+        elif self.case_filter_model.rowCount() == 0:
+            message = "لا توجد نتائج مطابقة للبحث."
         else:
-            self.case_list_widget.setEnabled(True)
-            self.btn_open_case.setEnabled(True)
-            self.btn_remove_case.setEnabled(True)
-            
-            for case in filtered_cases:
-                self.case_list_widget.addItem(case['display_name'])
-                self.case_list_widget.item(self.case_list_widget.count() - 1).setData(Qt.UserRole, case['folder_name'])
+            message = ""
+
+        self.case_list_status_label.setText(message)
+        self.case_list_status_label.setVisible(bool(message))
+        self.case_list_view.setEnabled(not message)
+        self.btn_open_case.setEnabled(not message)
+        self.btn_remove_case.setEnabled(not message)
+
+
+    def selected_case_folder(self):
+        """Returns the folder name of the selected case, or None if no case is selected."""
+        index = self.case_list_view.currentIndex()
+        if not index.isValid():
+            return None
+        return index.data(Qt.UserRole)
+
+
+    def select_case_folder(self, case_folder_name):
+        """Selects and scrolls to a case if it is shown in the filtered list."""
+        source_row = self.case_list_model.row_of(case_folder_name)
+        if source_row is None:
+            return
+        index = self.case_filter_model.mapFromSource(self.case_list_model.index(source_row, 0))
+        if index.isValid():
+            self.case_list_view.setCurrentIndex(index)
+            self.case_list_view.scrollTo(index)
+
+
+    def open_survey_search(self):
+        """Opens the survey search dialog and views the case of the chosen result."""
+        case_names = {}
+        for row in range(self.case_list_model.rowCount()):
+            summary = self.case_list_model.summary_at(row)
+            case_names[summary.folder] = summary.child_name
+        self.survey_search_dialog = SurveySearchDialog(case_names, parent=self)
+        if self.survey_search_dialog.exec_() == QDialog.Accepted and self.survey_search_dialog.selected_case_folder:
+            self.open_case(self.survey_search_dialog.selected_case_folder)
 
 
     def open_selected_case(self):
         """Opens the selected case from the list in the CaseViewer for viewing."""
-        selected_item = self.case_list_widget.currentItem()
-        if not selected_item:
+        # Retrieve the folder name of the selected row
+        case_folder_name = self.selected_case_folder()
+        if not case_folder_name:
             QMessageBox.warning(self, "لم يتم تحديد حالة", "الرجاء تحديد حالة من القائمة لفتحها.")
             return
+        self.open_case(case_folder_name)
+
 
-        # Retrieve the folder name stored in the item's data
-        case_folder_name = selected_item.data(Qt.UserRole)
-        if not case_folder_name or not os.path.exists(os.path.join(get_data_directory(), case_folder_name, "case.json")):
+    def open_case(self, case_folder_name):
+        """Opens the case stored in the given folder in the CaseViewer for viewing."""
+        if not case_folder_name or not case_exists(case_folder_name):
              QMessageBox.critical(self, "خطأ", f"بيانات الحالة غير موجودة أو تالفة للمجلد: {case_folder_name}.")
              self.populate_case_list() # Refresh list if an item is problematic
              return
@@ -515,8 +534,7 @@ class MainWindow(QMainWindow):
             
             # If the viewer returns Accepted, it means data was updated (edit was performed)
             if result == QDialog.Accepted:
-                print(f"Case viewer for '{case_folder_name}' closed with updates. Refreshing list.")
-                self.populate_case_list() # Refresh the list to show any updates
+                print(f"Case viewer for '{case_folder_name}' closed with updates. The list was updated on save.")
             else:
                 print(f"Case viewer for '{case_folder_name}' closed without updates.")
         else:
@@ -526,14 +544,13 @@ class MainWindow(QMainWindow):
 
     def edit_selected_case(self):
         """Opens the selected case from the list in the CaseForm for editing."""
-        selected_item = self.case_list_widget.currentItem()
-        if not selected_item:
+        # Retrieve the folder name of the selected row
+        case_folder_name = self.selected_case_folder()
+        if not case_folder_name:
             QMessageBox.warning(self, "لم يتم تحديد حالة", "الرجاء تحديد حالة من القائمة لفتحها.")
             return
 
-        # Retrieve the folder name stored in the item's data
-        case_folder_name = selected_item.data(Qt.UserRole)
-        if not case_folder_name or not os.path.exists(os.path.join(get_data_directory(), case_folder_name, "case.json")):
+        if not case_folder_name or not case_exists(case_folder_name):
              QMessageBox.critical(self, "خطأ", f"بيانات الحالة غير موجودة أو تالفة للمجلد: {case_folder_name}.")
              self.populate_case_list() # Refresh list if an item is problematic
              return
@@ -547,8 +564,7 @@ class MainWindow(QMainWindow):
             
              # If the viewer returns Accepted, it means data was updated (edit was performed)
             if result == QDialog.Accepted:
-                print(f"Case form for \'{case_folder_name}\' accepted (data potentially updated). Refreshing list.")
-                self.populate_case_list() # Refresh if data was changed and re-saved
+                print(f"Case form for \'{case_folder_name}\' accepted (data potentially updated). The list was updated on save.")
             else:
                 print(f"Case form for \'{case_folder_name}\' cancelled or closed.")
         else:
@@ -558,14 +574,13 @@ class MainWindow(QMainWindow):
 
     def remove_selected_case(self):
         """Removes the selected case after confirmation."""
-        selected_item = self.case_list_widget.currentItem()
-        if not selected_item:
+        # Retrieve the folder name of the selected row
+        case_folder_name = self.selected_case_folder()
+        if not case_folder_name:
             QMessageBox.warning(self, "لم يتم تحديد حالة", "الرجاء تحديد حالة من القائمة لحذفها.")
             return
 
-        # Retrieve the folder name stored in the item's data
-        case_folder_name = selected_item.data(Qt.UserRole)
-        if not case_folder_name or not os.path.exists(os.path.join(get_data_directory(), case_folder_name)):
+        if not case_folder_name or not case_exists(case_folder_name):
             QMessageBox.critical(self, "خطأ", f"مجلد الحالة غير موجود: {case_folder_name}.")
             self.populate_case_list()  # Refresh list if an item is problematic
             return
@@ -592,16 +607,12 @@ class MainWindow(QMainWindow):
         )
         
         if ok and text == "حذف":
-            try:
-                # Delete the case folder and all its contents
-                case_path = os.path.join(get_data_directory(), case_folder_name)
-                shutil.rmtree(case_path)
-                
+            # Delete the case folder and all its contents
+            success, message = delete_case_folder(case_folder_name)
+            if success:
+                # The case change listener has already removed it from the list
                 QMessageBox.information(self, "تم الحذف", f"تم حذف الحالة \"{child_name}\" بنجاح.")
-                
-                # Refresh the case list
-                self.populate_case_list()
-            except Exception as e:
-                QMessageBox.critical(self, "خطأ في الحذف", f"حدث خطأ أثناء محاولة حذف الحالة:\n{str(e)}")
+            else:
+                QMessageBox.critical(self, "خطأ في الحذف", message)
         else:
             QMessageBox.information(self, "تم إلغاء الحذف", "تم إلغاء عملية الحذف.")
@@ -173,7 +173,7 @@ def export_survey_to_pdf_with_custom_path(survey_data, custom_path, case_data_fo
             [pdf_ar_fix(survey_data.get("survey_date", "-")), pdf_ar_fix("تاريخ الاستبيان")]
         ]
 
-        skip_fields = ['survey_type', 'survey_date', 'submission_timestamp', 'case_id', 'child_name', 'dob', 'gender', '_filename']
+        skip_fields = ['survey_type', 'survey_date', 'submission_timestamp', 'case_id', 'child_name', 'dob', 'gender', '_filename', '_revision']
         for key, value in survey_data.items():
             if key not in skip_fields and value:
                 survey_table_data.append([
@@ -799,7 +799,11 @@ class SurveyFormFirst(QDialog):
 
     def save_survey_data(self):
         survey_data = self.collect_survey_data()
-        success, message_or_path = save_survey_data_to_json(self.case_folder_name, survey_data)
+        # Editing fails instead of overwriting if someone else saved the survey in the meantime
+        expected_revision = self.survey_data_to_edit.get("_revision", 0) if self.survey_data_to_edit else None
+        # A new survey is added as another assessment; an edited one keeps its file
+        survey_filename = self.survey_data_to_edit["_filename"] + ".json" if self.survey_data_to_edit else None
+        success, message_or_path = save_survey_data_to_json(self.case_folder_name, survey_data, expected_revision, survey_filename)
         if success:
             QMessageBox.information(self, "تم الحفظ", "تم حفظ بيانات الاستبيان بنجاح.")
             self.accept() 
@@ -0,0 +1,94 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QLineEdit,
+    QComboBox, QPushButton, QListWidget, QListWidgetItem
+)
+from PyQt5.QtCore import Qt
+
+from utils.file_manager import get_survey_search_fields, search_surveys
+
+
+class SurveySearchDialog(QDialog):
+    """A dialog to search the answers of the surveys of all cases.
+
+    The search can be limited to one survey type and one of its fields. Double
+    clicking a result accepts the dialog; the case is then in selected_case_folder.
+    """
+    def __init__(self, case_names, parent=None):
+        """
+        Args:
+            case_names (dict): {case folder name: child's name}, used to label the results.
+        """
+        super().__init__(parent)
+        self.setWindowTitle("البحث في الاستبيانات")
+        self.setMinimumSize(600, 450)
+
+        self.case_names = case_names
+        self.selected_case_folder = None
+        self.search_fields = get_survey_search_fields()
+
+        self.layout = QVBoxLayout(self)
+        self.form_layout = QFormLayout()
+
+        self.survey_type_combo = QComboBox()
+        self.survey_type_combo.addItem("كل الاستبيانات", None)
+        for survey_type in self.search_fields:
+            self.survey_type_combo.addItem(survey_type, survey_type)
+        self.survey_type_combo.currentIndexChanged.connect(self.update_field_combo)
+        self.form_layout.addRow("نوع الاستبيان:", self.survey_type_combo)
+
+        self.field_combo = QComboBox()
+        self.form_layout.addRow("السؤال:", self.field_combo)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("أدخل نص الإجابة أو جزءًا منه...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.returnPressed.connect(self.run_search)
+        self.form_layout.addRow("بحث عن:", self.search_input)
+        self.layout.addLayout(self.form_layout)
+
+        self.search_button_layout = QHBoxLayout()
+        self.search_button = QPushButton("بحث")
+        self.search_button.clicked.connect(self.run_search)
+        self.search_button_layout.addWidget(self.search_button)
+        self.search_button_layout.addStretch()
+        self.layout.addLayout(self.search_button_layout)
+
+        self.results_label = QLabel()
+        self.layout.addWidget(self.results_label)
+
+        self.results_list = QListWidget()
+        self.results_list.itemDoubleClicked.connect(self.open_result)
+        self.layout.addWidget(self.results_list)
+
+        self.update_field_combo()
+
+    def update_field_combo(self):
+        """Lists the fields of the selected survey type."""
+        self.field_combo.clear()
+        self.field_combo.addItem("كل الأسئلة", None)
+        survey_type = self.survey_type_combo.currentData()
+        if survey_type is None:
+            return
+        for field_key, label in self.search_fields.get(survey_type, {}).items():
+            self.field_combo.addItem(label, field_key)
+
+    def run_search(self):
+        """Searches the surveys and lists one result per matching answer."""
+        self.results_list.clear()
+        text = self.search_input.text()
+        if not text.strip():
+            self.results_label.setText("")
+            return
+
+        results = search_surveys(text, self.survey_type_combo.currentData(), self.field_combo.currentData())
+        for case_folder_name, survey_filename, survey_type, survey_date, field_key in results:
+            child_name = self.case_names.get(case_folder_name, case_folder_name)
+            label = self.search_fields.get(survey_type, {}).get(field_key, field_key)
+            item = QListWidgetItem(f"{child_name} - {survey_type} ({survey_date}): {label}")
+            item.setData(Qt.UserRole, case_folder_name)
+            self.results_list.addItem(item)
+        self.results_label.setText(f"عدد النتائج: {len(results)}")
+
+    def open_result(self, item):
+        self.selected_case_folder = item.data(Qt.UserRole)
+        self.accept()
@@ -0,0 +1,145 @@
+import re
+from bisect import bisect_left, insort
+from calendar import monthrange
+from datetime import date
+
+# Upper bound used for open-ended queries such as ">5"
+MAX_AGE_MONTHS = 150 * 12
+
+_MONTH_SUFFIX = r"(?:m|ش|شهر|شهور|أشهر|اشهر)"
+_AGE_QUERY = re.compile(
+    r"^(?P<op>[<>])?\s*(?P<low>\d+)\s*(?:[-–]\s*(?P<high>\d+))?\s*(?P<months>" + _MONTH_SUFFIX + r")?$",
+    re.IGNORECASE
+)
+
+
+def parse_age_query(text):
+    """Parses an age filter into an inclusive (min_months, max_months) range.
+
+    Supported forms: "5" (5 years), "4-7" (4 to 7 years), "36m" or "36ش" (36 months),
+    "24-36m", and "<N" / ">N" for younger or older than N (years, or months with
+    the suffix). Returns None if the text is not a valid age query.
+    """
+    match = _AGE_QUERY.match(text.strip())
+    if not match:
+        return None
+    unit = 1 if match.group("months") else 12
+    low = int(match.group("low"))
+    high = int(match.group("high")) if match.group("high") else low
+    if high < low:
+        low, high = high, low
+
+    op = match.group("op")
+    if op == "<":
+        return 0, low * unit - 1
+    if op == ">":
+        return (low + 1) * unit, MAX_AGE_MONTHS
+    return low * unit, high * unit + unit - 1
+
+
+def age_in_years(dob_str, today=None):
+    """Returns the age in whole years for a "yyyy-MM-dd" date string, or None if it is invalid."""
+    if not dob_str:
+        return None
+    try:
+        dob_date = date.fromisoformat(dob_str)
+    except (ValueError, TypeError):
+        return None
+    today = today or date.today()
+    return today.year - dob_date.year - ((today.month, today.day) < (dob_date.month, dob_date.day))
+
+
+def subtract_months(day, months):
+    """Returns the date the given number of months before day, clamping to the month's last day."""
+    month_index = day.year * 12 + day.month - 1 - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    if year < 1:
+        return date.min
+    return date(year, month, min(day.day, monthrange(year, month)[1]))
+
+
+class DobIndex:
+    """Case folder names kept sorted by date of birth (as date ordinals).
+
+    An age range is turned into a date-of-birth range relative to today, which is
+    answered with two bisect lookups. Walking the index in order gives the cases
+    sorted by age without parsing or comparing dates. Cases without a valid date
+    of birth are not indexed. Cases of the same date of birth are ordered by
+    folder name.
+    """
+    def __init__(self, summaries=()):
+        self._entries = []  # Sorted (ordinal, folder name)
+        self._merged = []  # Entries merged in since the last sort
+        self._ordinal_by_folder = {}
+        for summary in summaries:
+            ordinal = self._ordinal(summary.dob)
+            if ordinal is not None:
+                self._entries.append((ordinal, summary.folder))
+                self._ordinal_by_folder[summary.folder] = ordinal
+        self._entries.sort()
+
+    def __len__(self):
+        return len(self._ordinal_by_folder)
+
+    @staticmethod
+    def _ordinal(dob_str):
+        try:
+            return date.fromisoformat(dob_str).toordinal()
+        except (ValueError, TypeError):
+            return None
+
+    def _sorted_entries(self):
+        if self._merged:
+            # Sorted runs, which sorting merges in linear time
+            self._entries.extend(self._merged)
+            self._entries.sort()
+            self._merged = []
+        return self._entries
+
+    def add(self, summary):
+        """Indexes (or re-indexes) a case by its date of birth."""
+        self.remove(summary.folder)
+        ordinal = self._ordinal(summary.dob)
+        if ordinal is None:
+            return
+        insort(self._sorted_entries(), (ordinal, summary.folder))
+        self._ordinal_by_folder[summary.folder] = ordinal
+
+    def merge(self, other):
+        """Adds the cases of another DobIndex, replacing those of the same folders.
+        The entries are sorted in on the next query, so merging batch after batch
+        while the case list loads stays cheap."""
+        for folder in other._ordinal_by_folder:
+            self.remove(folder)
+        self._merged.extend(other._sorted_entries())
+        self._ordinal_by_folder.update(other._ordinal_by_folder)
+
+    def remove(self, case_folder_name):
+        ordinal = self._ordinal_by_folder.pop(case_folder_name, None)
+        if ordinal is None:
+            return
+        entries = self._sorted_entries()
+        del entries[bisect_left(entries, (ordinal, case_folder_name))]
+
+    def folders_in_age_range(self, min_months, max_months, today=None):
+        """Returns the folders of cases aged between min_months and max_months (inclusive), in whole months.
+
+        A child is at least N months old when born on or before today minus N
+        months, and at most M months old when born after today minus M + 1 months.
+        """
+        today = today or date.today()
+        born_after = subtract_months(today, max_months + 1).toordinal()
+        born_on_or_before = subtract_months(today, min_months).toordinal()
+        entries = self._sorted_entries()
+        # (ordinal + 1,) sorts before every entry of ordinal + 1 and after every entry of ordinal
+        start = bisect_left(entries, (born_after + 1,))
+        end = bisect_left(entries, (born_on_or_before + 1,))
+        return [folder for _, folder in entries[start:end]]
+
+    def folders_by_age(self, youngest_first=True):
+        """Returns all indexed folders sorted by age."""
+        folders = [folder for _, folder in self._sorted_entries()]
+        if youngest_first:
+            folders.reverse()
+        return folders
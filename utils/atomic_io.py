@@ -0,0 +1,165 @@
+import json
+import os
+import time
+import uuid
+
+from .locks import LockTimeout, global_lock, owner_gone, process_tag, server_time, STAGING_LOCK, STALE_LOCK_SECONDS
+
+# Temp files are staged in one directory inside the data directory (so that
+# os.replace stays on the same file system) and startup recovery only has to
+# list that directory instead of walking every case folder. They are named
+# "<host>-<pid>-<random>.tmp" after the process writing them, so that recovery
+# can tell the temp files of running processes from abandoned ones.
+STAGING_DIRNAME = ".staging"
+TEMP_SUFFIX = ".tmp"
+
+# On Windows a file cannot be replaced while another process has it open, e.g.
+# while a reader is parsing it, so the replace is retried for a short while.
+REPLACE_RETRIES = 5
+REPLACE_RETRY_DELAY = 0.05
+
+
+def _staging_path(data_dir):
+    staging_path = os.path.join(data_dir, STAGING_DIRNAME)
+    os.makedirs(staging_path, exist_ok=True)
+    return staging_path
+
+
+def fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def fsync_dir(path):
+    """Makes a rename in the directory durable. Directories cannot be opened on Windows, where this is a no-op."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _replace(source, target):
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(REPLACE_RETRY_DELAY * (2 ** attempt))
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _write_temp_json(data_dir, data, sync, indent=4):
+    separators = (",", ":") if indent is None else None
+    return _write_temp_file(data_dir, lambda f: json.dump(data, f, ensure_ascii=False, indent=indent, separators=separators), sync)
+
+
+def _write_temp_file(data_dir, write, sync, binary=False):
+    # Created like any other file (unlike tempfile.mkstemp, which restricts the permissions)
+    temp_path = os.path.join(_staging_path(data_dir), f"{process_tag()}-{uuid.uuid4().hex}{TEMP_SUFFIX}")
+    try:
+        with (open(temp_path, 'xb') if binary else open(temp_path, 'x', encoding='utf-8')) as f:
+            write(f)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+    return temp_path
+
+
+def write_json_atomic(data_dir, path, data, indent=4, durable=True):
+    """Writes data as JSON to path so that the file holds either the old or the new content, never a part.
+
+    The JSON is written to a temp file in the staging directory, flushed to disk
+    with fsync and moved over the target with os.replace. Grouping several
+    changes into one durable commit is the job of the write-ahead journal
+    (see journal.py), which writes its files through here.
+    Args:
+        data_dir (str): The data directory; path must be inside it.
+        path (str): The file to write.
+        data: The JSON-serializable data.
+        indent (int): JSON indentation, or None for a compact single line without spaces.
+        durable (bool): Sync the file and its directory. Without it the replace is
+            still atomic, but a crash may lose it; for changes that are made durable
+            elsewhere, e.g. by the write-ahead journal.
+    """
+    _write_atomic(path, lambda sync: _write_temp_json(data_dir, data, sync, indent=indent), durable)
+
+
+def write_bytes_atomic(data_dir, path, content, durable=True):
+    """Writes binary content to path atomically, like write_json_atomic()."""
+    write_temp = lambda sync: _write_temp_file(data_dir, lambda f: f.write(content), sync, binary=True)
+    _write_atomic(path, write_temp, durable)
+
+
+def _write_atomic(path, write_temp, durable):
+    temp_path = write_temp(durable)
+    try:
+        _replace(temp_path, path)
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+    if durable:
+        fsync_dir(os.path.dirname(path))
+
+
+def _temp_owner_gone(name):
+    parts = name[:-len(TEMP_SUFFIX)].rsplit("-", 2)
+    if len(parts) != 3 or not parts[1].isdigit():
+        return False  # Named before temp files recorded their host
+    return owner_gone(parts[0], int(parts[1]))
+
+
+def recover_pending_writes(data_dir):
+    """Cleans up after writes interrupted by a crash. Meant to run at startup, before the data is used.
+
+    A temp file left by a process that has exited belongs to a write that never
+    finished and is deleted, leaving the previous version of its target
+    untouched. Other processes sharing the data directory may be writing their
+    temp files right now, so only files whose owner is known to be gone, or
+    that are older than STALE_LOCK_SECONDS by the file server's clock, are
+    deleted. Changes that must survive a crash are recorded in the journal,
+    whose replay completes them.
+    Returns:
+        int: The number of temp files deleted.
+    """
+    staging_path = os.path.join(data_dir, STAGING_DIRNAME)
+    if not os.path.isdir(staging_path):
+        return 0
+
+    discarded = 0
+    try:
+        with global_lock(data_dir, STAGING_LOCK):
+            now = server_time(staging_path)
+            for name in os.listdir(staging_path):
+                if not name.endswith(TEMP_SUFFIX):
+                    continue
+                path = os.path.join(staging_path, name)
+                try:
+                    age = now - os.stat(path).st_mtime
+                except OSError:
+                    continue
+                if age > STALE_LOCK_SECONDS or _temp_owner_gone(name):
+                    _remove_quietly(path)
+                    discarded += 1
+    except LockTimeout as e:
+        print(f"Skipped cleaning up {staging_path}: {e}")  # Another process is doing it
+        return 0
+    if discarded:
+        print(f"Deleted {discarded} unfinished write(s) from {staging_path}")
+    return discarded
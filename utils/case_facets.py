@@ -0,0 +1,143 @@
+from datetime import date
+
+from .age_index import age_in_years
+
+FACET_DIAGNOSIS = "diagnosis"
+FACET_GENDER = "gender"
+FACET_AGE = "age"
+FACET_SURVEYS = "surveys"
+FACETS = (FACET_DIAGNOSIS, FACET_GENDER, FACET_AGE, FACET_SURVEYS)
+
+# Age buckets in whole years: (label, youngest, oldest or None for no upper bound)
+AGE_BUCKETS = (
+    ("0-2", 0, 2),
+    ("3-5", 3, 5),
+    ("6-8", 6, 8),
+    ("9-12", 9, 12),
+    ("13+", 13, None),
+)
+UNSPECIFIED_VALUE = "غير محدد"
+
+
+def age_bucket(dob_str, today=None):
+    """Returns the label of the age bucket for a date of birth, or UNSPECIFIED_VALUE."""
+    age = age_in_years(dob_str, today)
+    if age is None or age < 0:
+        return UNSPECIFIED_VALUE
+    for label, youngest, oldest in AGE_BUCKETS:
+        if oldest is None or youngest <= age <= oldest:
+            return label
+    return UNSPECIFIED_VALUE
+
+
+class CaseFacets:
+    """Case counts per diagnosis, gender, age bucket and saved survey type.
+
+    Every facet value has a posting set of the case folder names that have it;
+    the sets are updated when a case is added, changed or removed, so counting
+    never looks at the cases themselves. Counts for a filtered list are the sizes
+    of the intersections of the posting sets with the set of matching folders.
+    Age buckets depend on today's date and are recomputed when the day changes.
+    """
+    def __init__(self, summaries=(), case_survey_types=None):
+        self._postings = {facet: {} for facet in FACETS}  # {facet: {value: set of folder names}}
+        self._values = {}  # {folder name: {facet: tuple of values}}
+        self._dobs = {}  # {folder name: date of birth}, for re-bucketing ages
+        self._survey_types = dict(case_survey_types or {})  # {folder name: set of survey types}
+        self._today = date.today()
+        for summary in summaries:
+            self.add(summary)
+
+    def __len__(self):
+        return len(self._dobs)
+
+    def _post(self, folder, facet, values):
+        """Replaces the values a folder is posted under for one facet."""
+        postings = self._postings[facet]
+        folder_values = self._values.setdefault(folder, {})
+        for value in folder_values.get(facet, ()):
+            folders = postings[value]
+            folders.discard(folder)
+            if not folders:
+                del postings[value]
+        for value in values:
+            postings.setdefault(value, set()).add(folder)
+        folder_values[facet] = tuple(values)
+
+    def add(self, summary):
+        """Counts (or re-counts) a case summary."""
+        folder = summary.folder
+        self._dobs[folder] = summary.dob
+        self._post(folder, FACET_DIAGNOSIS, ((summary.diagnosis or "").strip() or UNSPECIFIED_VALUE,))
+        self._post(folder, FACET_GENDER, ((summary.gender or "").strip() or UNSPECIFIED_VALUE,))
+        self._post(folder, FACET_AGE, (age_bucket(summary.dob, self._today),))
+        self._post(folder, FACET_SURVEYS, sorted(self._survey_types.get(folder, ())))
+
+    def merge(self, other):
+        """Adds the cases of another CaseFacets, e.g. one built on a worker thread,
+        replacing those of the same folders. The survey types recorded here are
+        kept. other must not be used afterwards."""
+        for folder in other._dobs:
+            if folder in self._dobs:
+                survey_types = self._survey_types.get(folder)
+                self.remove(folder)
+                if survey_types is not None:
+                    self._survey_types[folder] = survey_types
+        for facet, postings in other._postings.items():
+            merged = self._postings[facet]
+            for value, folders in postings.items():
+                posted = merged.get(value)
+                if posted is None:
+                    merged[value] = folders
+                else:
+                    posted |= folders
+        self._values.update(other._values)
+        self._dobs.update(other._dobs)
+        for folder in other._dobs:
+            if other._today != self._today:
+                self._post(folder, FACET_AGE, (age_bucket(other._dobs[folder], self._today),))
+            if folder in self._survey_types:
+                self._post(folder, FACET_SURVEYS, sorted(self._survey_types[folder]))
+        for folder, survey_types in other._survey_types.items():
+            self._survey_types.setdefault(folder, survey_types)
+
+    def remove(self, case_folder_name):
+        if case_folder_name not in self._dobs:
+            return
+        for facet in FACETS:
+            self._post(case_folder_name, facet, ())
+        del self._values[case_folder_name]
+        del self._dobs[case_folder_name]
+        self._survey_types.pop(case_folder_name, None)
+
+    def set_survey_types(self, case_folder_name, survey_types):
+        """Records the survey types saved for a case."""
+        self._survey_types[case_folder_name] = set(survey_types)
+        if case_folder_name in self._dobs:
+            self._post(case_folder_name, FACET_SURVEYS, sorted(survey_types))
+
+    def _refresh_age_buckets(self):
+        today = date.today()
+        if today == self._today:
+            return
+        self._today = today
+        for folder, dob in self._dobs.items():
+            self._post(folder, FACET_AGE, (age_bucket(dob, today),))
+
+    def counts(self, folders=None):
+        """Counts the cases per facet value.
+        Args:
+            folders (set): Folder names of the cases to count, or None for all cases.
+        Returns:
+            dict: {facet: [(value, count), ...]}, most frequent value first; values
+                  with no matching case are left out.
+        """
+        self._refresh_age_buckets()
+        result = {}
+        for facet, postings in self._postings.items():
+            if folders is None:
+                counts = [(value, len(posted)) for value, posted in postings.items()]
+            else:
+                counts = [(value, len(folders.intersection(posted))) for value, posted in postings.items()]
+            result[facet] = sorted((item for item in counts if item[1]), key=lambda item: (-item[1], item[0]))
+        return result
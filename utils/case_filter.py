@@ -0,0 +1,202 @@
+from .search_index import CaseSearchIndex, normalize_arabic
+from .fuzzy_search import FuzzyNameIndex, DEFAULT_FUZZY_LIMIT
+from .age_index import DobIndex, parse_age_query, age_in_years
+from .case_facets import CaseFacets
+
+AGE_ORDER_YOUNGEST = "youngest"
+AGE_ORDER_OLDEST = "oldest"
+
+
+class CaseFilterEngine:
+    """Filters case summaries by name, age and diagnosis.
+
+    Name and diagnosis queries are answered by the trigram CaseSearchIndex, with
+    Arabic spelling variants normalized away; in fuzzy mode the name query is
+    answered by the FuzzyNameIndex instead, ranked by closeness. Age queries
+    (see parse_age_query) are date-of-birth ranges looked up in the DobIndex,
+    which also provides the order when sorting by age. The result of the
+    previous query is remembered: when the new query only extends one that
+    narrowed the rows (each text field still contains its previous text and the
+    age is unchanged), the new text is only searched for among the previous
+    matches. CaseFacets keeps the counts per diagnosis, gender, age bucket and
+    survey type up to date; counts for the current result are computed once per
+    query.
+
+    Rows are numbered like the rows of CaseListModel: set_summaries() loads them
+    in order, add_summaries() and update_summary() replace rows or append new
+    ones at the end and remove_summary() deletes a row, shifting the following
+    rows up.
+    """
+    def __init__(self):
+        self.set_summaries([])
+
+    def set_summaries(self, summaries, case_survey_types=None):
+        """Indexes the given summaries and drops the previous result.
+        Args:
+            summaries (list): The CaseSummary of every listed case, in row order.
+            case_survey_types (dict): {case folder name: set of saved survey types}.
+        """
+        self._folders = [summary.folder for summary in summaries]
+        self._rows_by_folder = {folder: row for row, folder in enumerate(self._folders)}
+        self._search_index = CaseSearchIndex(summaries)
+        self._fuzzy_index = FuzzyNameIndex(summaries)
+        self._dob_index = DobIndex(summaries)
+        self._facets = CaseFacets(summaries, case_survey_types)
+        self._forget_last_result()
+
+    def update_summary(self, summary):
+        """Re-indexes a saved case, appending it as a new row if it is not loaded yet."""
+        self.add_summaries([summary])
+
+    def add_summaries(self, summaries):
+        """Indexes a batch of cases, e.g. as the case list is loaded, appending the ones not loaded yet as new rows."""
+        for summary in summaries:
+            if summary.folder not in self._rows_by_folder:
+                self._rows_by_folder[summary.folder] = len(self._folders)
+                self._folders.append(summary.folder)
+            self._search_index.add(summary)
+            self._fuzzy_index.add(summary)
+            self._dob_index.add(summary)
+            self._facets.add(summary)
+        self._forget_last_result()
+
+    def merge(self, batch):
+        """Adds a batch of cases indexed by a CaseFilterEngine of their own,
+        e.g. built on a worker thread while the case list loads, like
+        add_summaries(). Only the index structures are merged here, which is
+        much cheaper than indexing the cases. batch must not be used afterwards."""
+        for folder in batch._folders:
+            if folder not in self._rows_by_folder:
+                self._rows_by_folder[folder] = len(self._folders)
+                self._folders.append(folder)
+        self._search_index.merge(batch._search_index)
+        self._fuzzy_index.merge(batch._fuzzy_index)
+        self._dob_index.merge(batch._dob_index)
+        self._facets.merge(batch._facets)
+        self._forget_last_result()
+
+    def remove_summary(self, case_folder_name):
+        """Removes a deleted case; the rows after it move up by one."""
+        row = self._rows_by_folder.pop(case_folder_name, None)
+        if row is None:
+            return
+        del self._folders[row]
+        for folder in self._folders[row:]:
+            self._rows_by_folder[folder] -= 1
+        self._search_index.remove(case_folder_name)
+        self._fuzzy_index.remove(case_folder_name)
+        self._dob_index.remove(case_folder_name)
+        self._facets.remove(case_folder_name)
+        self._forget_last_result()
+
+    def update_survey_types(self, case_folder_name, survey_types):
+        """Records the survey types saved for a case, for the survey facet."""
+        self._facets.set_survey_types(case_folder_name, survey_types)
+        self._last_facet_counts = None
+
+    def _forget_last_result(self):
+        self._last_query = None
+        self._last_rows = None
+        self._last_order = None
+        self._last_result = None
+        self._last_facet_counts = None
+
+    def _extends_last_query(self, query):
+        if self._last_query is None:
+            return False
+        name_text, age_text, diagnosis_text, fuzzy = query
+        last_name, last_age, last_diagnosis, last_fuzzy = self._last_query
+        if fuzzy or last_fuzzy:
+            return False  # Fuzzy matches do not shrink as the query grows
+        if not (last_name or last_age or last_diagnosis):
+            return False  # The previous query matched every row; the index narrows them faster
+        return last_name in name_text and last_age == age_text and last_diagnosis in diagnosis_text
+
+    def _restrict(self, rows, matching_folders):
+        """Restricts rows (None meaning all rows) to the given set of folders."""
+        if rows is None:
+            return [row for row, folder in enumerate(self._folders) if folder in matching_folders]
+        folders = self._folders
+        return [row for row in rows if folders[row] in matching_folders]
+
+    def _search(self, rows, search, text):
+        """Restricts rows (None meaning all rows) to the cases search(text) matches.
+        Rows narrowed by an earlier filter are only searched among themselves (see TrigramIndex.search)."""
+        if rows is None:
+            return self._restrict(None, search(text))
+        folders = self._folders
+        return self._restrict(rows, search(text, {folders[row] for row in rows}))
+
+    def _order_by_age(self, rows, youngest_first):
+        """Sorts rows by walking the DobIndex; rows without a date of birth go last."""
+        rows_by_folder = self._rows_by_folder
+        wanted = set(rows)
+        ordered = []
+        for folder in self._dob_index.folders_by_age(youngest_first):
+            row = rows_by_folder.get(folder)
+            if row in wanted:
+                ordered.append(row)
+                wanted.discard(row)
+        ordered.extend(row for row in rows if row in wanted)
+        return ordered
+
+    def filter(self, name_text, age_text, diagnosis_text, fuzzy=False, fuzzy_limit=DEFAULT_FUZZY_LIMIT, age_order=None):
+        """Returns the rows matching all non-empty filters.
+        Args:
+            name_text (str): Substring of the child's or a parent's name, or
+                (with fuzzy) a possibly misspelled child's name.
+            age_text (str): Age or age range, e.g. "5", "4-7", "36ش" or "<36ش".
+            diagnosis_text (str): Substring of the diagnosis.
+            fuzzy (bool): Rank cases by how closely the child's name matches.
+            fuzzy_limit (int): Maximum number of cases returned in fuzzy mode.
+            age_order (str): AGE_ORDER_YOUNGEST or AGE_ORDER_OLDEST to sort by age.
+        Returns:
+            list: Matching row numbers, in ascending order unless ranked by
+                  fuzzy mode or sorted by age.
+        """
+        query = (normalize_arabic(name_text), age_text.strip(), normalize_arabic(diagnosis_text), bool(fuzzy))
+        if query != self._last_query:
+            self._last_rows = self._filter_rows(query, fuzzy_limit)
+            self._last_query = query
+            self._last_result = None
+            self._last_facet_counts = None
+        if self._last_result is None or age_order != self._last_order:
+            if age_order is None:
+                self._last_result = self._last_rows
+            else:
+                self._last_result = self._order_by_age(self._last_rows, age_order == AGE_ORDER_YOUNGEST)
+            self._last_order = age_order
+        return self._last_result
+
+    def facet_counts(self):
+        """Returns the facet counts (see CaseFacets.counts) of the cases matched by the last filter() call."""
+        if self._last_facet_counts is None:
+            rows = self._last_rows
+            if rows is None or len(rows) == len(self._folders):
+                self._last_facet_counts = self._facets.counts()
+            else:
+                folders = self._folders
+                self._last_facet_counts = self._facets.counts({folders[row] for row in rows})
+        return self._last_facet_counts
+
+    def _filter_rows(self, query, fuzzy_limit):
+        rows = self._last_rows if self._extends_last_query(query) else None
+        name_text, age_text, diagnosis_text, fuzzy = query
+
+        if name_text and not fuzzy:
+            rows = self._search(rows, self._search_index.search_names, name_text)
+        if diagnosis_text:
+            rows = self._search(rows, self._search_index.search_diagnoses, diagnosis_text)
+        if age_text:
+            age_range = parse_age_query(age_text)
+            if age_range is None:
+                return []
+            rows = self._restrict(rows, set(self._dob_index.folders_in_age_range(*age_range)))
+        if name_text and fuzzy:
+            # Ranked among the cases matching the other filters, so the limit never hides one of them
+            folders, rows_by_folder = self._folders, self._rows_by_folder
+            within = None if rows is None else {folders[row] for row in rows}
+            rows = [rows_by_folder[folder] for folder in self._fuzzy_index.search(name_text, fuzzy_limit, within)]
+        if rows is None:
+            rows = range(len(self._folders))
+        return list(rows)
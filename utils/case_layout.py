@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import re
+
+from .atomic_io import write_json_atomic
+
+# How case folders are arranged in the data directory, recorded in layout.json
+# so that every user sharing the directory uses the same one:
+#   LAYOUT_FLAT     "<case_id> - <child name> - <dob>" folders directly in the data directory
+#   LAYOUT_SHARDED  "<h1>/<h2>/<case_id>" folders, where h1 and h2 are the first two
+#                   byte pairs of the case ID's SHA-1, so no directory holds more than
+#                   256 entries at the top levels and a folder never changes name
+LAYOUT_FILENAME = "layout.json"
+LAYOUT_FLAT = "flat"
+LAYOUT_SHARDED = "sharded"
+CASE_LAYOUTS = (LAYOUT_FLAT, LAYOUT_SHARDED)
+
+_SHARD_NAME = re.compile(r"[0-9a-f]{2}")
+
+
+def read_layout(data_dir):
+    """Returns the case layout of a data directory; directories without layout.json are flat."""
+    try:
+        with open(os.path.join(data_dir, LAYOUT_FILENAME), 'r', encoding='utf-8') as f:
+            layout = json.load(f).get("case_layout", LAYOUT_FLAT)
+    except FileNotFoundError:
+        return LAYOUT_FLAT
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Error reading {LAYOUT_FILENAME}: {e}. Using the flat layout.")
+        return LAYOUT_FLAT
+    return layout if layout in CASE_LAYOUTS else LAYOUT_FLAT
+
+
+def write_layout(data_dir, layout):
+    write_json_atomic(data_dir, os.path.join(data_dir, LAYOUT_FILENAME), {"case_layout": layout})
+
+
+def flat_folder_name(case_id, child_name, dob):
+    return f"{case_id} - {child_name} - {dob}"
+
+
+def sharded_folder_name(case_id):
+    """Returns the folder of a case in the sharded layout, e.g. "7b/52/1234", relative to the data directory."""
+    case_id = str(case_id)
+    digest = hashlib.sha1(case_id.encode("utf-8")).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{case_id}"
+
+
+def case_folder_name(layout, case_id, child_name, dob):
+    """Returns the folder a case is saved in under the given layout."""
+    if layout == LAYOUT_SHARDED:
+        return sharded_folder_name(case_id)
+    return flat_folder_name(case_id, child_name, dob)
+
+
+def case_id_of_folder(case_folder_name):
+    """Returns the case ID encoded in a folder name of either layout."""
+    if "/" in case_folder_name:
+        return case_folder_name.rsplit("/", 1)[1]
+    return case_folder_name.split(" - ", 1)[0]
+
+
+def is_shard_name(name):
+    """Checks whether a directory name is one level of the sharded layout."""
+    return bool(_SHARD_NAME.fullmatch(name))
+
+
+def iter_case_folders(data_dir, layout):
+    """Yields the folder names of the data directory that may hold a case.
+
+    In the sharded layout only the shard directories are listed, never one huge
+    directory. Flat folders still at the top level (e.g. while a migration is
+    under way) are yielded in both layouts, so no case goes missing.
+    """
+    with os.scandir(data_dir) as it:
+        top_level = [entry.name for entry in it if entry.is_dir() and not entry.name.startswith(".")]
+    for name in top_level:
+        if layout != LAYOUT_SHARDED or not is_shard_name(name):
+            yield name
+            continue
+        with os.scandir(os.path.join(data_dir, name)) as shards:
+            second_level = [entry.name for entry in shards if entry.is_dir() and is_shard_name(entry.name)]
+        for second in second_level:
+            with os.scandir(os.path.join(data_dir, name, second)) as cases:
+                for entry in cases:
+                    if entry.is_dir():
+                        yield f"{name}/{second}/{entry.name}"
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+from .case_layout import read_layout, iter_case_folders
+from .record_format import SchemaRegistry, SCHEMAS_FILENAME, CASE_SCHEMA, FORMAT_COMPACT, FORMAT_LABELED, COMPRESSION_NONE, \
+    COMPRESSION_ZLIB, survey_schema, read_record, parse_stored, decode_record, compress_record, disk_indent
+
+# Compares the on-disk size of the case and survey files of a data directory in
+# each record format and compression, against the CPU time needed to decode them:
+#
+#   python -m utils.compression_benchmark DATA_DIR [--files N] [--mbps 100]
+#
+# The read throughput of DATA_DIR is measured on the sampled files (run it on the
+# network share itself; a second run may be served from the cache), and the time
+# to read every variant is estimated from it and from the given link speed. The
+# data directory is only read; schema versions are registered in a temporary copy
+# of schemas.json.
+
+DEFAULT_SAMPLE_FILES = 2000
+DEFAULT_LINK_MBPS = 100  # Megabits per second, a typical office network share
+REPEATS = 3
+
+# (name, record format, compression, preset dictionary)
+VARIANTS = [
+    ("labeled", FORMAT_LABELED, COMPRESSION_NONE, False),
+    ("compact", FORMAT_COMPACT, COMPRESSION_NONE, False),
+    ("labeled+zlib", FORMAT_LABELED, COMPRESSION_ZLIB, False),
+    ("labeled+zlib+dict", FORMAT_LABELED, COMPRESSION_ZLIB, True),
+    ("compact+zlib+dict", FORMAT_COMPACT, COMPRESSION_ZLIB, True),
+]
+
+
+def _sample_files(data_dir, count):
+    """Returns [(path, schema name, labeled record)] for up to count case and survey files."""
+    paths = []
+    for folder in iter_case_folders(data_dir, read_layout(data_dir)):
+        case_path = os.path.join(data_dir, folder)
+        paths.append(os.path.join(case_path, "case.json"))
+        surveys_path = os.path.join(case_path, "surveys")
+        if os.path.isdir(surveys_path):
+            paths.extend(os.path.join(surveys_path, name) for name in os.listdir(surveys_path) if name.endswith(".json"))
+    random.Random(0).shuffle(paths)
+    samples = []
+    for path in paths:
+        if len(samples) == count:
+            break
+        try:
+            record = read_record(data_dir, path)
+        except (OSError, ValueError):
+            continue
+        schema_name = CASE_SCHEMA if os.path.basename(path) == "case.json" else survey_schema(record.get("survey_type", ""))
+        samples.append((path, schema_name, record))
+    return samples
+
+
+def _read_throughput(paths):
+    """Reads the files and returns (bytes read, seconds)."""
+    total = 0
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb') as f:
+            total += len(f.read())
+    return total, time.perf_counter() - start
+
+
+def _encode(registry, schema_name, record, compression, use_dictionary):
+    data = registry.to_disk(schema_name, record)
+    if compression == COMPRESSION_NONE:
+        indent = disk_indent(data)
+        return json.dumps(data, ensure_ascii=False, indent=indent, separators=(",", ":") if indent is None else None).encode("utf-8")
+    if use_dictionary:
+        return compress_record(registry, data, registry.compression_ref(schema_name, data))
+    return zlib.compress(json.dumps(data, ensure_ascii=False, indent=disk_indent(data)).encode("utf-8"), 9)
+
+
+def _decode(registry, content, compression, use_dictionary):
+    if compression != COMPRESSION_NONE and not use_dictionary:
+        content = zlib.decompress(content)
+    return decode_record(registry, parse_stored(registry, content))
+
+
+def run(data_dir, sample_files=DEFAULT_SAMPLE_FILES):
+    """Measures every variant on a sample of the files of data_dir.
+    Returns:
+        list: (variant name, bytes, encode seconds, decode seconds) tuples, and the
+              measured read throughput of data_dir in bytes per second.
+    """
+    samples = _sample_files(data_dir, sample_files)
+    if not samples:
+        return [], 0
+    read_bytes, read_seconds = _read_throughput([path for path, _, _ in samples])
+    throughput = read_bytes / read_seconds if read_seconds > 0 else float("inf")
+
+    scratch_dir = tempfile.mkdtemp(prefix="mycases-benchmark-")
+    try:
+        if os.path.exists(os.path.join(data_dir, SCHEMAS_FILENAME)):
+            shutil.copy(os.path.join(data_dir, SCHEMAS_FILENAME), scratch_dir)
+        registry = SchemaRegistry(scratch_dir)
+        results = []
+        for name, record_format, compression, use_dictionary in VARIANTS:
+            registry.record_format = record_format
+            registry.compression = compression
+            contents = [_encode(registry, schema_name, record, compression, use_dictionary) for _, schema_name, record in samples]
+            encode_seconds = _best_of(lambda: [_encode(registry, schema_name, record, compression, use_dictionary)
+                                               for _, schema_name, record in samples])
+            decode_seconds = _best_of(lambda: [_decode(registry, content, compression, use_dictionary) for content in contents])
+            results.append((name, sum(map(len, contents)), encode_seconds, decode_seconds))
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return results, throughput
+
+
+def _best_of(work):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        work()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.compression_benchmark",
+                                     description="Compare the size and decoding cost of the record formats and compression.")
+    parser.add_argument("data_dir", help="The data directory (data_path in config.json).")
+    parser.add_argument("--files", type=int, default=DEFAULT_SAMPLE_FILES, help="Number of case and survey files to sample.")
+    parser.add_argument("--mbps", type=float, default=DEFAULT_LINK_MBPS, help="Link speed in megabits per second for the estimate.")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        print(f"Data directory not found: {args.data_dir}")
+        return 2
+    results, throughput = run(args.data_dir, max(1, args.files))
+    if not results:
+        print(f"No case files found in {args.data_dir}")
+        return 2
+
+    link = args.mbps * 1e6 / 8
+    _, baseline_bytes, _, baseline_decode = results[0]
+    print(f"Measured read throughput of {args.data_dir}: {throughput / 1e6:.1f} MB/s")
+    print(f"{'variant':<20}{'bytes':>12}{'ratio':>8}{'encode ms':>11}{'decode ms':>11}"
+          f"{'read ms':>10}{f'@{args.mbps:g}Mb ms':>14}{'net saved ms':>14}")
+    for name, size, encode_seconds, decode_seconds in results:
+        read_ms = size / throughput * 1000
+        link_ms = size / link * 1000
+        # I/O time saved over the link against the extra decoding time, compared to labeled files
+        saved_ms = (baseline_bytes - size) / link * 1000 - (decode_seconds - baseline_decode) * 1000
+        print(f"{name:<20}{size:>12}{size / baseline_bytes:>8.2f}{encode_seconds * 1000:>11.1f}{decode_seconds * 1000:>11.1f}"
+              f"{read_ms:>10.1f}{link_ms:>14.1f}{saved_ms:>14.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
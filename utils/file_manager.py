@@ -1,16 +1,84 @@
 import json
 import os
 import re
+import sqlite3
+import threading
+from itertools import islice
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from .general import resource_path
+from .scanner import scan_case_folders, SCAN_OK
+from .survey_index import SurveyIndex
+from .survey_manifest import survey_headers, put_survey_header, remove_survey_header
+from .survey_history import BASE_KEY, new_survey_filename, resolve_survey, stored_survey, apply_delta, make_delta
+from .atomic_io import recover_pending_writes
+from .journal import Journal, OP_PUT, OP_DELETE, OP_MOVE
+from .case_layout import read_layout, case_folder_name, sharded_folder_name, case_id_of_folder, iter_case_folders, LAYOUT_SHARDED
+from .id_allocator import CaseIdAllocator
+from .locks import LockTimeout, case_lock, global_lock, INDEX_LOCK
+from .record_cache import RecordCache
+from .record_format import schema_registry, read_record, decode_record, disk_indent, survey_schema, CASE_SCHEMA
+from .records import MISSING_SURVEY_DATE, SurveyHandle, CaseSummary, REVISION_KEY, summary_from_case_data, revision_of, check_revision
+from .storage_backend import STORAGE_JSON, STORAGE_SQLITE
+from .sqlite_backend import SqliteBackend
 
 DATA_DIR = None
 
-def set_data_directory(path):
-    """Sets the global DATA_DIR for the application session."""
-    global DATA_DIR
+# The StorageBackend the public functions below forward to, or None for the
+# folder-per-case JSON layout implemented in this module.
+_backend = None
+
+# Persistent summary index of all cases, stored as an append-only JSON-lines file
+# in DATA_DIR so that listing cases does not require parsing every case.json.
+CASE_INDEX_FILENAME = "case_index.jsonl"
+CASE_INDEX_VERSION = 3
+
+_case_index = None  # {folder_name: CaseSummary}, loaded lazily from CASE_INDEX_FILENAME
+# Cases scanned and listed at a time by iter_case_summaries()
+CASE_SUMMARY_BATCH_SIZE = 500
+_case_index_lines = 0  # Number of entry lines currently in the index file (live + superseded)
+_case_id_folders = {}  # {case_id: folder_name}, derived from the case index
+_case_index_validated = False  # True once the index was checked against the data directory
+_case_change_listeners = []  # Callables notified when a case is saved or deleted
+# The case list is loaded on a worker thread (see iter_case_summaries) while the
+# GUI thread saves cases, so changes to the in-memory case index are serialized
+_case_index_lock = threading.RLock()
+_survey_index = None  # SurveyIndex over the values of all surveys, loaded lazily
+_survey_index_lock = threading.Lock()
+_survey_change_listeners = []  # Callables notified when a survey is saved or deleted
+_journal = None  # Write-ahead Journal that all changes to case and survey files go through
+_layout = None  # Case folder layout of DATA_DIR (see case_layout), read lazily
+
+# Parsed case.json and survey files, so that opening a case, its survey forms and
+# the PDF export do not parse the same files again and again. Unusually large
+# files are not kept once loaded, so they are only in memory while they are open.
+RECORD_CACHE_SIZE = 512
+RECORD_CACHE_MAX_FILE_BYTES = 256 * 1024
+_record_cache = RecordCache(RECORD_CACHE_SIZE, RECORD_CACHE_MAX_FILE_BYTES)
+
+# Shown when another user holds the lock of a case for longer than the lock timeout
+CASE_LOCKED_MESSAGE = "الحالة قيد الحفظ من مستخدم آخر حاليًا، الرجاء المحاولة مرة أخرى بعد قليل."
+
+def set_data_directory(path, storage_backend=STORAGE_JSON):
+    """Sets the global DATA_DIR for the application session.
+    Args:
+        path (str): The data directory.
+        storage_backend (str): How cases are stored in it: STORAGE_JSON (a folder
+            per case) or STORAGE_SQLITE (one SQLite database).
+    Returns:
+        bool: False if the directory or the storage could not be opened.
+    """
+    global DATA_DIR, _case_index, _case_index_validated, _survey_index, _backend, _journal, _layout
     DATA_DIR = path
+    _layout = None
+    _record_cache.clear()
+    _case_index = None
+    _case_index_validated = False
+    _survey_index = None
+    _journal = None
+    if _backend is not None:
+        _backend.close()
+        _backend = None
     # Ensure the directory exists when it's set.
     if not os.path.exists(DATA_DIR):
         try:
@@ -18,12 +86,113 @@ def set_data_directory(path):
         except OSError as e:
             print(f"Could not create data directory at {DATA_DIR}: {e}")
             return False
+    if storage_backend == STORAGE_SQLITE:
+        try:
+            _backend = SqliteBackend(DATA_DIR)
+        except sqlite3.Error as e:
+            print(f"Could not open the SQLite database in {DATA_DIR}: {e}")
+            return False
+    elif storage_backend != STORAGE_JSON:
+        print(f"Unknown storage backend: {storage_backend}")
+        return False
     return True
 
 def get_data_directory():
     """Gets the current DATA_DIR."""
     return DATA_DIR
 
+def _get_layout():
+    global _layout
+    if _layout is None:
+        _layout = read_layout(DATA_DIR)
+    return _layout
+
+def _get_journal():
+    global _journal
+    if _journal is None:
+        _journal = Journal(DATA_DIR)
+    return _journal
+
+def recover_interrupted_writes():
+    """Completes the case and survey changes interrupted by a crash. Call at startup.
+
+    Temp files abandoned by exited processes are deleted (see
+    recover_pending_writes), and the journal is replayed: changes it
+    recorded that did not reach the files are applied, and the survey and case
+    indexes are updated from its entries instead of rescanning every file.
+    Returns:
+        int: The number of changes that had to be applied again.
+    """
+    if _backend is not None:
+        return 0  # The database rolls back interrupted transactions itself
+    recover_pending_writes(DATA_DIR)
+    registry = schema_registry(DATA_DIR)
+    replayed_surveys = []
+
+    def replay(entry, reapplied):
+        path = entry["path"]
+        if entry["op"] == OP_MOVE or (entry["op"] == OP_DELETE and path[-1] != "case.json" and "surveys" not in path):
+            # A case folder that was renamed or deleted
+            if _drop_indexed_case("/".join(path)):
+                _append_case_index_entries([{"op": "del", "folder": "/".join(path)}])
+            replayed_surveys.append(entry)
+        elif len(path) >= 3 and path[-2] == "surveys":
+            replayed_surveys.append(entry)
+        elif path[-1] == "case.json" and entry["op"] == OP_PUT and reapplied:
+            _index_saved_case("/".join(path[:-1]), decode_record(registry, entry["data"]), _get_journal().path_of(entry))
+
+    try:
+        reapplied = _get_journal().checkpoint(on_replay=replay)
+    except (LockTimeout, OSError) as e:
+        print(f"Error replaying the journal: {e}")
+        return 0
+    if replayed_surveys:
+        # Appended rather than saved whole: other processes may have indexed
+        # surveys this process has not loaded
+        survey_index = _get_survey_index()
+        put_surveys = []
+        for entry in replayed_surveys:
+            path = entry["path"]
+            if entry["op"] == OP_MOVE:
+                survey_index.remove_case("/".join(path))
+                moved_folder = "/".join(entry["to"])
+                for survey_filename, survey_data in _read_survey_files(moved_folder):
+                    survey_index.put_survey(moved_folder, survey_filename, survey_data, persist=False)
+                    put_surveys.append((moved_folder, survey_filename))
+            elif path[-2:-1] != ["surveys"]:
+                survey_index.remove_case("/".join(path))
+            elif entry["op"] == OP_PUT:
+                # Loaded from the file, since the entry may hold a delta (see survey_history)
+                survey_data = load_single_survey("/".join(path[:-2]), path[-1])
+                if survey_data is not None:
+                    survey_index.put_survey("/".join(path[:-2]), path[-1], survey_data, persist=False)
+                    put_surveys.append(("/".join(path[:-2]), path[-1]))
+            else:
+                survey_index.remove_survey("/".join(path[:-2]), path[-1])
+        survey_index.persist_surveys(put_surveys)
+    return reapplied
+
+def checkpoint_writes():
+    """Syncs the journaled changes into the case and survey files and empties the journal, e.g. on exit."""
+    if _backend is not None:
+        return
+    try:
+        _get_journal().checkpoint()
+    except (LockTimeout, OSError) as e:
+        print(f"Error checkpointing the journal: {e}")
+
+def batch_case_writes():
+    """Returns a context manager grouping the case and survey saves inside it into one commit.
+
+    Meant for bulk operations: the whole batch is recorded with one journal
+    append and sync, and the saves only appear (and are indexed) when the block
+    ends. Case locks only cover the checks before recording, not applying the
+    changes, so bulk operations should not run while others edit the same cases.
+    """
+    if _backend is not None:
+        return _backend.batch()
+    return _get_journal().batch()
+
 
 def sanitize_filename(name):
     """Sanitizes a string to be used as a filename by removing or replacing invalid characters."""
@@ -33,59 +202,75 @@ def sanitize_filename(name):
 
 def get_next_case_id():
     """Gets the next available unique case ID.
-    
-    Reads from a JSON file that tracks all used IDs, finds the next available ID,
-    updates the tracking file, and returns the new ID.
-    
+
+    IDs come from the CaseIdAllocator, which is safe to use from several
+    processes sharing the data directory.
+
     Returns:
-        int: The next available unique case ID.
+        str: The next available unique case ID, or None if no ID could be allocated.
     """
-    # Ensure data directory exists
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-    
-    # Initialize case IDs tracking structure
-    case_ids = {"next_id": "1", "used_ids": []}
-    
-    case_ids_file = os.path.join(DATA_DIR, "case_ids.json")
+    ids = reserve_case_ids(1)
+    return ids[0] if ids else None
 
-    # Load existing case IDs if available
-    if os.path.exists(case_ids_file):
-        try:
-            with open(case_ids_file, 'r', encoding='utf-8') as f:
-                case_ids = json.load(f)
-        except Exception as e:
-            print(f"Error loading case IDs file: {str(e)}. Starting with new tracking.")
-    
-    # Get the next available ID
-    next_id = case_ids["next_id"]
-    
-    # Update the tracking information
-    case_ids["next_id"] = str(int(next_id) + 1)
-    if next_id not in case_ids["used_ids"]:
-        case_ids["used_ids"].append(next_id)
-    
-    # Save the updated tracking information
+def reserve_case_ids(count):
+    """Reserves a block of consecutive unique case IDs, e.g. for a bulk import.
+    Args:
+        count (int): The number of IDs to reserve.
+    Returns:
+        list: The reserved IDs as strings, or an empty list if they could not be allocated.
+    """
     try:
-        with open(case_ids_file, 'w', encoding='utf-8') as f:
-            json.dump(case_ids, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        print(f"Error saving case IDs file: {str(e)}")
-    
-    return next_id
+        if _backend is not None:
+            first = _backend.allocate_case_ids(count)
+        else:
+            first = CaseIdAllocator(DATA_DIR).reserve(count)
+    except (LockTimeout, OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error allocating case IDs: {e}")
+        return []
+    return [str(case_id) for case_id in range(first, first + count)]
 
 def find_existing_case_folder(case_id):
+    """Finds the folder holding the case with the given ID.
+
+    Uses the case_id -> folder map kept alongside the case index, so the lookup
+    only stats that folder's case.json. If the mapped entry turns out to be stale,
+    or the ID is unknown and the index was not validated yet this session, the
+    data directory is rescanned once to refresh the index.
+    Args:
+        case_id (str): The case ID to look for.
+    Returns:
+        str or None: The case folder name, or None if no folder holds that ID.
+    """
     if not case_id:
         return None
-    existing_folders = get_all_case_folders()
-    for folder in existing_folders:
-        folder_data = load_case_data_from_json(folder)
-        if folder_data and folder_data.get("case_id") == case_id:
+    case_id = str(case_id)
+    if _backend is not None:
+        return _backend.find_case_folder(case_id)
+    if _get_layout() == LAYOUT_SHARDED:
+        # The folder follows from the ID; only cases not migrated yet are looked up in the index
+        folder = sharded_folder_name(case_id)
+        if os.path.exists(os.path.join(DATA_DIR, folder, "case.json")):
             return folder
+    _get_case_index()
+    folder = _case_id_folders.get(case_id)
+    if folder and _indexed_case_is_current(folder, case_id):
+        return folder
+    if _get_layout() == LAYOUT_SHARDED:
+        return None
+    if folder or not _case_index_validated:
+        get_case_summaries()
+        return _case_id_folders.get(case_id)
     return None
 
-def save_case_data_to_json(case_data):
-    """Saves the case data to a JSON file in the appropriate child's folder."""
+def save_case_data_to_json(case_data, expected_revision=None):
+    """Saves the case data to a JSON file in the appropriate child's folder.
+    Args:
+        case_data (dict): The case data.
+        expected_revision (int): For an edited case, the revision it had when it
+            was loaded (see check_revision); None to save without checking.
+    Returns:
+        tuple: (bool, str) indicating success and a message.
+    """
     if not isinstance(case_data, dict):
         return False, "تنسيق بيانات الحالة غير صالح."
 
@@ -94,62 +279,425 @@ def save_case_data_to_json(case_data):
     diagnosis = case_data.get("diagnosis", {}).get("value", "")
     case_id = case_data.get("case_id")
 
-    case_name = f"{case_id} - {child_name} - {dob}"
+    case_name = case_folder_name(_get_layout(), case_id, child_name, dob)
 
     if not child_name or not case_id or not diagnosis:
         return False, "يجب إدخال اسم الطفل والتشخيص لحفظ الحالة."
 
+    if _backend is not None:
+        return _save_case_to_backend(case_data, expected_revision)
+
     try:
         if not os.path.exists(DATA_DIR):
             os.makedirs(DATA_DIR)
-        
-        # If we have a case_id, try to find the existing folder
-        if case_id:
-            existing_case_folder_name = find_existing_case_folder(case_id)
+
+        with _case_lock(case_id):
+            # If we have a case_id, try to find the existing folder
+            if case_id:
+                existing_case_folder_name = find_existing_case_folder(case_id)
+                
+                # If we found the folder, we'll update the existing case
+                if existing_case_folder_name:
+                    print(f"Updating existing case with ID {case_id}")
+                else:
+                    print(f"Could not find folder for case ID {case_id}. A new folder will be created.")
+
+            stored_case_data = load_case_data_from_json(existing_case_folder_name) if existing_case_folder_name else None
+            conflict = check_revision(stored_case_data, case_data, expected_revision)
+            if conflict:
+                return False, conflict
+            case_data = dict(case_data)
+            case_data[REVISION_KEY] = revision_of(stored_case_data) + 1
             
-            # If we found the folder, we'll update the existing case
-            if existing_case_folder_name:
-                print(f"Updating existing case with ID {case_id}")
+            child_data_path = os.path.join(DATA_DIR, case_name)
+            if existing_case_folder_name and existing_case_folder_name != case_name:
+                # The child's name or date of birth changed (or the case is still in a folder of the
+                # other layout): move its folder with the surveys instead of starting a second one
+                previous_case_name = existing_case_folder_name
+                _get_journal().move(os.path.join(DATA_DIR, previous_case_name), child_data_path)
+                _get_journal().after_commit(lambda: _reindex_moved_case(previous_case_name, case_name))
             else:
-                print(f"Could not find folder for case ID {case_id}. A new folder will be created.")
-        
-        child_data_path = os.path.join(DATA_DIR, case_name)
-        if not os.path.exists(child_data_path):
-            os.makedirs(child_data_path)
-        
-        surveys_path = os.path.join(child_data_path, "surveys")
-        if not os.path.exists(surveys_path):
-            os.makedirs(surveys_path)
+                surveys_path = os.path.join(child_data_path, "surveys")
+                if not os.path.exists(surveys_path):
+                    os.makedirs(surveys_path)
+
+            case_file_path = os.path.join(child_data_path, "case.json")
+            _write_record(case_file_path, CASE_SCHEMA, case_data)
 
-        case_file_path = os.path.join(child_data_path, "case.json")
-        with open(case_file_path, 'w', encoding='utf-8') as f:
-            json.dump(case_data, f, ensure_ascii=False, indent=4)
+            _get_journal().after_commit(lambda: _index_saved_case(case_name, case_data, case_file_path))
         
         return True, f"تم حفظ بيانات الحالة بنجاح"
+    except LockTimeout:
+        return False, CASE_LOCKED_MESSAGE
     except Exception as e:
         return False, f"فشل حفظ بيانات الحالة\n{str(e)}"
 
+def _save_case_to_backend(case_data, expected_revision):
+    try:
+        success, message, summary, previous_folder = _backend.save_case(case_data, expected_revision)
+    except sqlite3.OperationalError as e:
+        print(f"Error saving case: {e}")
+        return False, CASE_LOCKED_MESSAGE
+    except Exception as e:
+        return False, f"فشل حفظ بيانات الحالة\n{str(e)}"
+    if success:
+        if previous_folder:
+            _notify_case_change_listeners(previous_folder, None)
+        _notify_case_change_listeners(summary.folder, summary)
+    return success, message
+
 def load_case_data_from_json(case_folder_name):
     """Loads case data from a JSON file within the specified child's folder."""
+    if _backend is not None:
+        return _backend.load_case(case_folder_name)
     case_file_path = os.path.join(DATA_DIR, case_folder_name, "case.json")
-    if not os.path.exists(case_file_path):
-        return None
     try:
-        with open(case_file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return _read_cached_record(case_file_path)
+    except FileNotFoundError:
+        return None
     except Exception as e:
         print(f"Error loading case data from {case_file_path}: {str(e)}")
         return None
 
 def get_all_case_folders():
     """Scans the data directory and returns a list of all valid case folder names."""
+    if _backend is not None:
+        return [summary.folder for summary in _backend.case_summaries()]
     if not os.path.exists(DATA_DIR):
         return []
-    return [d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d)) and os.path.exists(os.path.join(DATA_DIR, d, "case.json"))]
+    return [scan.folder for scan in scan_case_folders(DATA_DIR, read=False, folders=iter_case_folders(DATA_DIR, _get_layout()))]
+
+def case_exists(case_folder_name):
+    """Checks whether a case (identified by its folder name) is stored."""
+    if _backend is not None:
+        return _backend.load_case(case_folder_name) is not None
+    return os.path.exists(os.path.join(DATA_DIR, case_folder_name, "case.json"))
+
+def delete_case_folder(case_folder_name):
+    """Deletes a case folder with all its surveys and removes it from the case index.
+    Args:
+        case_folder_name (str): The folder name of the case.
+    Returns:
+        tuple: (bool, str) indicating success and a message.
+    """
+    if _backend is not None:
+        try:
+            success, message = _backend.delete_case(case_folder_name)
+        except sqlite3.Error as e:
+            return False, f"حدث خطأ أثناء محاولة حذف الحالة:\n{e}"
+        if success:
+            _notify_case_change_listeners(case_folder_name, None)
+        return success, message
+    case_path = os.path.join(DATA_DIR, case_folder_name)
+    if not os.path.exists(case_path):
+        return False, f"مجلد الحالة غير موجود: {case_folder_name}"
+    try:
+        with _case_lock(_case_id_of_folder(case_folder_name)):
+            _get_journal().delete(case_path)
+            _get_journal().after_commit(lambda: _unindex_deleted_case(case_folder_name))
+    except LockTimeout:
+        return False, CASE_LOCKED_MESSAGE
+    except OSError as e:
+        return False, f"حدث خطأ أثناء محاولة حذف الحالة:\n{e}"
+    return True, "تم حذف الحالة بنجاح."
+
+def _write_record(file_path, schema_name, record):
+    """Journals the write of a case or survey file, in the record format and compression of the data directory (see record_format)."""
+    registry = schema_registry(DATA_DIR)
+    data = registry.to_disk(schema_name, record)
+    _get_journal().write_json(file_path, data, indent=disk_indent(data), compression_ref=registry.compression_ref(schema_name, data))
+
+def _read_cached_record(file_path):
+    return _record_cache.get(file_path, lambda path: read_record(DATA_DIR, path))
+
+def get_record_cache_stats():
+    """Returns the RecordCacheStats (hits, misses, entries, capacity) of the parsed record cache."""
+    return _record_cache.stats()
+
+def _reindex_moved_case(previous_case_folder_name, case_folder_name):
+    """Moves the index entries of a renamed case folder to its new name."""
+    _record_cache.invalidate_folder(os.path.join(DATA_DIR, previous_case_folder_name))
+    if _drop_indexed_case(previous_case_folder_name):
+        _append_case_index_entries([{"op": "del", "folder": previous_case_folder_name}])
+    _notify_case_change_listeners(previous_case_folder_name, None)
+    survey_index = _get_survey_index()
+    survey_index.remove_case(previous_case_folder_name)
+    for survey_filename, survey_data in _read_survey_files(case_folder_name):
+        survey_index.put_survey(case_folder_name, survey_filename, survey_data)
+    _notify_survey_change_listeners(case_folder_name)
+
+def _read_survey_files(case_folder_name):
+    """Returns (filename, survey data) for every readable survey file of a case folder, as stored."""
+    surveys_dir_path = os.path.join(DATA_DIR, case_folder_name, "surveys")
+    if not os.path.isdir(surveys_dir_path):
+        return []
+    surveys = []
+    for survey_filename in os.listdir(surveys_dir_path):
+        if survey_filename.endswith(".json"):
+            survey_data = load_single_survey(case_folder_name, survey_filename)
+            if survey_data is not None:
+                surveys.append((survey_filename, survey_data))
+    return surveys
+
+def _unindex_deleted_case(case_folder_name):
+    """Removes a deleted case from the case and survey indexes."""
+    _record_cache.invalidate_folder(os.path.join(DATA_DIR, case_folder_name))
+    if _drop_indexed_case(case_folder_name):
+        _append_case_index_entries([{"op": "del", "folder": case_folder_name}])
+    _get_survey_index().remove_case(case_folder_name)
+    _notify_case_change_listeners(case_folder_name, None)
+
+# --- Locking ---
+# Writers of a case hold its lock file while writing; readers never lock, since
+# every file is replaced atomically and always holds a complete version.
+
+def _case_lock(case_id):
+    return case_lock(DATA_DIR, case_id)
+
+def _case_id_of_folder(case_folder_name):
+    """Returns the case ID of a case folder, from the case index or the folder name."""
+    summary = _get_case_index().get(case_folder_name)
+    if summary is not None and summary.case_id:
+        return str(summary.case_id)
+    return case_id_of_folder(case_folder_name)
+
+# --- Case Index ---
+
+def _case_index_path():
+    return os.path.join(DATA_DIR, CASE_INDEX_FILENAME)
+
+def _get_case_index():
+    """Returns the in-memory case index, loading it from disk on first use.
+
+    The index file starts with a header line holding CASE_INDEX_VERSION, followed by
+    one "put" or "del" entry per line; later lines supersede earlier ones. A header
+    with another version discards the file so that it is rebuilt from the case folders.
+    """
+    if _case_index is not None:
+        return _case_index
+    with _case_index_lock:
+        if _case_index is None:
+            _load_case_index()
+    return _case_index
+
+def _load_case_index():
+    global _case_index, _case_index_lines, _case_id_folders
+    index = {}
+    lines = 0
+    index_path = _case_index_path()
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                header = f.readline()
+                try:
+                    version = json.loads(header).get("version")
+                except (ValueError, AttributeError):
+                    version = None
+                if version == CASE_INDEX_VERSION:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # A torn line left by an interrupted append
+                        lines += 1
+                        folder = entry.get("folder")
+                        if entry.get("op") == "del":
+                            index.pop(folder, None)
+                        else:
+                            index[folder] = CaseSummary(**{field: entry.get(field) for field in CaseSummary._fields})
+        except OSError as e:
+            print(f"Error loading case index {index_path}: {e}")
+
+    _case_index_lines = lines
+    _case_id_folders = {str(summary.case_id): folder for folder, summary in index.items() if summary.case_id}
+    _case_index = index
+
+def _put_indexed_case(summary):
+    """Stores a summary in the in-memory index and the case_id map."""
+    index = _get_case_index()
+    with _case_index_lock:
+        previous = index.get(summary.folder)
+        if previous is not None and previous.case_id and _case_id_folders.get(str(previous.case_id)) == summary.folder:
+            del _case_id_folders[str(previous.case_id)]
+        index[summary.folder] = summary
+        if summary.case_id:
+            _case_id_folders[str(summary.case_id)] = summary.folder
+
+def _drop_indexed_case(case_folder_name):
+    """Removes a folder from the in-memory index and the case_id map. Returns True if it was indexed."""
+    index = _get_case_index()
+    with _case_index_lock:
+        summary = index.pop(case_folder_name, None)
+        if summary is None:
+            return False
+        if summary.case_id and _case_id_folders.get(str(summary.case_id)) == case_folder_name:
+            del _case_id_folders[str(summary.case_id)]
+    return True
+
+def _indexed_case_is_current(case_folder_name, case_id):
+    """Checks that an indexed folder still holds the given case, parsing case.json only if it changed."""
+    case_file_path = os.path.join(DATA_DIR, case_folder_name, "case.json")
+    try:
+        st = os.stat(case_file_path)
+    except OSError:
+        return False
+    summary = _case_index.get(case_folder_name)
+    if summary is not None and summary.mtime == st.st_mtime_ns and summary.size == st.st_size:
+        return True
+    case_data = load_case_data_from_json(case_folder_name)
+    return bool(case_data) and str(case_data.get("case_id")) == case_id
+
+def _append_case_index_entries(entries):
+    """Appends entries to the index file, compacting it once it holds too many superseded lines.
+
+    Updates from all processes are serialized by the index lock. Entries another
+    process appended are lost when this process compacts the file, which only
+    costs a re-parse of those cases on the next get_case_summaries().
+    """
+    global _case_index_lines
+    index_path = _case_index_path()
+    try:
+        with _case_index_lock, global_lock(DATA_DIR, INDEX_LOCK):
+            if not os.path.exists(index_path) or _case_index_lines + len(entries) > 2 * len(_case_index) + 100:
+                _rewrite_case_index()
+                return
+            with open(index_path, 'a', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            _case_index_lines += len(entries)
+    except (LockTimeout, OSError) as e:
+        print(f"Error updating case index {index_path}: {e}")
+
+def _rewrite_case_index():
+    """Writes the whole in-memory index to a fresh index file. Called with the index lock held."""
+    global _case_index_lines
+    index_path = _case_index_path()
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"version": CASE_INDEX_VERSION}) + "\n")
+            for summary in _case_index.values():
+                f.write(json.dumps(dict(op="put", **summary._asdict()), ensure_ascii=False) + "\n")
+        os.replace(temp_path, index_path)
+        _case_index_lines = len(_case_index)
+    except OSError as e:
+        print(f"Error writing case index {index_path}: {e}")
+
+def _index_saved_case(case_folder_name, case_data, case_file_path):
+    """Records a freshly saved case.json in the case index."""
+    _record_cache.invalidate(case_file_path)
+    try:
+        st = os.stat(case_file_path)
+    except OSError:
+        return
+    summary = summary_from_case_data(case_folder_name, case_data, st.st_mtime_ns, st.st_size)
+    _put_indexed_case(summary)
+    _append_case_index_entries([dict(op="put", **summary._asdict())])
+    _notify_case_change_listeners(case_folder_name, summary)
+
+def add_case_change_listener(listener):
+    """Registers a callable that is notified after a case is saved or deleted.
+
+    The listener is called as listener(case_folder_name, summary), where summary
+    is the new CaseSummary of a saved case, or None if the case was deleted.
+    Changes picked up while rescanning the data directory are not reported.
+    """
+    if listener not in _case_change_listeners:
+        _case_change_listeners.append(listener)
+
+def remove_case_change_listener(listener):
+    if listener in _case_change_listeners:
+        _case_change_listeners.remove(listener)
+
+def _notify_case_change_listeners(case_folder_name, summary):
+    for listener in list(_case_change_listeners):
+        try:
+            listener(case_folder_name, summary)
+        except Exception as e:
+            print(f"Error in case change listener: {e}")
+
+def get_case_summaries():
+    """Returns a CaseSummary for every case folder in the data directory.
+
+    Summaries come from the persistent case index. The data directory is scanned
+    once and each case.json is only stat'ed and checked against the mtime and size
+    recorded in the index; it is parsed again only when it changed (or is new), so
+    listing N unchanged cases reads a single file. Folders that no longer exist are
+    dropped from the index.
+
+    Returns:
+        list: CaseSummary tuples, one per case folder. Cases whose case.json could
+              not be parsed are included with valid=False.
+    """
+    return [summary for batch in iter_case_summaries() for summary in batch]
+
+def iter_case_summaries(batch_size=CASE_SUMMARY_BATCH_SIZE):
+    """Yields the summaries get_case_summaries() returns in lists of up to batch_size, as the scan proceeds.
+
+    Safe to run on a worker thread, e.g. to show the first cases while the rest
+    are being read. Folders that no longer exist are only dropped from the index
+    once the whole directory was scanned, so stopping early loses nothing.
+    """
+    global _case_index_validated
+    if _backend is not None:
+        summaries = _backend.case_summaries()
+        for start in range(0, len(summaries), batch_size):
+            yield summaries[start:start + batch_size]
+        return
+    if not DATA_DIR or not os.path.exists(DATA_DIR):
+        return
+
+    index = _get_case_index()
+
+    def needs_parse(folder, mtime, size):
+        summary = index.get(folder)
+        return summary is None or summary.mtime != mtime or summary.size != size
+
+    seen = set()
+    folders = iter_case_folders(DATA_DIR, _get_layout())
+    while True:
+        chunk = list(islice(folders, batch_size))
+        if not chunk:
+            break
+        summaries = []
+        changes = []
+        for scan in scan_case_folders(DATA_DIR, read=needs_parse, folders=chunk):
+            seen.add(scan.folder)
+            summary = index.get(scan.folder)
+            if summary is None or summary.mtime != scan.mtime or summary.size != scan.size:
+                case_data = scan.data if scan.status == SCAN_OK else None
+                summary = summary_from_case_data(scan.folder, case_data, scan.mtime, scan.size)
+                _put_indexed_case(summary)
+                changes.append(dict(op="put", **summary._asdict()))
+            summaries.append(summary)
+        if changes:
+            _append_case_index_entries(changes)
+        if summaries:
+            yield summaries
+
+    with _case_index_lock:
+        gone = [folder for folder in index if folder not in seen]
+    changes = [{"op": "del", "folder": folder} for folder in gone if _drop_indexed_case(folder)]
+    if changes:
+        _append_case_index_entries(changes)
+    _case_index_validated = True
 
 # --- Survey File Management ---
 
-def save_survey_data_to_json(case_folder_name, survey_data):
+def save_survey_data_to_json(case_folder_name, survey_data, expected_revision=None, survey_filename=None):
+    """Saves a survey of a case: a new assessment, or changes to an existing one.
+
+    A new assessment is kept alongside the earlier ones of its type, stored as a
+    delta against the latest of them (see survey_history).
+    Args:
+        case_folder_name (str): The folder name of the case.
+        survey_data (dict): The survey data, including "survey_type".
+        expected_revision (int): For an edited survey, the revision it had when it
+            was loaded (see check_revision); None to save without checking.
+        survey_filename (str): The filename of the edited survey, or None for a new assessment.
+    Returns:
+        tuple: (bool, str) with the survey filename on success, or an error message.
+    """
     if not isinstance(survey_data, dict):
         return False, "Invalid survey data format (must be a dictionary)."
 
@@ -157,24 +705,137 @@ def save_survey_data_to_json(case_folder_name, survey_data):
     if not survey_type_str:
         return False, "Survey Type is required to save the survey."
 
+    if survey_filename is None:
+        survey_filename = new_survey_filename(survey_type_str)
+        new_assessment = True
+    else:
+        new_assessment = False
+
+    if _backend is not None:
+        try:
+            success, message = _backend.save_survey(case_folder_name, survey_filename, survey_data, expected_revision)
+        except sqlite3.OperationalError as e:
+            print(f"Error saving survey: {e}")
+            return False, CASE_LOCKED_MESSAGE
+        except Exception as e:
+            print(str(e))
+            return False, str(e)
+        if success:
+            _notify_survey_change_listeners(case_folder_name)
+        return success, message
+
     try:
         surveys_dir_path = os.path.join(DATA_DIR, case_folder_name, "surveys")
         if not os.path.exists(surveys_dir_path):
             os.makedirs(surveys_dir_path) 
 
-        survey_filename = survey_type_str + ".json"
         survey_file_path = os.path.join(surveys_dir_path, survey_filename)
+        # Inside a bulk batch the files do not show the changes recorded so far,
+        # so the surveys saved there are stored whole
+        use_deltas = not _get_journal().in_batch()
 
-        with open(survey_file_path, 'w', encoding='utf-8') as f:
-            json.dump(survey_data, f, ensure_ascii=False, indent=4)
+        with _case_lock(_case_id_of_folder(case_folder_name)):
+            if new_assessment:
+                stored_survey_data = None
+                history = load_survey_history(case_folder_name, survey_type_str)
+                base_filename = history[-1].filename if history else None
+            else:
+                stored_survey_data = load_single_survey(case_folder_name, survey_filename) if os.path.exists(survey_file_path) else None
+                base_filename = (_read_stored_survey(case_folder_name, survey_filename) or {}).get(BASE_KEY)
+            conflict = check_revision(stored_survey_data, survey_data, expected_revision)
+            if conflict:
+                print(conflict)
+                return False, conflict
+            survey_data = dict(survey_data)
+            survey_data[REVISION_KEY] = revision_of(stored_survey_data) + 1
+            with _get_journal().batch():
+                _write_survey(case_folder_name, survey_filename, survey_data, base_filename if use_deltas else None)
+                rebased = []
+                if stored_survey_data is not None:
+                    rebased = _rebase_dependents(case_folder_name, survey_filename, stored_survey_data, survey_filename, survey_data)
+                _get_journal().after_commit(lambda: _index_saved_survey(case_folder_name, survey_filename, survey_data, rebased))
         
         print(f"Survey data saved successfully to: {survey_file_path}")
         return True, survey_filename
+    except LockTimeout:
+        print(CASE_LOCKED_MESSAGE)
+        return False, CASE_LOCKED_MESSAGE
     except Exception as e:
         error_msg = str(e)
         print(error_msg)
         return False, error_msg
 
+def _index_saved_survey(case_folder_name, survey_filename, survey_data, rebased=()):
+    """Records a freshly saved survey in the survey index and the case's survey manifest."""
+    _record_cache.invalidate(os.path.join(DATA_DIR, case_folder_name, "surveys", survey_filename))
+    put_survey_header(DATA_DIR, case_folder_name, survey_filename, survey_data)
+    _get_survey_index().put_survey(case_folder_name, survey_filename, survey_data)
+    _index_rebased_surveys(case_folder_name, rebased)
+    _notify_survey_change_listeners(case_folder_name)
+
+def _index_rebased_surveys(case_folder_name, rebased):
+    """Updates the manifest for surveys rewritten by _rebase_dependents; their contents, and so the survey index, are unchanged."""
+    for survey_filename, survey_data in rebased:
+        _record_cache.invalidate(os.path.join(DATA_DIR, case_folder_name, "surveys", survey_filename))
+        put_survey_header(DATA_DIR, case_folder_name, survey_filename, survey_data)
+
+# --- Survey History ---
+# New assessments are stored as deltas against an earlier assessment of their
+# type (see survey_history). Changing or deleting a survey rewrites the surveys
+# stored against it, so that their contents stay the same.
+
+def _read_stored_survey(case_folder_name, survey_filename):
+    """Returns a survey file as stored (possibly a delta), or None if it does not exist. Raises OSError or ValueError."""
+    try:
+        return _read_cached_record(os.path.join(DATA_DIR, case_folder_name, "surveys", survey_filename))
+    except FileNotFoundError:
+        return None
+
+def _write_survey(case_folder_name, survey_filename, survey_data, base_filename):
+    """Journals the write of a survey, as a delta against base_filename if there is one and the chain is not too long."""
+    try:
+        stored = stored_survey(survey_data, base_filename,
+                               lambda name: _read_stored_survey(case_folder_name, name))
+    except (OSError, ValueError) as e:
+        print(f"Storing survey {survey_filename} whole: {e}")
+        stored = survey_data
+    _write_record(os.path.join(DATA_DIR, case_folder_name, "surveys", survey_filename),
+                  survey_schema(survey_data.get("survey_type")), stored)
+
+def _rebase_dependents(case_folder_name, survey_filename, old_survey_data, new_base_filename, new_base_data):
+    """Rewrites the surveys stored as deltas against survey_filename, which is being changed or deleted.
+    Args:
+        case_folder_name (str): The folder name of the case.
+        survey_filename (str): The survey being changed or deleted.
+        old_survey_data (dict): Its contents before the change, resolved.
+        new_base_filename (str): What the dependent surveys are stored against from now
+            on: survey_filename itself when it is changed, its own base (or None to
+            store them whole) when it is deleted.
+        new_base_data (dict): The contents of new_base_filename after the change, resolved.
+    Returns:
+        list: (filename, survey data) of the rewritten surveys.
+    """
+    surveys_dir_path = os.path.join(DATA_DIR, case_folder_name, "surveys")
+    rebased = []
+    for dependent_filename in os.listdir(surveys_dir_path):
+        if not dependent_filename.endswith(".json") or dependent_filename == survey_filename:
+            continue
+        try:
+            stored = _read_stored_survey(case_folder_name, dependent_filename)
+        except (OSError, ValueError) as e:
+            print(f"Error reading survey {dependent_filename}: {e}")
+            continue
+        if not stored or stored.get(BASE_KEY) != survey_filename:
+            continue
+        dependent_data = apply_delta(stored, old_survey_data)
+        if new_base_filename is None:
+            stored = dependent_data
+        else:
+            stored = make_delta(dependent_data, new_base_filename, new_base_data)
+        _write_record(os.path.join(surveys_dir_path, dependent_filename), survey_schema(dependent_data.get("survey_type")), stored)
+        rebased.append((dependent_filename, dependent_data))
+    return rebased
+
 def load_surveys_for_case(case_folder_name):
     """Loads all survey JSON files for a given case folder and sorts them by survey date.
     Args:
@@ -184,6 +845,8 @@ def load_surveys_for_case(case_folder_name):
               sorted from the oldest to the most recent survey date.
               Returns an empty list on error or if no surveys are found.
     """
+    if _backend is not None:
+        return _backend.load_surveys(case_folder_name)
     surveys_dir_path = os.path.join(DATA_DIR, case_folder_name, "surveys")
     loaded_surveys = []
 
@@ -193,18 +856,10 @@ def load_surveys_for_case(case_folder_name):
     # First, load all survey files from the directory
     for filename in os.listdir(surveys_dir_path):
         if filename.endswith(".json"):
-            file_path = os.path.join(surveys_dir_path, filename)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    survey_content = json.load(f)
-                    # Add filename to the content for reference
-                    survey_content['_filename'] = filename.replace(".json", "")
-                    # Ensure survey_date exists for sorting, default to a very old date if missing
-                    if "survey_date" not in survey_content:
-                        survey_content["survey_date"] = "1900-01-01" # Default for sorting purposes
-                    loaded_surveys.append(survey_content)
-            except Exception as e:
-                print(f"Error loading survey file {file_path}: {str(e)}")
+            # Adds the filename for reference, and a default survey_date for sorting
+            survey_content = load_survey_by_handle(SurveyHandle(case_folder_name, filename))
+            if survey_content is not None:
+                loaded_surveys.append(survey_content)
 
     # After loading, sort the list of surveys based on the 'survey_date' key
     # The key=lambda item: item.get("survey_date") ensures it sorts by the date string.
@@ -213,6 +868,46 @@ def load_surveys_for_case(case_folder_name):
 
     return loaded_surveys
 
+def load_survey_headers(case_folder_name):
+    """Lists the surveys of a case without loading them, e.g. for the survey list of the case viewer.
+    Args:
+        case_folder_name (str): The folder name of the case.
+    Returns:
+        list: SurveyHeader tuples (filename, survey_type, survey_date,
+              submission_timestamp, size, mtime) sorted by survey date; the
+              survey itself is loaded with load_single_survey(case_folder_name, filename).
+    """
+    if _backend is not None:
+        return _backend.survey_headers(case_folder_name)
+    return survey_headers(DATA_DIR, case_folder_name, lambda survey_filename: load_single_survey(case_folder_name, survey_filename))
+
+def load_survey_history(case_folder_name, survey_type):
+    """Lists the assessments of one survey type of a case, without loading them.
+    Args:
+        case_folder_name (str): The folder name of the case.
+        survey_type (str): The survey type.
+    Returns:
+        list: SurveyHeader tuples, from the earliest to the latest survey date (and
+              time of submission, for assessments on the same day).
+    """
+    history = [header for header in load_survey_headers(case_folder_name) if header.survey_type == survey_type]
+    history.sort(key=lambda header: (header.survey_date, header.submission_timestamp))
+    return history
+
+def load_survey_by_handle(handle):
+    """Loads the survey a SurveyHandle refers to, as the survey viewer and the PDF export expect it.
+    Args:
+        handle (SurveyHandle): The case folder and filename of the survey.
+    Returns:
+        dict or None: The survey with its "_filename" (without ".json"), or None if it could not be loaded.
+    """
+    survey_data = load_single_survey(handle.case_folder, handle.filename)
+    if survey_data is None:
+        return None
+    survey_data["_filename"] = handle.filename[:-len(".json")]
+    survey_data.setdefault("survey_date", MISSING_SURVEY_DATE)
+    return survey_data
+
 def load_single_survey(case_folder_name, survey_filename):
     """Loads a single survey JSON file.
     Args:
@@ -221,16 +916,17 @@ def load_single_survey(case_folder_name, survey_filename):
     Returns:
         dict or None: Loaded survey data or None if error.
     """
+    if _backend is not None:
+        return _backend.load_survey(case_folder_name, survey_filename)
     survey_file_path = os.path.join(DATA_DIR, case_folder_name, "surveys", survey_filename)
-    if not os.path.exists(survey_file_path):
-        print(f"Survey file not found: {survey_file_path}")
-        return None
     try:
-        with open(survey_file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        survey_data = resolve_survey(survey_filename, lambda name: _read_stored_survey(case_folder_name, name))
     except Exception as e:
         print(f"Error loading survey {survey_file_path}: {e}")
         return None
+    if survey_data is None:
+        print(f"Survey file not found: {survey_file_path}")
+    return survey_data
 
 
 def delete_survey_file(case_folder_name, survey_filename_with_ext):
@@ -244,20 +940,129 @@ def delete_survey_file(case_folder_name, survey_filename_with_ext):
     if not survey_filename_with_ext.endswith('.json'):
         survey_filename_with_ext += '.json'
 
+    if _backend is not None:
+        try:
+            success, message = _backend.delete_survey(case_folder_name, survey_filename_with_ext)
+        except sqlite3.Error as e:
+            return False, f"حدث خطأ أثناء حذف الملف: {e}"
+        if success:
+            _notify_survey_change_listeners(case_folder_name)
+        return success, message
+
     survey_file_path = os.path.join(DATA_DIR, case_folder_name, "surveys", survey_filename_with_ext)
 
     if not os.path.exists(survey_file_path):
         return False, f"الملف المحدد غير موجود: {survey_filename_with_ext}"
     
     try:
-        os.remove(survey_file_path)
+        with _case_lock(_case_id_of_folder(case_folder_name)):
+            survey_data = load_single_survey(case_folder_name, survey_filename_with_ext)
+            with _get_journal().batch():
+                rebased = []
+                if survey_data is not None:
+                    # The surveys stored against this one are stored against its own base instead
+                    base_filename = (_read_stored_survey(case_folder_name, survey_filename_with_ext) or {}).get(BASE_KEY)
+                    base_data = load_single_survey(case_folder_name, base_filename) if base_filename else None
+                    rebased = _rebase_dependents(case_folder_name, survey_filename_with_ext, survey_data,
+                                                 base_filename if base_data is not None else None, base_data)
+                _get_journal().delete(survey_file_path)
+                _get_journal().after_commit(lambda: _unindex_deleted_survey(case_folder_name, survey_filename_with_ext, rebased))
         print(f"Successfully deleted survey: {survey_file_path}")
         return True, "تم حذف الاستبيان بنجاح."
+    except LockTimeout:
+        return False, CASE_LOCKED_MESSAGE
     except OSError as e:
         error_msg = f"حدث خطأ أثناء حذف الملف: {e}"
         print(error_msg)
         return False, error_msg
 
+def _unindex_deleted_survey(case_folder_name, survey_filename, rebased=()):
+    """Removes a deleted survey from the survey index and the case's survey manifest."""
+    _record_cache.invalidate(os.path.join(DATA_DIR, case_folder_name, "surveys", survey_filename))
+    remove_survey_header(DATA_DIR, case_folder_name, survey_filename)
+    _get_survey_index().remove_survey(case_folder_name, survey_filename)
+    _index_rebased_surveys(case_folder_name, rebased)
+    _notify_survey_change_listeners(case_folder_name)
+
+# --- Survey Search ---
+
+def _get_survey_index():
+    """Returns the survey index, building it from all survey files if there is no usable index file."""
+    global _survey_index
+    if _survey_index is not None:
+        return _survey_index
+    with _survey_index_lock:
+        if _survey_index is None:
+            survey_index = SurveyIndex(DATA_DIR, lock=global_lock(DATA_DIR, INDEX_LOCK))
+            if not survey_index.loaded:
+                for case_folder_name in get_all_case_folders():
+                    for survey in load_surveys_for_case(case_folder_name):
+                        survey_index.put_survey(case_folder_name, survey["_filename"] + ".json", survey, persist=False)
+                survey_index.save()
+            _survey_index = survey_index
+    return _survey_index
+
+def load_survey_index():
+    """Loads the survey index ahead of its first use, building it from the survey files if needed.
+
+    Building it reads every survey, so the case list loader does this on its
+    worker thread instead of leaving it to the first search or save.
+    """
+    if _backend is None:
+        _get_survey_index()
+
+def get_survey_search_fields():
+    """Returns the searchable survey fields as {survey_type: {field_key: ar_key}}."""
+    if _backend is not None:
+        return _backend.survey_search_fields()
+    survey_index = _get_survey_index()
+    return {survey_type: survey_index.field_labels(survey_type) for survey_type in survey_index.survey_types()}
+
+def get_case_survey_types():
+    """Returns {case folder name: set of survey types saved for the case}, for cases with surveys."""
+    if _backend is not None:
+        return _backend.case_survey_types()
+    return _get_survey_index().case_survey_types()
+
+def add_survey_change_listener(listener):
+    """Registers a callable that is notified after a survey is saved or deleted.
+
+    The listener is called as listener(case_folder_name, survey_types), where
+    survey_types is the set of survey types the case has after the change.
+    Surveys removed together with their case are not reported.
+    """
+    if listener not in _survey_change_listeners:
+        _survey_change_listeners.append(listener)
+
+def remove_survey_change_listener(listener):
+    if listener in _survey_change_listeners:
+        _survey_change_listeners.remove(listener)
+
+def _notify_survey_change_listeners(case_folder_name):
+    if _backend is not None:
+        survey_types = _backend.survey_types_of(case_folder_name)
+    else:
+        survey_types = _get_survey_index().case_survey_types().get(case_folder_name, set())
+    for listener in list(_survey_change_listeners):
+        try:
+            listener(case_folder_name, survey_types)
+        except Exception as e:
+            print(f"Error in survey change listener: {e}")
+
+def search_surveys(text, survey_type=None, field_key=None):
+    """Searches the values of all saved surveys.
+    Args:
+        text (str): The text to look for.
+        survey_type (str): Restrict the search to one survey type, or None for all.
+        field_key (str): Restrict the search to one field, or None for all fields.
+    Returns:
+        list: (case folder name, survey filename, survey_type, survey_date, field_key)
+              tuples, one per matching field.
+    """
+    if _backend is not None:
+        return _backend.search_surveys(text, survey_type, field_key)
+    return _get_survey_index().search(text, survey_type, field_key)
+
 
 # Register fonts for Arabic support
 def register_fonts():
@@ -0,0 +1,186 @@
+import heapq
+
+from .search_index import normalize_arabic
+
+# Number of ranked cases returned by a fuzzy name search
+DEFAULT_FUZZY_LIMIT = 50
+
+
+def edit_distance(a, b, max_distance=None):
+    """Returns the Levenshtein distance between two strings.
+
+    With max_distance, the computation stops early and returns max_distance + 1
+    as soon as the distance is known to exceed it.
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,                      # deletion
+                current[j - 1] + 1,                   # insertion
+                previous[j - 1] + (char_a != char_b)  # substitution
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def allowed_typos(word):
+    """Returns how many edits a query word of this length may be away from a match."""
+    if len(word) <= 2:
+        return 0
+    if len(word) <= 5:
+        return 1
+    return 2
+
+
+class BKTree:
+    """Burkhard-Keller tree over words, using the edit distance as the metric.
+
+    A search for words within distance d of a query only descends into children
+    whose edge distance lies in [dist - d, dist + d] (triangle inequality), so it
+    visits a small part of the tree instead of measuring every word.
+    """
+    def __init__(self):
+        self._root = None  # [word, {distance: child node}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, word):
+        if self._root is None:
+            self._root = [word, {}]
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = edit_distance(word, node[0])
+            if distance == 0:
+                return  # Already in the tree
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                self._size += 1
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """Returns (distance, word) pairs for all words within max_distance of the given word."""
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node_word, children = stack.pop()
+            distance = edit_distance(word, node_word)
+            if distance <= max_distance:
+                matches.append((distance, node_word))
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for edge, child in children.items() if low <= edge <= high)
+        return matches
+
+
+class FuzzyNameIndex:
+    """Ranked, typo-tolerant search over children's names, keyed by case folder name.
+
+    Names are normalized and split into words; the distinct words go into a
+    BK-tree. Every word of a query must match some word of a name within
+    allowed_typos(); cases are ranked by the sum of the best distances. Edit
+    distances are only measured between the query and distinct words, and only
+    the best-ranked cases are sorted.
+    """
+    def __init__(self, summaries=()):
+        self._tree = BKTree()
+        self._folders_by_word = {}  # {word: set of folder names}
+        self._words_by_folder = {}  # {folder name: tuple of words}
+        for summary in summaries:
+            self.add(summary)
+
+    def add(self, summary):
+        """Indexes (or re-indexes) the child's name of a case summary."""
+        self.remove(summary.folder)
+        words = tuple(set(normalize_arabic(summary.child_name).split()))
+        self._words_by_folder[summary.folder] = words
+        for word in words:
+            folders = self._folders_by_word.get(word)
+            if folders is None:
+                folders = self._folders_by_word[word] = set()
+                self._tree.add(word)
+            folders.add(summary.folder)
+
+    def merge(self, other):
+        """Adds the names of another FuzzyNameIndex, replacing those of the same
+        folders; only words new to this index go into the BK-tree. other must not be used afterwards."""
+        for folder in other._words_by_folder:
+            self.remove(folder)
+        self._words_by_folder.update(other._words_by_folder)
+        for word, folders in other._folders_by_word.items():
+            indexed = self._folders_by_word.get(word)
+            if indexed is None:
+                self._folders_by_word[word] = folders
+                self._tree.add(word)
+            else:
+                indexed |= folders
+
+    def remove(self, case_folder_name):
+        # Words stay in the BK-tree; their empty folder sets simply match nothing.
+        for word in self._words_by_folder.pop(case_folder_name, ()):
+            self._folders_by_word[word].discard(case_folder_name)
+
+    def search(self, query, limit=DEFAULT_FUZZY_LIMIT, within=None):
+        """Returns up to limit case folder names, best match first (ties by folder name).
+        Args:
+            query (str): The possibly misspelled name.
+            limit (int): The maximum number of folders returned.
+            within (set): Only rank these folders, e.g. the cases matching the
+                other filters, so that the limit applies to the filtered cases.
+        """
+        query_words = normalize_arabic(query).split()
+        if not query_words:
+            return []
+        folders_by_word = self._folders_by_word
+        word_distances = []  # Per query word: {indexed word: distance}
+        for query_word in query_words:
+            distances = {word: distance for distance, word in self._tree.search(query_word, allowed_typos(query_word))
+                         if folders_by_word.get(word)}
+            if not distances:
+                return []
+            word_distances.append(distances)
+
+        # Per query word, the cases grouped by the distance of their closest word
+        levels = []
+        for distances in word_distances:
+            level, seen = {}, set()
+            for distance in sorted(set(distances.values())):
+                folders = set().union(*(folders_by_word[word] for word, d in distances.items() if d == distance))
+                folders -= seen
+                seen |= folders
+                level[distance] = folders
+            levels.append(level)
+        # Intersected query word by query word; a case is reached by one combination of distances only
+        by_score = {0: within} if within is not None else levels.pop(0)
+        for level in levels:
+            combined = {}
+            for score, folders in by_score.items():
+                for distance, level_folders in level.items():
+                    matched = folders & level_folders
+                    if matched:
+                        combined.setdefault(score + distance, set()).update(matched)
+            by_score = combined
+
+        ranked = []
+        for score in sorted(by_score):
+            ranked.extend(heapq.nsmallest(limit - len(ranked), by_score[score]))
+            if len(ranked) >= limit:
+                break
+        return ranked
@@ -0,0 +1,132 @@
+import json
+import os
+from bisect import bisect_left
+
+from .atomic_io import write_json_atomic
+from .case_layout import iter_case_folders, case_id_of_folder, LAYOUT_SHARDED
+from .locks import global_lock, ALLOCATOR_LOCK
+
+CASE_IDS_FILENAME = "case_ids.json"
+CASE_IDS_VERSION = 2
+
+
+def compress_ids(ids):
+    """Turns integer IDs into a sorted list of [first, last] ranges of consecutive IDs."""
+    ranges = []
+    for case_id in sorted(set(ids)):
+        if ranges and case_id == ranges[-1][1] + 1:
+            ranges[-1][1] = case_id
+        else:
+            ranges.append([case_id, case_id])
+    return ranges
+
+
+def add_id_range(ranges, first, last):
+    """Adds the IDs first..last to sorted, non-overlapping ranges, merging neighbours."""
+    position = bisect_left(ranges, [first, first])
+    if position > 0 and ranges[position - 1][1] >= first - 1:
+        position -= 1
+        first = ranges[position][0]
+    end = position
+    while end < len(ranges) and ranges[end][0] <= last + 1:
+        last = max(last, ranges[end][1])
+        end += 1
+    ranges[position:end] = [[first, last]]
+
+
+class CaseIdAllocator:
+    """Hands out unique case IDs from case_ids.json in the data directory.
+
+    The file stores the high-water mark (next_id) and the used IDs as ranges, so
+    it stays a few bytes long no matter how many cases exist, and allocating an
+    ID does not depend on their number. Every allocation reads and writes the
+    file under a lock file, so processes sharing the data directory never get
+    the same ID. Files in the old format ({"next_id": ..., "used_ids": [...]})
+    are converted on the first allocation. A file that cannot be parsed is
+    rebuilt from the IDs of the case folders, so no ID in use is handed out again.
+    """
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, CASE_IDS_FILENAME)
+        self.data_dir = data_dir
+        self.lock = global_lock(data_dir, ALLOCATOR_LOCK)
+
+    def _load(self):
+        """Returns (next_id, used_ranges) from the file.
+        Raises:
+            OSError: If the file exists but cannot be read.
+            ValueError: If the file is corrupt and the case folders cannot be listed.
+        """
+        if not os.path.exists(self.path):
+            return 1, []
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        try:
+            return self._parse(json.loads(content.decode('utf-8')))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Error loading case IDs file: {str(e)}. Rebuilding it from the case folders.")
+            return self._rebuild()
+
+    @staticmethod
+    def _parse(case_ids):
+        if case_ids.get("version") == CASE_IDS_VERSION:
+            used_ranges = [[int(first), int(last)] for first, last in case_ids.get("used_ranges", [])]
+            return int(case_ids["next_id"]), used_ranges
+
+        # Old format: "next_id" and every used ID as strings
+        used_ids = [int(case_id) for case_id in case_ids.get("used_ids", []) if str(case_id).isdigit()]
+        next_id = int(case_ids.get("next_id", 1))
+        if used_ids:
+            next_id = max(next_id, max(used_ids) + 1)
+        return next_id, compress_ids(used_ids)
+
+    def _rebuild(self):
+        """Returns (next_id, used_ranges) for the IDs of the case folders in the data directory."""
+        try:
+            # Listing as sharded also yields the flat folders, whatever layout.json says
+            folders = iter_case_folders(self.data_dir, LAYOUT_SHARDED)
+            used_ids = [int(case_id) for case_id in map(case_id_of_folder, folders) if case_id.isdigit()]
+        except OSError as e:
+            raise ValueError(f"{self.path} is corrupt and the case folders could not be listed: {e}") from e
+        return max(used_ids, default=0) + 1, compress_ids(used_ids)
+
+    def _save(self, next_id, used_ranges):
+        write_json_atomic(self.data_dir, self.path, {
+            "version": CASE_IDS_VERSION,
+            "next_id": next_id,
+            "used_ranges": used_ranges,
+        }, indent=None)
+
+    def peek(self):
+        """Returns the ID the next reservation starts looking from, without reserving it."""
+        return self._load()[0]
+
+    def merge(self, used_ranges, next_id):
+        """Marks the IDs in used_ranges as used and raises the high-water mark to at least next_id,
+        e.g. after cases were imported from another store."""
+        with self.lock:
+            current_next_id, current_ranges = self._load()
+            for first, last in used_ranges:
+                add_id_range(current_ranges, first, last)
+            self._save(max(current_next_id, next_id), current_ranges)
+
+    def reserve(self, count=1):
+        """Reserves a block of count consecutive unused IDs.
+        Returns:
+            int: The first ID of the block.
+        Raises:
+            LockTimeout: If another process holds the allocator lock for too long.
+        """
+        with self.lock:
+            next_id, used_ranges = self._load()
+            first = next_id
+            # IDs above the high-water mark can only be used in files converted from the old format
+            start = max(0, bisect_left(used_ranges, [first, first]) - 1)
+            for used_first, used_last in used_ranges[start:]:
+                if used_last < first:
+                    continue
+                if used_first > first + count - 1:
+                    break
+                first = used_last + 1
+            add_id_range(used_ranges, first, first + count - 1)
+            self._save(max(next_id, first + count), used_ranges)
+            return first
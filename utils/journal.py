@@ -0,0 +1,285 @@
+import json
+import os
+import shutil
+import uuid
+
+from .atomic_io import write_json_atomic, write_bytes_atomic, fsync_file, fsync_dir
+from .locks import global_lock, JOURNAL_LOCK
+from .record_format import schema_registry, compress_record, parse_stored, is_compressed
+
+JOURNAL_FILENAME = "journal.jsonl"
+# The journal is checkpointed (its changes synced to the files and the file
+# emptied) once it grows past this size
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+OP_PUT = "put"  # Write a JSON file: {"path": [...], "data": ..., optional "indent" and "compress"}
+OP_DELETE = "delete"  # Delete a file or a whole folder: {"path": [...]}
+OP_MOVE = "move"  # Rename a file or folder: {"path": [...], "to": [...]}
+OP_ABORT = "abort"  # Cancel the entry with the given id, whose change could not be applied
+
+
+class Journal:
+    """Write-ahead journal of the changes made to the files of a data directory.
+
+    Every change (writing a JSON file, deleting a file or a case folder) is first
+    appended to journal.jsonl, which is synced, and only then applied to the files,
+    without syncing them. A save therefore costs one sequential append and one
+    fsync, and a batch of saves a single one. Once its line is on disk a change is
+    durable: checkpoint() syncs the files covered by the journal, re-applying the
+    changes they are missing after a crash, and empties it. Paths are stored as
+    lists of components relative to the data directory, so a journal written on
+    one operating system replays on another.
+
+    Appending and applying happen under the journal lock, so that a checkpoint by
+    another process sharing the data directory never empties the journal while a
+    recorded change is not yet in place.
+    """
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, JOURNAL_FILENAME)
+        self.lock = global_lock(data_dir, JOURNAL_LOCK)
+        self._pending = None  # Entries recorded while batch() is active
+        self._callbacks = []
+
+    def _parts(self, path):
+        return os.path.relpath(path, self.data_dir).split(os.sep)
+
+    def path_of(self, entry):
+        """Returns the absolute path an entry changes."""
+        return os.path.join(self.data_dir, *entry["path"])
+
+    # --- Recording changes ---
+
+    def write_json(self, path, data, indent=4, compression_ref=None):
+        """Writes data as JSON to path (inside the data directory) through the journal.
+
+        With a compression_ref (see SchemaRegistry.compression_ref) the file is
+        written compressed; the journal itself keeps the plain data.
+        """
+        entry = {"op": OP_PUT, "path": self._parts(path), "data": data}
+        if indent != 4:
+            entry["indent"] = indent
+        if compression_ref is not None:
+            entry["compress"] = compression_ref
+        self._record(entry)
+
+    def delete(self, path):
+        """Deletes a file or a folder with its contents through the journal."""
+        self._record({"op": OP_DELETE, "path": self._parts(path)})
+
+    def move(self, path, target):
+        """Renames a file or folder, e.g. a case folder, through the journal.
+
+        The journal is checkpointed before a rename, so no entry refers to a
+        path that has since moved, and the rename itself is synced right away.
+        """
+        self._record({"op": OP_MOVE, "path": self._parts(path), "to": self._parts(target)})
+
+    def after_commit(self, callback):
+        """Runs callback once the changes recorded so far are applied: right away, or at the end of the batch."""
+        if self._pending is not None:
+            self._callbacks.append(callback)
+        else:
+            callback()
+
+    def batch(self):
+        """Returns a context manager that commits the changes recorded inside it with one journal append.
+
+        The changes are applied, and the after_commit() callbacks run, when the
+        block ends. If the block raises, none of its changes are recorded.
+        Nested blocks join the outermost batch.
+        """
+        return _JournalBatch(self)
+
+    def in_batch(self):
+        """Returns True inside batch(), where recorded changes are not yet visible in the files."""
+        return self._pending is not None
+
+    def _record(self, entry):
+        entry["id"] = uuid.uuid4().hex
+        if self._pending is not None:
+            self._pending.append(entry)
+        else:
+            self._commit([entry])
+
+    def _commit(self, entries):
+        with self.lock:
+            start = 0
+            for position, entry in enumerate(entries):
+                if entry["op"] == OP_MOVE:
+                    self._append_and_apply(entries[start:position], durable=False)
+                    self._checkpoint()
+                    self._append_and_apply([entry], durable=True)
+                    start = position + 1
+            self._append_and_apply(entries[start:], durable=False)
+            if os.path.getsize(self.path) > CHECKPOINT_BYTES:
+                self._checkpoint()
+
+    def _append_and_apply(self, entries, durable):
+        if not entries:
+            return
+        self._append(entries)
+        for position, entry in enumerate(entries):
+            try:
+                self._apply(entry, durable=durable)
+            except BaseException:
+                # Keep a replay from applying what the caller was told failed
+                self._append([{"op": OP_ABORT, "id": later["id"]} for later in entries[position:]])
+                raise
+
+    def _append(self, entries):
+        created = not os.path.exists(self.path)
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        with open(self.path, 'ab') as f:
+            if not created and f.tell() > 0 and not self._ends_with_newline():
+                f.write(b"\n")  # Seal a line torn by an interrupted append
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        if created:
+            fsync_dir(self.data_dir)
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _apply(self, entry, durable):
+        path = self.path_of(entry)
+        if entry["op"] == OP_PUT:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if entry.get("compress"):
+                content = compress_record(schema_registry(self.data_dir), entry["data"], entry["compress"])
+                write_bytes_atomic(self.data_dir, path, content, durable=durable)
+            else:
+                write_json_atomic(self.data_dir, path, entry["data"], indent=entry.get("indent", 4), durable=durable)
+        elif entry["op"] == OP_MOVE:
+            target = os.path.join(self.data_dir, *entry["to"])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                raise FileExistsError(f"Cannot move {path}: {target} already exists")
+            os.rename(path, target)
+            if durable:
+                fsync_dir(os.path.dirname(path))
+                fsync_dir(os.path.dirname(target))
+        elif os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    # --- Replay ---
+
+    def entries(self):
+        """Returns the committed entries recorded since the last checkpoint, oldest first."""
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        aborted = set()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A torn line left by an interrupted append, never committed
+                if entry.get("op") == OP_ABORT:
+                    aborted.add(entry.get("id"))
+                else:
+                    entries.append(entry)
+        return [entry for entry in entries if entry.get("id") not in aborted]
+
+    def checkpoint(self, on_replay=None):
+        """Makes every journaled change durable in the files and empties the journal.
+        Args:
+            on_replay (callable): Called as on_replay(entry, reapplied) for every
+                entry, in order, where reapplied tells whether the files were
+                missing the change; used to bring indexes up to date.
+        Returns:
+            int: The number of changes that had to be applied again.
+        """
+        with self.lock:
+            return self._checkpoint(on_replay)
+
+    def _checkpoint(self, on_replay=None):
+        entries = self.entries()
+        last_change = {}
+        deleted = {}
+        for position, entry in enumerate(entries):
+            if entry["op"] == OP_MOVE:
+                continue
+            last_change[tuple(entry["path"])] = position
+            if entry["op"] == OP_DELETE:
+                deleted[tuple(entry["path"])] = position
+
+        reapplied = 0
+        directories = set()
+        for position, entry in enumerate(entries):
+            self.lock.refresh()  # Replaying a long journal may take a while on a network share
+            path = self.path_of(entry)
+            changed = False
+            parts = entry["path"]
+            if entry["op"] == OP_MOVE:
+                # Renames are replayed in order; nothing before one refers to its paths
+                if os.path.exists(path) and not os.path.exists(os.path.join(self.data_dir, *entry["to"])):
+                    self._apply(entry, durable=True)
+                    changed = True
+                reapplied += changed
+                if on_replay is not None:
+                    on_replay(entry, changed)
+                continue
+            superseded = last_change[tuple(parts)] != position or any(
+                deleted.get(tuple(parts[:length]), -1) > position for length in range(1, len(parts)))
+            if not superseded:
+                # Only the last change of a path counts, unless a later change deletes its folder
+                if entry["op"] == OP_PUT and self._holds(path, entry):
+                    fsync_file(path)
+                elif entry["op"] == OP_PUT or os.path.exists(path):
+                    self._apply(entry, durable=True)
+                    changed = True
+                directories.add(os.path.dirname(path))
+            reapplied += changed
+            if on_replay is not None:
+                on_replay(entry, changed)
+
+        for directory in directories:
+            fsync_dir(directory)
+        with open(self.path, 'wb') as f:
+            os.fsync(f.fileno())
+        if reapplied:
+            print(f"Journal replay applied {reapplied} change(s) missing from {self.data_dir}")
+        return reapplied
+
+    def _holds(self, path, entry):
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            return (is_compressed(content) == bool(entry.get("compress"))
+                    and parse_stored(schema_registry(self.data_dir), content) == entry["data"])
+        except (OSError, ValueError):
+            return False
+
+
+class _JournalBatch:
+    def __init__(self, journal):
+        self.journal = journal
+        self.outermost = False
+
+    def __enter__(self):
+        if self.journal._pending is None:
+            self.outermost = True
+            self.journal._pending = []
+            self.journal._callbacks = []
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.outermost:
+            return False
+        entries, callbacks = self.journal._pending, self.journal._callbacks
+        self.journal._pending = None
+        self.journal._callbacks = []
+        if exc_type is not None:
+            return False
+        if entries:
+            self.journal._commit(entries)
+        for callback in callbacks:
+            callback()
+        return False
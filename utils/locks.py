@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import re
+import socket
+import time
+import uuid
+
+# All lock files live in one directory inside the data directory, so that
+# deleting or renaming a case folder never touches a held lock.
+LOCKS_DIRNAME = ".locks"
+ALLOCATOR_LOCK = "allocator"  # Guards case_ids.json
+INDEX_LOCK = "index"  # Guards the case and survey index files
+JOURNAL_LOCK = "journal"  # Guards journal.jsonl and applying its entries
+SCHEMAS_LOCK = "schemas"  # Guards schemas.json
+STAGING_LOCK = "staging"  # Guards cleaning up the staging directory of atomic writes
+
+DEFAULT_LOCK_TIMEOUT = 10.0  # Seconds to wait for a lock before giving up
+STALE_LOCK_SECONDS = 60.0  # A lock file not refreshed for this long is left over from a crashed process
+LOCK_POLL_INTERVAL = 0.05
+PROBE_SUFFIX = ".probe"
+# The clocks of the machines sharing a data directory may disagree with the
+# file server that sets the mtimes, so ages are measured against the server's
+# clock, whose offset from the local one is re-measured after this many seconds.
+CLOCK_OFFSET_TTL = 60.0
+
+_clock_offsets = {}  # {directory: (server clock minus local clock, time.monotonic() when measured)}
+
+
+class LockTimeout(Exception):
+    """Raised when a lock could not be acquired within its timeout."""
+
+
+def server_time(directory):
+    """Returns the current time by the clock of the file system holding directory, e.g. a file server.
+
+    The offset from the local clock is measured by writing a probe file and
+    reading back the mtime the file system gave it, and cached for CLOCK_OFFSET_TTL.
+    """
+    offset, measured = _clock_offsets.get(directory, (None, None))
+    if offset is None or time.monotonic() - measured > CLOCK_OFFSET_TTL:
+        probe_path = os.path.join(directory, uuid.uuid4().hex + PROBE_SUFFIX)
+        try:
+            before = time.time()
+            with open(probe_path, 'wb') as f:
+                f.write(b"0")
+            offset = os.stat(probe_path).st_mtime - (before + time.time()) / 2
+        except OSError as e:
+            print(f"Error reading the clock of {directory}, using the local clock: {e}")
+            offset = 0.0
+        finally:
+            try:
+                os.remove(probe_path)
+            except OSError:
+                pass
+        _clock_offsets[directory] = (offset, time.monotonic())
+    return time.time() + offset
+
+
+def process_tag():
+    """Returns "<host>-<pid>" for this process, for naming the files it owns in a shared directory."""
+    return f"{re.sub(r'[^A-Za-z0-9.]', '_', socket.gethostname())}-{os.getpid()}"
+
+
+def owner_gone(host, pid):
+    """Returns True if the owner of a file named with process_tag() (parsed into host and pid)
+    is known to have exited: it ran on this machine and that process no longer exists."""
+    if host != process_tag().rsplit("-", 1)[0]:
+        return False  # A process on another machine cannot be checked
+    if pid == os.getpid():
+        return False
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() != 5  # ERROR_ACCESS_DENIED: it exists
+        exit_code = ctypes.c_ulong()
+        try:
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        finally:
+            kernel32.CloseHandle(handle)
+        return exit_code.value != 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # E.g. PermissionError: it exists but belongs to another user
+    return False
+
+
+class FileLock:
+    """An exclusive lock between processes (also on other machines sharing the data directory),
+    held by the existence of a lock file.
+
+    The lock file is created with O_CREAT | O_EXCL, which is atomic on local disks
+    and on SMB/NFS shares, and records who holds it under an ID unique to this
+    acquisition. A lock file whose mtime is more than stale_after behind the
+    file server's clock is taken to be left behind by a crashed process and is
+    removed. Locks are meant to be held for the duration of a single write, well
+    below stale_after; longer holders call refresh() as they go. Use as a context
+    manager or with acquire() and release().
+    """
+    def __init__(self, path, timeout=DEFAULT_LOCK_TIMEOUT, stale_after=STALE_LOCK_SECONDS):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._held = False
+        self._owner = None  # What this process wrote to the lock file
+        self._refreshed = 0.0
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._remove_if_stale():
+                    continue
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Timed out waiting for lock {self.path} (held by {self.owner()})")
+                time.sleep(LOCK_POLL_INTERVAL)
+                continue
+            self._owner = {"id": uuid.uuid4().hex, "pid": os.getpid(), "host": socket.gethostname(), "time": time.time()}
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._owner, f)
+            self._held = True
+            self._refreshed = time.monotonic()
+            return
+
+    def refresh(self):
+        """Keeps a lock held through a long operation from being taken for stale. Cheap enough to call often."""
+        if not self._held or time.monotonic() - self._refreshed < self.stale_after / 4:
+            return
+        self._refreshed = time.monotonic()
+        owner = self.owner()
+        if owner is not None and owner.get("id") != self._owner["id"]:
+            print(f"Lock {self.path} was taken over by {owner}")
+            return
+        # Rewritten rather than touched, so that the file server sets the mtime by its own clock
+        self._owner["time"] = time.time()
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self._owner, f)
+        except OSError as e:
+            print(f"Error refreshing lock {self.path}: {e}")
+
+    def release(self):
+        if not self._held:
+            return
+        self._held = False
+        owner = self.owner()
+        if owner is not None and owner.get("id") != self._owner["id"]:
+            print(f"Lock {self.path} was taken over by {owner}; leaving it in place")
+            return
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            print(f"Error releasing lock {self.path}: {e}")
+
+    def owner(self):
+        """Returns the holder recorded in the lock file, or None if it cannot be read."""
+        return _read_owner(self.path)
+
+    def _remove_if_stale(self):
+        """Removes the lock file if it is stale. Returns True if the lock may be retried right away."""
+        try:
+            found = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        except OSError:
+            return False
+        if server_time(os.path.dirname(self.path)) - found.st_mtime < self.stale_after:
+            return False
+        owner = self.owner()
+        # Renaming first means only one of several waiters removes the stale file
+        stale_path = f"{self.path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(self.path, stale_path)
+        except OSError:
+            return True  # Someone else got to it first
+        try:
+            moved = os.stat(stale_path)
+        except OSError:
+            return True
+        if (moved.st_ino, moved.st_mtime_ns) != (found.st_ino, found.st_mtime_ns) or _read_owner(stale_path) != owner:
+            # Another waiter removed the stale file and took the lock in between: give it back
+            self._put_back(stale_path)
+            return False
+        print(f"Removed stale lock {self.path} (held by {owner})")
+        try:
+            os.remove(stale_path)
+        except OSError:
+            pass
+        return True
+
+    def _put_back(self, stale_path):
+        try:
+            os.link(stale_path, self.path)  # Unlike a rename, never replaces a lock created meanwhile
+        except FileExistsError:
+            print(f"Lock {self.path} was re-created while being restored; its previous holder lost it")
+        except OSError:
+            try:
+                if not os.path.exists(self.path):
+                    os.rename(stale_path, self.path)
+                    return
+            except OSError as e:
+                print(f"Error restoring lock {self.path}: {e}")
+        try:
+            os.remove(stale_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def _read_owner(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _lock_file_path(data_dir, name):
+    locks_path = os.path.join(data_dir, LOCKS_DIRNAME)
+    os.makedirs(locks_path, exist_ok=True)
+    return os.path.join(locks_path, name + ".lock")
+
+
+def global_lock(data_dir, name, timeout=DEFAULT_LOCK_TIMEOUT):
+    """Returns the lock guarding a shared file of the data directory, such as ALLOCATOR_LOCK or INDEX_LOCK."""
+    return FileLock(_lock_file_path(data_dir, name), timeout=timeout)
+
+
+def case_lock(data_dir, case_id, timeout=DEFAULT_LOCK_TIMEOUT):
+    """Returns the lock guarding the files of one case (case.json and its surveys).
+
+    Locks are keyed by the case ID rather than the folder name, which changes
+    when the child's name or date of birth is edited.
+    """
+    case_id = str(case_id)
+    if not re.fullmatch(r"[\w-]{1,64}", case_id, re.ASCII):
+        case_id = hashlib.sha1(case_id.encode("utf-8")).hexdigest()
+    return FileLock(_lock_file_path(data_dir, "case-" + case_id), timeout=timeout)
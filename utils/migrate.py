@@ -0,0 +1,544 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from .atomic_io import recover_pending_writes
+from .case_layout import read_layout, write_layout, case_folder_name, iter_case_folders, is_shard_name, LAYOUT_FLAT, LAYOUT_SHARDED
+from .file_manager import CASE_INDEX_FILENAME
+from .id_allocator import CaseIdAllocator, add_id_range
+from .journal import Journal
+from .record_format import schema_registry, read_record, write_record, decode_record, parse_stored, is_compressed, \
+    survey_schema, CASE_SCHEMA, FORMAT_COMPACT, FORMAT_LABELED, COMPRESSION_ZLIB, COMPRESSION_NONE
+from .sqlite_backend import SqliteBackend, SQLITE_FILENAME
+from .survey_index import SURVEY_INDEX_FILENAME
+from .survey_history import resolve_survey, survey_id_of
+
+# Moves a data directory between the folder-per-case JSON layout and the SQLite
+# backend, in either direction:
+#
+#   python -m utils.migrate to-sqlite DATA_DIR
+#   python -m utils.migrate to-json DATA_DIR [--target DIR]
+#   python -m utils.migrate verify DATA_DIR [--target DIR]
+#
+# and between the flat and the sharded arrangement of the case folders (see
+# utils.case_layout):
+#
+#   python -m utils.migrate to-sharded DATA_DIR
+#   python -m utils.migrate to-flat DATA_DIR
+#
+# and between the labeled and the compact format of the case and survey files
+# (see utils.record_format):
+#
+#   python -m utils.migrate to-compact DATA_DIR
+#   python -m utils.migrate to-labeled DATA_DIR
+#
+# and between compressed and plain files:
+#
+#   python -m utils.migrate compress DATA_DIR
+#   python -m utils.migrate decompress DATA_DIR
+#
+# The application must not be running on the data directory meanwhile. Both
+# directions work through the cases in chunks, each written by one transaction
+# (SQLite) or with the case.json written last (JSON), so an interrupted run is
+# resumed by starting it again: cases already transferred are skipped. Only a
+# bounded number of chunks is held in memory at a time. After the transfer
+# both sides are compared by their record counts and content hashes.
+
+DEFAULT_MIGRATION_WORKERS = 8
+CHUNK_SIZE = 200  # Cases per worker task and per database transaction
+
+# One case as transferred: surveys is a list of (survey ID, survey data), whole
+# (surveys stored as deltas are resolved, see survey_history)
+CaseRecord = namedtuple("CaseRecord", ["folder", "data", "mtime", "surveys"])
+MigrationResult = namedtuple("MigrationResult", ["transferred", "skipped", "errors"])
+
+
+def record_hash(case_folder_name, data):
+    """Hashes one case or survey together with its folder, independent of key order and formatting."""
+    canonical = json.dumps([case_folder_name, data], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).digest()
+
+
+class RecordDigest:
+    """Count and order-independent hash (sum of record hashes) of a set of cases and surveys."""
+    def __init__(self):
+        self.cases = 0
+        self.surveys = 0
+        self._total = 0
+
+    def _add(self, case_folder_name, data):
+        self._total = (self._total + int.from_bytes(record_hash(case_folder_name, data), "big")) % (1 << 256)
+
+    def add(self, record):
+        self.cases += 1
+        self._add(record.folder, record.data)
+        for _, survey_data in record.surveys:
+            self.surveys += 1
+            self._add(record.folder, survey_data)
+
+    def hexdigest(self):
+        return f"{self._total:064x}"
+
+    def __eq__(self, other):
+        return (self.cases, self.surveys, self._total) == (other.cases, other.surveys, other._total)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _bounded_map(executor, fn, items, window):
+    """Like executor.map, but submits at most window tasks ahead of the results consumed."""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# --- JSON folder layout ---
+
+def _iter_case_folders(data_dir):
+    with os.scandir(data_dir) as it:
+        for entry in it:
+            if entry.is_dir() and not entry.name.startswith("."):
+                yield entry.name
+
+
+def _read_json_case(data_dir, case_folder_name):
+    """Reads one case folder.
+    Returns:
+        tuple: (CaseRecord or None, error message or None); both are None for a folder without case.json.
+    """
+    case_path = os.path.join(data_dir, case_folder_name)
+    case_file_path = os.path.join(case_path, "case.json")
+    try:
+        mtime = os.stat(case_file_path).st_mtime_ns
+        case_data = read_record(data_dir, case_file_path)
+    except FileNotFoundError:
+        return None, None
+    except (OSError, ValueError) as e:
+        return None, f"could not read case.json: {e}"
+    if not isinstance(case_data, dict) or not case_data.get("case_id"):
+        return None, "case.json has no case_id"
+
+    stored_surveys = {}
+    surveys_path = os.path.join(case_path, "surveys")
+    if os.path.isdir(surveys_path):
+        for filename in sorted(os.listdir(surveys_path)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                stored_surveys[filename] = read_record(data_dir, os.path.join(surveys_path, filename))
+            except (OSError, ValueError) as e:
+                return None, f"could not read survey {filename}: {e}"
+    surveys = []
+    for filename in stored_surveys:
+        try:
+            surveys.append((survey_id_of(filename), resolve_survey(filename, stored_surveys.get)))
+        except ValueError as e:
+            return None, f"could not read survey {filename}: {e}"
+    return CaseRecord(case_folder_name, case_data, mtime, surveys), None
+
+
+def _read_json_chunk(data_dir, case_folder_names):
+    return [(case_folder_name,) + _read_json_case(data_dir, case_folder_name) for case_folder_name in case_folder_names]
+
+
+def _write_json_case(target_dir, record):
+    """Writes one case folder, the surveys first and case.json last. Returns False if it was already there."""
+    case_path = os.path.join(target_dir, record.folder)
+    case_file_path = os.path.join(case_path, "case.json")
+    if os.path.exists(case_file_path):
+        try:
+            if record_hash(record.folder, read_record(target_dir, case_file_path)) == record_hash(record.folder, record.data):
+                return False
+        except (OSError, ValueError):
+            pass
+    surveys_path = os.path.join(case_path, "surveys")
+    os.makedirs(surveys_path, exist_ok=True)
+    for survey_id, survey_data in record.surveys:
+        write_record(target_dir, os.path.join(surveys_path, survey_id + ".json"),
+                     survey_schema(survey_data.get("survey_type") or survey_id), survey_data)
+    write_record(target_dir, case_file_path, CASE_SCHEMA, record.data)
+    return True
+
+
+def _numeric_case_id(record):
+    case_id = str(record.data.get("case_id"))
+    return int(case_id) if case_id.isdigit() else None
+
+
+def _move_case_folder(data_dir, case_folder_name_now, layout):
+    """Moves one case folder to where the layout keeps it.
+    Returns:
+        tuple: (bool moved, error message or None).
+    """
+    try:
+        case_data = read_record(data_dir, os.path.join(data_dir, case_folder_name_now, "case.json"))
+    except FileNotFoundError:
+        return False, None
+    except (OSError, ValueError) as e:
+        return False, f"could not read case.json: {e}"
+    if not isinstance(case_data, dict) or not case_data.get("case_id"):
+        return False, "case.json has no case_id"
+
+    target = case_folder_name(layout, case_data["case_id"],
+                              case_data.get("child_name", {}).get("value", ""), case_data.get("dob", {}).get("value", ""))
+    if target == case_folder_name_now:
+        return False, None
+    target_path = os.path.join(data_dir, target)
+    if os.path.exists(target_path):
+        return False, f"{target} already exists"
+    try:
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.rename(os.path.join(data_dir, case_folder_name_now), target_path)
+    except OSError as e:
+        return False, str(e)
+    return True, None
+
+
+def _remove_empty_shards(data_dir):
+    for name in os.listdir(data_dir):
+        shard_path = os.path.join(data_dir, name)
+        if not is_shard_name(name) or not os.path.isdir(shard_path):
+            continue
+        for second in os.listdir(shard_path):
+            try:
+                os.rmdir(os.path.join(shard_path, second))
+            except OSError:
+                pass  # Not empty
+        try:
+            os.rmdir(shard_path)
+        except OSError:
+            pass
+
+
+def _rewrite_case_folder(data_dir, registry, case_folder_name):
+    """Rewrites the files of one case folder, surveys first, in the data directory's record format and compression.
+    Returns:
+        tuple: (bool rewritten, error message or None).
+    """
+    case_path = os.path.join(data_dir, case_folder_name)
+    surveys_path = os.path.join(case_path, "surveys")
+    paths = []
+    if os.path.isdir(surveys_path):
+        paths = [os.path.join(surveys_path, filename) for filename in sorted(os.listdir(surveys_path)) if filename.endswith(".json")]
+    paths.append(os.path.join(case_path, "case.json"))
+    rewritten = False
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            stored = parse_stored(registry, content)
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError) as e:
+            return rewritten, f"could not read {os.path.basename(path)}: {e}"
+        record = decode_record(registry, stored)
+        if path.endswith(os.sep + "case.json"):
+            schema_name = CASE_SCHEMA
+        else:
+            schema_name = survey_schema(record.get("survey_type") or os.path.basename(path)[:-len(".json")])
+        data = registry.to_disk(schema_name, record)
+        if data != stored or is_compressed(content) != (registry.compression == COMPRESSION_ZLIB):
+            try:
+                write_record(data_dir, path, schema_name, record)
+            except OSError as e:
+                return rewritten, str(e)
+            rewritten = True
+    return rewritten, None
+
+
+# --- Migrations ---
+
+def change_layout(data_dir, layout, workers=DEFAULT_MIGRATION_WORKERS):
+    """Moves every case folder of data_dir to where the given layout keeps it.
+
+    The folders are renamed, never copied, by a pool of worker threads. The
+    journal is checkpointed first, so none of its entries refers to a folder
+    that moves. A data directory being converted to the sharded layout is
+    marked sharded right away: that layout also finds the flat folders, so
+    the cases stay visible while the migration runs and an interrupted run
+    is continued by starting it again. The case and survey indexes are
+    deleted, to be rebuilt under the new folder names on the next start.
+    Returns:
+        MigrationResult: Numbers of cases moved and already in place, and
+                         (folder, message) for the cases that failed.
+    """
+    Journal(data_dir).checkpoint()
+    if layout == LAYOUT_SHARDED:
+        write_layout(data_dir, LAYOUT_SHARDED)
+    case_folders = list(iter_case_folders(data_dir, LAYOUT_SHARDED))
+    moved = skipped = 0
+    errors = []
+    move_chunk = lambda chunk: [(folder,) + _move_case_folder(data_dir, folder, layout) for folder in chunk]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for results in _bounded_map(executor, move_chunk, _chunks(case_folders, CHUNK_SIZE), 2 * workers):
+            for case_folder_name_now, was_moved, error in results:
+                if error:
+                    errors.append((case_folder_name_now, error))
+                elif was_moved:
+                    moved += 1
+                else:
+                    skipped += 1
+            print(f"Moved {moved} case folders ({skipped} already in place)", flush=True)
+
+    if layout == LAYOUT_FLAT:
+        _remove_empty_shards(data_dir)
+        if not errors:
+            write_layout(data_dir, LAYOUT_FLAT)
+    for index_filename in (CASE_INDEX_FILENAME, SURVEY_INDEX_FILENAME):
+        try:
+            os.remove(os.path.join(data_dir, index_filename))
+        except FileNotFoundError:
+            pass
+    return MigrationResult(moved, skipped, errors)
+
+
+def change_record_format(data_dir, record_format=None, compression=None, workers=DEFAULT_MIGRATION_WORKERS):
+    """Rewrites every case and survey file of data_dir in the given record format and/or compression.
+
+    The choice is recorded in schemas.json first, so that everything saved from
+    then on uses it; all formats are read meanwhile, so an interrupted run is
+    continued by starting it again. Files already as chosen are skipped.
+    Returns:
+        MigrationResult: Numbers of cases rewritten and already in the format,
+                         and (folder, message) for the cases that failed.
+    """
+    Journal(data_dir).checkpoint()
+    registry = schema_registry(data_dir)
+    registry.set_record_format(record_format, compression)
+    case_folders = list(iter_case_folders(data_dir, read_layout(data_dir)))
+    rewritten = skipped = 0
+    errors = []
+    rewrite_chunk = lambda chunk: [(folder,) + _rewrite_case_folder(data_dir, registry, folder) for folder in chunk]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for results in _bounded_map(executor, rewrite_chunk, _chunks(case_folders, CHUNK_SIZE), 2 * workers):
+            for case_folder_name_now, was_rewritten, error in results:
+                if error:
+                    errors.append((case_folder_name_now, error))
+                elif was_rewritten:
+                    rewritten += 1
+                else:
+                    skipped += 1
+            print(f"Rewrote {rewritten} cases ({skipped} unchanged)", flush=True)
+    return MigrationResult(rewritten, skipped, errors)
+
+
+def migrate_to_sqlite(data_dir, workers=DEFAULT_MIGRATION_WORKERS):
+    """Copies every case folder of data_dir into the SQLite database in data_dir.
+
+    Case folders are read by a pool of worker threads, chunk by chunk, and each
+    chunk is stored in one transaction. Folders already in the database are
+    skipped, so an interrupted run continues where it stopped. The JSON files
+    are left in place.
+    Returns:
+        MigrationResult: Numbers of cases transferred and skipped, and
+                         (folder, message) for the cases that failed.
+    """
+    backend = SqliteBackend(data_dir)
+    transferred = skipped = 0
+    errors = []
+    highest_id = 0
+
+    def pending_chunks():
+        nonlocal skipped
+        for chunk in _chunks(_iter_case_folders(data_dir), CHUNK_SIZE):
+            done = backend.existing_folders(chunk)
+            skipped += len(done)
+            yield [case_folder_name for case_folder_name in chunk if case_folder_name not in done]
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            read_chunk = lambda chunk: _read_json_chunk(data_dir, chunk)
+            for results in _bounded_map(executor, read_chunk, pending_chunks(), 2 * workers):
+                records = []
+                for case_folder_name, record, error in results:
+                    if error:
+                        errors.append((case_folder_name, error))
+                    elif record is not None:
+                        records.append(record)
+                        highest_id = max(highest_id, _numeric_case_id(record) or 0)
+                rejected = backend.put_case_records(records)
+                errors.extend(rejected)
+                transferred += len(records) - len(rejected)
+                print(f"Transferred {transferred} cases ({skipped} already there)", flush=True)
+        backend.raise_next_case_id(max(highest_id + 1, CaseIdAllocator(data_dir).peek()))
+    finally:
+        backend.close()
+    return MigrationResult(transferred, skipped, errors)
+
+
+def migrate_to_json(data_dir, target_dir=None, workers=DEFAULT_MIGRATION_WORKERS):
+    """Writes every case of the SQLite database in data_dir back to the folder-per-case layout.
+
+    The cases are read from the database in pages and written by a pool of
+    worker threads, each file atomically. Case folders whose case.json already
+    holds the same data are skipped, so an interrupted run continues where it
+    stopped. The database is left in place.
+    Args:
+        data_dir (str): The data directory holding the database.
+        target_dir (str): Where to create the case folders; defaults to data_dir.
+        workers (int): Number of worker threads.
+    Returns:
+        MigrationResult: Numbers of cases transferred and skipped, and
+                         (folder, message) for the cases that failed.
+    """
+    target_dir = target_dir or data_dir
+    os.makedirs(target_dir, exist_ok=True)
+    recover_pending_writes(target_dir)  # Temp files left by an interrupted run
+    backend = SqliteBackend(data_dir)
+    transferred = skipped = 0
+    errors = []
+    used_ranges = []
+
+    def write_chunk(records):
+        results = []
+        for record in records:
+            try:
+                results.append((record.folder, _write_json_case(target_dir, record), None))
+            except OSError as e:
+                results.append((record.folder, False, str(e)))
+        return results
+
+    def pages():
+        for page in backend.iter_case_records(CHUNK_SIZE):
+            records = [CaseRecord(*record) for record in page]
+            for record in records:
+                case_id = _numeric_case_id(record)
+                if case_id is not None:
+                    add_id_range(used_ranges, case_id, case_id)
+            yield records
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for results in _bounded_map(executor, write_chunk, pages(), 2 * workers):
+                for case_folder_name, written, error in results:
+                    if error:
+                        errors.append((case_folder_name, error))
+                    elif written:
+                        transferred += 1
+                    else:
+                        skipped += 1
+                print(f"Transferred {transferred} cases ({skipped} already there)", flush=True)
+        CaseIdAllocator(target_dir).merge(used_ranges, backend.next_case_id())
+    finally:
+        backend.close()
+    return MigrationResult(transferred, skipped, errors)
+
+
+def verify(data_dir, json_dir=None, workers=DEFAULT_MIGRATION_WORKERS):
+    """Compares the case folders in json_dir (default data_dir) with the SQLite database in data_dir.
+    Returns:
+        tuple: (RecordDigest of the JSON folders, RecordDigest of the database).
+    """
+    json_dir = json_dir or data_dir
+    json_digest = RecordDigest()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        read_chunk = lambda chunk: _read_json_chunk(json_dir, chunk)
+        for results in _bounded_map(executor, read_chunk, _chunks(_iter_case_folders(json_dir), CHUNK_SIZE), 2 * workers):
+            for _, record, _ in results:
+                if record is not None:
+                    json_digest.add(record)
+
+    sqlite_digest = RecordDigest()
+    backend = SqliteBackend(data_dir)
+    try:
+        for page in backend.iter_case_records(CHUNK_SIZE):
+            for record in page:
+                sqlite_digest.add(CaseRecord(*record))
+    finally:
+        backend.close()
+    return json_digest, sqlite_digest
+
+
+def _report_verification(json_digest, sqlite_digest):
+    for name, digest in (("JSON folders", json_digest), ("SQLite", sqlite_digest)):
+        print(f"{name}: {digest.cases} cases, {digest.surveys} surveys, hash {digest.hexdigest()}")
+    if json_digest == sqlite_digest:
+        print("Verification passed: both stores hold the same records.")
+        return True
+    print("Verification FAILED: the stores differ.")
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.migrate",
+                                     description="Move a data directory between the JSON folder layout and SQLite, "
+                                                 "between the flat and sharded case folder layouts, "
+                                                 "or between the record formats of the case files.")
+    parser.add_argument("command", choices=["to-sqlite", "to-json", "verify", "to-sharded", "to-flat",
+                                            "to-compact", "to-labeled", "compress", "decompress"])
+    parser.add_argument("data_dir", help="The data directory (data_path in config.json).")
+    parser.add_argument("--target", help="to-json/verify: the folder of the JSON layout, if not data_dir.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MIGRATION_WORKERS, help="Number of worker threads.")
+    parser.add_argument("--no-verify", action="store_true", help="Skip comparing both stores afterwards.")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        print(f"Data directory not found: {args.data_dir}")
+        return 2
+    workers = max(1, args.workers)
+
+    if args.command in ("to-sharded", "to-flat"):
+        result = change_layout(args.data_dir, LAYOUT_SHARDED if args.command == "to-sharded" else LAYOUT_FLAT, workers)
+        for folder, error in result.errors:
+            print(f"Not moved: {folder}: {error}")
+        print(f"Done: {result.transferred} moved, {result.skipped} already in place, {len(result.errors)} failed.")
+        return 1 if result.errors else 0
+
+    if args.command in ("to-compact", "to-labeled", "compress", "decompress"):
+        record_format, compression = {
+            "to-compact": (FORMAT_COMPACT, None),
+            "to-labeled": (FORMAT_LABELED, None),
+            "compress": (None, COMPRESSION_ZLIB),
+            "decompress": (None, COMPRESSION_NONE),
+        }[args.command]
+        result = change_record_format(args.data_dir, record_format, compression, workers)
+        for folder, error in result.errors:
+            print(f"Not rewritten: {folder}: {error}")
+        print(f"Done: {result.transferred} rewritten, {result.skipped} unchanged, {len(result.errors)} failed.")
+        return 1 if result.errors else 0
+
+    for directory in (args.data_dir, args.target):
+        if directory and os.path.isdir(directory) and read_layout(directory) != LAYOUT_FLAT:
+            print(f"{directory} uses the sharded layout; convert it with to-flat first.")
+            return 2
+    if args.command != "to-sqlite" and not os.path.exists(os.path.join(args.data_dir, SQLITE_FILENAME)):
+        print(f"No {SQLITE_FILENAME} in {args.data_dir}")
+        return 2
+
+    if args.command != "verify":
+        if args.command == "to-sqlite":
+            result = migrate_to_sqlite(args.data_dir, workers)
+        else:
+            result = migrate_to_json(args.data_dir, args.target, workers)
+        for folder, error in result.errors:
+            print(f"Not transferred: {folder}: {error}")
+        print(f"Done: {result.transferred} transferred, {result.skipped} skipped, {len(result.errors)} failed.")
+        if args.no_verify:
+            return 1 if result.errors else 0
+
+    passed = _report_verification(*verify(args.data_dir, args.target, workers))
+    if passed and args.command == "to-sqlite":
+        print('Set "storage_backend": "sqlite" in config.json to use the database.')
+    elif passed and args.command == "to-json":
+        print('Set "storage_backend": "json" in config.json to use the case folders.')
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
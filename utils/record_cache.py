@@ -0,0 +1,81 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+RecordCacheStats = namedtuple("RecordCacheStats", ["hits", "misses", "entries", "capacity"])
+
+
+def _copy(value):
+    # Records are plain JSON trees; this is several times faster than copy.deepcopy
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+class RecordCache:
+    """Bounded LRU cache of parsed case and survey files, keyed by path.
+
+    Every lookup stats the file and only uses the cached record if its
+    modification time, size and inode are unchanged. Files are always replaced
+    atomically, so a change by another process (or user of a shared data
+    directory) gives the file a new inode even if it lands within the
+    resolution of the modification time. Callers get their own copy of a record
+    and may modify it freely. Files larger than max_file_bytes are parsed on
+    every lookup and never kept. Safe to use from several threads.
+    """
+    def __init__(self, capacity, max_file_bytes=None):
+        self.capacity = capacity
+        self.max_file_bytes = max_file_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # {path: ((mtime_ns, size, inode), record)}, least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, path, load):
+        """Returns a copy of the record in path, calling load(path) to parse it if it is not cached or has changed.
+
+        Raises OSError if the file cannot be stat'ed; errors of load are passed on
+        and nothing is cached for them.
+        """
+        st = os.stat(path)
+        validator = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == validator:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return _copy(entry[1])
+            self.misses += 1
+        # Parsed outside the lock; the validator was taken before reading, so a
+        # file replaced meanwhile is caught by the next lookup
+        record = load(path)
+        if self.max_file_bytes is not None and st.st_size > self.max_file_bytes:
+            return record
+        with self._lock:
+            self._entries[path] = (validator, record)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return _copy(record)
+
+    def invalidate(self, path):
+        """Drops the cached record of a file, e.g. after saving or deleting it."""
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def invalidate_folder(self, folder_path):
+        """Drops the cached records of every file inside a folder, e.g. a deleted or moved case folder."""
+        prefix = os.path.join(folder_path, "")
+        with self._lock:
+            for path in [path for path in self._entries if path.startswith(prefix)]:
+                del self._entries[path]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return RecordCacheStats(self.hits, self.misses, len(self._entries), self.capacity)
@@ -0,0 +1,286 @@
+import json
+import os
+import zlib
+
+from .atomic_io import write_json_atomic, write_bytes_atomic
+from .locks import global_lock, SCHEMAS_LOCK
+from .records import REVISION_KEY
+
+# Case and survey fields are kept in memory as {"ar_key": <Arabic label>, "value": ...}.
+# In the compact format the labels are not repeated in every file: a record names
+# the schema version it was written with and holds only the field values,
+#   {"_schema": ["case", 2], "_fields": {"child_name": "...", ...}, "case_id": "17"}
+# while schemas.json lists the labels of every version of every schema. Versions
+# are only ever added, so a file always decodes with the labels it was saved with.
+# Files in the labeled format (all files written before this existed) are read as
+# they are, so both formats can be mixed in one data directory.
+SCHEMAS_FILENAME = "schemas.json"
+FORMAT_LABELED = "labeled"
+FORMAT_COMPACT = "compact"
+RECORD_FORMATS = (FORMAT_LABELED, FORMAT_COMPACT)
+
+# Independently of the format, the files can be compressed with zlib. A compressed
+# file starts with COMPRESSED_MAGIC (never the start of a JSON text), followed by
+# the schema version as a JSON line and the zlib stream of the record's JSON. The
+# stream is compressed with a preset dictionary built from the labels of that
+# schema version, which holds most of the strings of a small record, so even
+# files of a few hundred bytes compress well. Schema versions never change, so
+# the dictionary of a file can always be rebuilt.
+COMPRESSION_NONE = "none"
+COMPRESSION_ZLIB = "zlib"
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_ZLIB)
+COMPRESSED_MAGIC = b"\x93MCZ1"
+COMPRESSION_LEVEL = 9
+
+SCHEMA_KEY = "_schema"
+FIELDS_KEY = "_fields"
+CASE_SCHEMA = "case"
+
+_registries = {}  # {data directory: SchemaRegistry}
+
+
+def survey_schema(survey_type):
+    return f"survey/{survey_type}"
+
+
+def schema_registry(data_dir):
+    """Returns the SchemaRegistry of a data directory, shared by everything in this process."""
+    key = os.path.abspath(data_dir)
+    registry = _registries.get(key)
+    if registry is None:
+        registry = _registries.setdefault(key, SchemaRegistry(data_dir))
+    return registry
+
+
+class SchemaRegistry:
+    """The versioned field labels of the case and survey records of a data directory, kept in schemas.json.
+
+    The file also records which format and compression new records are written
+    with, so that every user sharing the data directory writes the same. New versions are
+    registered under a lock, after reloading the file, so processes sharing the
+    data directory never number two different versions the same.
+    """
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, SCHEMAS_FILENAME)
+        self.lock = global_lock(data_dir, SCHEMAS_LOCK)
+        self.record_format = FORMAT_LABELED
+        self.compression = COMPRESSION_NONE
+        self._schemas = {}  # {schema name: [{field key: label}, ...]}, version n at index n - 1
+        self._dictionaries = {}  # {(schema name, version): preset zlib dictionary}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error reading {self.path}: {e}")
+            return
+        record_format = content.get("record_format")
+        self.record_format = record_format if record_format in RECORD_FORMATS else FORMAT_LABELED
+        compression = content.get("compression")
+        self.compression = compression if compression in COMPRESSIONS else COMPRESSION_NONE
+        self._schemas = content.get("schemas", {})
+
+    def _save(self):
+        write_json_atomic(self.data_dir, self.path, {
+            "record_format": self.record_format,
+            "compression": self.compression,
+            "schemas": self._schemas,
+        })
+
+    def set_record_format(self, record_format=None, compression=None):
+        """Sets the format and/or compression with which records are written from now on, for every user of the data directory."""
+        with self.lock:
+            self._load()
+            if record_format is not None:
+                self.record_format = record_format
+            if compression is not None:
+                self.compression = compression
+            self._save()
+
+    def labels(self, schema_name, version):
+        """Returns {field key: label} of a schema version, or None if it is not registered."""
+        for attempt in range(2):
+            versions = self._schemas.get(schema_name, [])
+            if 0 < version <= len(versions):
+                return versions[version - 1]
+            if attempt == 0:
+                self._load()  # Registered by another process since it was read
+        return None
+
+    def version_for(self, schema_name, labels):
+        """Returns the newest version of a schema with the given labels, registering a new version if none has them.
+        Args:
+            schema_name (str): CASE_SCHEMA, or survey_schema() of a survey type.
+            labels (dict): {field key: label} of the fields of one record.
+        Returns:
+            int: The schema version.
+        """
+        version = self._matching_version(schema_name, labels)
+        if version:
+            return version
+        with self.lock:
+            self._load()
+            version = self._matching_version(schema_name, labels)
+            if version:
+                return version
+            versions = self._schemas.setdefault(schema_name, [])
+            new_labels = dict(versions[-1]) if versions else {}
+            new_labels.update(labels)
+            versions.append(new_labels)
+            self._save()
+            print(f"Registered version {len(versions)} of the {schema_name} schema")
+            return len(versions)
+
+    def _matching_version(self, schema_name, labels):
+        versions = self._schemas.get(schema_name, [])
+        for index in range(len(versions) - 1, -1, -1):
+            known = versions[index]
+            if all(known.get(key) == label for key, label in labels.items()):
+                return index + 1
+        return None
+
+    def to_disk(self, schema_name, record):
+        """Returns a record as it is written to disk in the data directory's record format."""
+        if self.record_format == FORMAT_COMPACT:
+            return encode_record(self, schema_name, record)
+        return decode_record(self, record)
+
+    def compression_ref(self, schema_name, data):
+        """Returns the schema version whose dictionary compresses a record as written by to_disk(), or None without compression."""
+        if self.compression != COMPRESSION_ZLIB:
+            return None
+        if is_compact(data):
+            return list(data[SCHEMA_KEY])
+        labels = {key: value["ar_key"] for key, value in data.items() if _is_field(value)}
+        return [schema_name, self.version_for(schema_name, labels)]
+
+    def dictionary(self, schema_name, version):
+        """Returns the preset zlib dictionary of a schema version.
+
+        It holds the text of an empty record of that version in both formats,
+        the labeled one last since zlib finds the end of a dictionary cheapest.
+        """
+        key = (schema_name, version)
+        dictionary = self._dictionaries.get(key)
+        if dictionary is None:
+            labels = self.labels(schema_name, version) or {}
+            if schema_name == CASE_SCHEMA:
+                common = {"case_id": "", REVISION_KEY: 1}
+            else:
+                common = {"survey_type": schema_name.split("/", 1)[1], "survey_date": "", "submission_timestamp": "", REVISION_KEY: 1}
+            labeled = dict(common, **{field_key: {"ar_key": label, "value": ""} for field_key, label in labels.items()})
+            compact = {SCHEMA_KEY: [schema_name, version], FIELDS_KEY: {field_key: "" for field_key in labels}}
+            compact.update(common)
+            dictionary = (json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+                          + json.dumps(labeled, ensure_ascii=False, indent=4)).encode("utf-8")
+            self._dictionaries[key] = dictionary
+        return dictionary
+
+
+def _is_field(value):
+    return isinstance(value, dict) and value.keys() == {"ar_key", "value"} and isinstance(value["ar_key"], str)
+
+
+def is_compact(data):
+    return isinstance(data, dict) and isinstance(data.get(SCHEMA_KEY), list)
+
+
+def encode_record(registry, schema_name, record):
+    """Returns the compact form of a case or survey record.
+
+    Every {"ar_key", "value"} field is reduced to its value, in a "_fields" object
+    placed where the first field was; other keys are kept as they are.
+    """
+    if is_compact(record):
+        return record
+    fields = {key: value["value"] for key, value in record.items() if _is_field(value)}
+    version = registry.version_for(schema_name, {key: record[key]["ar_key"] for key in fields})
+    compact = {SCHEMA_KEY: [schema_name, version]}
+    for key, value in record.items():
+        if key not in fields:
+            compact[key] = value
+        elif FIELDS_KEY not in compact:
+            compact[FIELDS_KEY] = fields
+    return compact
+
+
+def decode_record(registry, data):
+    """Returns a record read from disk in the labeled form used by the application, whichever format it was stored in."""
+    if not is_compact(data):
+        return data
+    schema_name, version = data[SCHEMA_KEY]
+    labels = registry.labels(schema_name, version)
+    if labels is None:
+        print(f"Version {version} of the {schema_name} schema is missing from {registry.path}; showing field keys as labels")
+        labels = {}
+    record = {}
+    for key, value in data.items():
+        if key == FIELDS_KEY:
+            for field_key, field_value in value.items():
+                record[field_key] = {"ar_key": labels.get(field_key, field_key), "value": field_value}
+        elif key != SCHEMA_KEY:
+            record[key] = value
+    return record
+
+
+def is_compressed(content):
+    return content.startswith(COMPRESSED_MAGIC)
+
+
+def compress_record(registry, data, compression_ref):
+    """Returns the content of a compressed file holding data (as stored), using the dictionary of compression_ref."""
+    schema_name, version = compression_ref
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=registry.dictionary(schema_name, version))
+    indent = disk_indent(data)
+    text = json.dumps(data, ensure_ascii=False, indent=indent, separators=(",", ":") if indent is None else None)
+    header = json.dumps(compression_ref, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return COMPRESSED_MAGIC + header + b"\n" + compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def parse_stored(registry, content):
+    """Parses the content of a case or survey file, compressed or not, into the data as stored. Raises ValueError."""
+    if not is_compressed(content):
+        return json.loads(content)
+    header, _, compressed = content[len(COMPRESSED_MAGIC):].partition(b"\n")
+    schema_name, version = json.loads(header)
+    if registry.labels(schema_name, version) is None:
+        raise ValueError(f"version {version} of the {schema_name} schema is missing from {registry.path}")
+    decompressor = zlib.decompressobj(zdict=registry.dictionary(schema_name, version))
+    try:
+        text = decompressor.decompress(compressed) + decompressor.flush()
+    except zlib.error as e:
+        raise ValueError(f"corrupt compressed record: {e}")
+    return json.loads(text)
+
+
+def read_stored(data_dir, path):
+    """Reads a case or survey file as stored: compact or labeled, decompressed. Raises OSError or ValueError."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    return parse_stored(schema_registry(data_dir), content)
+
+
+def read_record(data_dir, path):
+    """Reads a case or survey file of a data directory in any format. Raises OSError or ValueError."""
+    return decode_record(schema_registry(data_dir), read_stored(data_dir, path))
+
+
+def write_record(data_dir, path, schema_name, record, durable=True):
+    """Writes a case or survey file directly (not through the journal) in the data directory's format and compression."""
+    registry = schema_registry(data_dir)
+    data = registry.to_disk(schema_name, record)
+    compression_ref = registry.compression_ref(schema_name, data)
+    if compression_ref is None:
+        write_json_atomic(data_dir, path, data, indent=disk_indent(data), durable=durable)
+    else:
+        write_bytes_atomic(data_dir, path, compress_record(registry, data, compression_ref), durable=durable)
+
+
+def disk_indent(data):
+    """Returns the JSON indentation a record is written with: none for compact records."""
+    return None if is_compact(data) else 4
@@ -0,0 +1,105 @@
+from collections import namedtuple
+
+# Listing data of one case, as kept by the case index and the storage backends
+CaseSummary = namedtuple("CaseSummary", [
+    "folder", "case_id", "child_name", "diagnosis", "dob", "gender", "father_name", "mother_name", "mtime", "size", "valid"
+])
+
+# Listing data of one survey of a case: filename includes ".json", mtime is in nanoseconds
+SurveyHeader = namedtuple("SurveyHeader", ["filename", "survey_type", "survey_date", "submission_timestamp", "size", "mtime"])
+# Reference to one saved survey, held by survey lists instead of the survey itself
+SurveyHandle = namedtuple("SurveyHandle", ["case_folder", "filename"])
+# Survey date that surveys without one are listed and sorted under
+MISSING_SURVEY_DATE = "1900-01-01"
+
+# Revision counter stored in every case and survey record, incremented on each save
+REVISION_KEY = "_revision"
+# Most differing fields listed in a save conflict message
+CONFLICT_DIFF_LIMIT = 15
+
+
+def summary_from_case_data(case_folder_name, case_data, mtime, size):
+    """Builds the CaseSummary of a case from its parsed data (None if the data could not be read)."""
+    if not isinstance(case_data, dict):
+        return CaseSummary(case_folder_name, None, "", "", "", "", "", "", mtime, size, False)
+    return CaseSummary(
+        folder=case_folder_name,
+        case_id=case_data.get("case_id"),
+        child_name=case_data.get("child_name", {}).get("value", ""),
+        diagnosis=case_data.get("diagnosis", {}).get("value", ""),
+        dob=case_data.get("dob", {}).get("value", ""),
+        gender=case_data.get("gender", {}).get("value", ""),
+        father_name=case_data.get("father_name", {}).get("value", ""),
+        mother_name=case_data.get("mother_name", {}).get("value", ""),
+        mtime=mtime,
+        size=size,
+        valid=True,
+    )
+
+
+def revision_of(record):
+    """Returns the revision of a stored record; files written before revisions existed count as 0."""
+    if not record:
+        return 0
+    return record.get(REVISION_KEY, 0)
+
+
+def _field_value(value):
+    return value.get("value") if isinstance(value, dict) else value
+
+
+def diff_records(stored, attempted):
+    """Compares two versions of a case or survey field by field.
+    Args:
+        stored (dict): The version on disk.
+        attempted (dict): The version being saved.
+    Returns:
+        list: (field key, label, stored value, attempted value) tuples for the fields
+              whose values differ; bookkeeping fields are ignored.
+    """
+    differences = []
+    for key in list(stored) + [key for key in attempted if key not in stored]:
+        if key.startswith("_") or key == "submission_timestamp":
+            continue
+        stored_value = _field_value(stored.get(key))
+        attempted_value = _field_value(attempted.get(key))
+        if stored_value != attempted_value:
+            field = stored.get(key) if isinstance(stored.get(key), dict) else attempted.get(key)
+            label = field.get("ar_key", key) if isinstance(field, dict) else key
+            differences.append((key, label, stored_value, attempted_value))
+    return differences
+
+
+def check_revision(stored, attempted, expected_revision):
+    """Checks that a record was not saved by someone else since it was loaded.
+
+    The save may go ahead if no revision is expected, or the stored revision is
+    the expected one, or the other save left every field with the values being
+    saved now (nothing would be lost).
+    Args:
+        stored (dict): The version on disk, or None if there is none.
+        attempted (dict): The version being saved.
+        expected_revision (int): The revision the record had when it was loaded, or None.
+    Returns:
+        str: None if the save may go ahead, otherwise a message listing the differing fields.
+    """
+    if expected_revision is None:
+        return None
+    if stored is None:
+        if expected_revision == 0:
+            return None
+        return "لم يتم الحفظ لأن هذا السجل حُذف من مستخدم آخر بعد أن فتحته."
+    if revision_of(stored) == expected_revision:
+        return None
+    differences = diff_records(stored, attempted)
+    if not differences:
+        return None
+
+    lines = ["لم يتم الحفظ لأن مستخدمًا آخر حفظ هذا السجل بعد أن فتحته.",
+             "الحقول المختلفة بين النسخة المحفوظة ونسختك:"]
+    for _, label, stored_value, attempted_value in differences[:CONFLICT_DIFF_LIMIT]:
+        lines.append(f"- {label}: المحفوظة «{stored_value or '-'}»، نسختك «{attempted_value or '-'}»")
+    if len(differences) > CONFLICT_DIFF_LIMIT:
+        lines.append(f"... و{len(differences) - CONFLICT_DIFF_LIMIT} حقول أخرى")
+    lines.append("أعد فتح السجل لرؤية آخر نسخة ثم أعد إدخال تعديلاتك.")
+    return "\n".join(lines)
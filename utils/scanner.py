@@ -0,0 +1,75 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .record_format import read_record
+
+# Per-folder work (stat + optional read of case.json) is latency bound on network
+# shares, so it is spread over a small, bounded pool of threads.
+DEFAULT_SCAN_WORKERS = 8
+
+SCAN_OK = "ok"            # case.json was read and parsed
+SCAN_NOT_READ = "unread"  # case.json exists but was only stat'ed
+SCAN_CORRUPT = "corrupt"  # case.json exists but could not be read or parsed
+
+CaseFolderScan = namedtuple("CaseFolderScan", ["folder", "mtime", "size", "status", "data"])
+
+
+def _scan_one(data_dir, folder, read):
+    """Stats (and optionally parses) the case.json of one folder. Returns None if there is none."""
+    case_file_path = os.path.join(data_dir, folder, "case.json")
+    try:
+        st = os.stat(case_file_path)
+    except OSError:
+        return None
+
+    should_read = read(folder, st.st_mtime_ns, st.st_size) if callable(read) else read
+    if not should_read:
+        return CaseFolderScan(folder, st.st_mtime_ns, st.st_size, SCAN_NOT_READ, None)
+    try:
+        data = read_record(data_dir, case_file_path)
+    except Exception as e:
+        print(f"Error loading case data from {case_file_path}: {str(e)}")
+        return CaseFolderScan(folder, st.st_mtime_ns, st.st_size, SCAN_CORRUPT, None)
+    return CaseFolderScan(folder, st.st_mtime_ns, st.st_size, SCAN_OK, data)
+
+
+def scan_case_folders(data_dir, read=True, max_workers=DEFAULT_SCAN_WORKERS, folders=None):
+    """Scans the data directory in a single pass and returns one result per case folder.
+
+    The directory is listed once with os.scandir, whose DirEntry objects carry the
+    entry type, so non-directories are skipped without extra syscalls. The stat
+    (and, if requested, the parse) of each folder's case.json runs on a bounded
+    thread pool. Folders without a case.json are not reported.
+    Args:
+        data_dir (str): The directory holding the case folders.
+        read (bool or callable): Whether to parse case.json. A callable receives
+            (folder, mtime, size) and decides per folder, e.g. to re-read only
+            files that changed since they were last indexed.
+        max_workers (int): Upper bound on the number of worker threads.
+        folders (iterable): The folder names to scan, relative to data_dir, for
+            layouts that do not keep every case at the top level; by default the
+            subdirectories of data_dir.
+    Returns:
+        list: CaseFolderScan tuples (folder, mtime, size, status, data) in
+              directory order, where mtime is in nanoseconds and data is the
+              parsed case.json (None unless status is SCAN_OK).
+    """
+    if not data_dir or not os.path.isdir(data_dir):
+        return []
+
+    if folders is None:
+        with os.scandir(data_dir) as it:
+            folders = [entry.name for entry in it if entry.is_dir()]
+    else:
+        folders = list(folders)
+    if not folders:
+        return []
+
+    workers = max(1, min(max_workers, len(folders)))
+    if workers == 1:
+        results = [_scan_one(data_dir, folder, read) for folder in folders]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda folder: _scan_one(data_dir, folder, read), folders))
+    return [result for result in results if result is not None]
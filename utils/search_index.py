@@ -0,0 +1,153 @@
+import re
+
+# Harakat, tanween, shadda, sukun and superscript alef, plus tatweel
+_ARABIC_IGNORED_CHARS = re.compile("[\u064B-\u0652\u0670\u0640]")
+_ARABIC_LETTER_VARIANTS = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+})
+_WHITESPACE = re.compile(r"\s+")
+
+NGRAM_SIZE = 3
+# Joins the texts of a document; it is removed from queries, so none matches across two texts
+TEXT_SEPARATOR = "\x00"
+
+
+def normalize_arabic(text):
+    """Normalizes text for searching: lower-cases it, strips diacritics and tatweel,
+    unifies the alef, taa marbuta and alef maqsura spellings and collapses whitespace."""
+    if not text:
+        return ""
+    text = _ARABIC_IGNORED_CHARS.sub("", str(text).lower())
+    text = text.translate(_ARABIC_LETTER_VARIANTS)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def _document_ngrams(document):
+    return set().union(*map(_ngrams, document.split(TEXT_SEPARATOR)))
+
+
+class TrigramIndex:
+    """Inverted index from character trigrams to document keys, for substring search.
+
+    A document may consist of several texts, e.g. the names of a family; a query
+    matches a document if it is contained in one of them, never across two.
+    A query of three or more characters is answered by intersecting the two
+    smallest posting lists of its trigrams and verifying the remaining candidates
+    with a substring check; shorter queries fall back to scanning the indexed texts.
+    """
+    def __init__(self):
+        self._texts = {}     # {key: normalized texts joined with TEXT_SEPARATOR}
+        self._postings = {}  # {trigram: set of keys}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, key, *texts):
+        """Indexes (or re-indexes) a document made of the given texts under the given key."""
+        self.remove(key)
+        document = TEXT_SEPARATOR.join(text for text in map(normalize_arabic, texts) if text)
+        self._texts[key] = document
+        for gram in _document_ngrams(document):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def merge(self, other):
+        """Adds the documents of another TrigramIndex, e.g. one built on a worker
+        thread, replacing documents with the same key. other must not be used afterwards."""
+        for key in other._texts:
+            if key in self._texts:
+                self.remove(key)
+        self._texts.update(other._texts)
+        postings = self._postings
+        for gram, keys in other._postings.items():
+            posted = postings.get(gram)
+            if posted is None:
+                postings[gram] = keys
+            else:
+                posted |= keys
+
+    def remove(self, key):
+        """Removes a document from the index if it is there."""
+        document = self._texts.pop(key, None)
+        if document is None:
+            return
+        for gram in _document_ngrams(document):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def search(self, query, within=None):
+        """Returns the set of keys whose text contains the (normalized) query.
+        Args:
+            query (str): The text to look for.
+            within (set): Only consider these keys, e.g. the matches of a shorter
+                query. They are checked directly when there are fewer of them
+                than the postings of the query would yield.
+        """
+        query = normalize_arabic(query).replace(TEXT_SEPARATOR, "")
+        texts = self._texts
+        if not query:
+            return set(texts) if within is None else {key for key in within if key in texts}
+        if len(query) < NGRAM_SIZE:
+            if within is not None and len(within) < len(texts) // 2:
+                return {key for key in within if key in texts and query in texts[key]}
+            matches = {key for key, text in texts.items() if query in text}
+            return matches if within is None else matches & within
+
+        posting_lists = []
+        for gram in _ngrams(query):
+            keys = self._postings.get(gram)
+            if not keys:
+                return set()
+            posting_lists.append(keys)
+        posting_lists.sort(key=len)
+        if within is not None and len(within) <= len(posting_lists[0]):
+            return {key for key in within if key in texts and query in texts[key]}
+        if len(posting_lists) == 1:
+            matches = set(posting_lists[0])
+        else:
+            # Intersecting further lists costs more than checking the candidates directly
+            candidates = posting_lists[0] & posting_lists[1]
+            matches = {key for key in candidates if query in texts[key]}
+        return matches if within is None else matches & within
+
+
+class CaseSearchIndex:
+    """Trigram indexes over the case summaries, keyed by case folder name.
+
+    Name queries match the child's name or one of the parents' names, each
+    indexed as a text of its own; diagnosis queries match the diagnosis.
+    """
+    def __init__(self, summaries=()):
+        self.names = TrigramIndex()
+        self.diagnoses = TrigramIndex()
+        for summary in summaries:
+            self.add(summary)
+
+    def add(self, summary):
+        self.names.add(summary.folder, summary.child_name, summary.father_name, summary.mother_name)
+        self.diagnoses.add(summary.folder, summary.diagnosis)
+
+    def merge(self, other):
+        self.names.merge(other.names)
+        self.diagnoses.merge(other.diagnoses)
+
+    def remove(self, case_folder_name):
+        self.names.remove(case_folder_name)
+        self.diagnoses.remove(case_folder_name)
+
+    def search_names(self, query, within=None):
+        return self.names.search(query, within)
+
+    def search_diagnoses(self, query, within=None):
+        return self.diagnoses.search(query, within)
@@ -0,0 +1,457 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .records import REVISION_KEY, summary_from_case_data, revision_of, check_revision, CaseSummary, SurveyHeader, MISSING_SURVEY_DATE
+from .search_index import normalize_arabic
+from .storage_backend import StorageBackend
+from .survey_history import survey_id_of
+
+SQLITE_FILENAME = "mycases.sqlite3"
+SQLITE_SCHEMA_VERSION = 2
+# How long a write waits for another process's transaction before failing
+BUSY_TIMEOUT_MS = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cases (
+    case_id TEXT PRIMARY KEY,
+    folder TEXT NOT NULL UNIQUE,
+    child_name TEXT NOT NULL DEFAULT '',
+    diagnosis TEXT NOT NULL DEFAULT '',
+    dob TEXT NOT NULL DEFAULT '',
+    gender TEXT NOT NULL DEFAULT '',
+    father_name TEXT NOT NULL DEFAULT '',
+    mother_name TEXT NOT NULL DEFAULT '',
+    revision INTEGER NOT NULL DEFAULT 0,
+    updated_ns INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cases_child_name ON cases (child_name);
+CREATE INDEX IF NOT EXISTS cases_diagnosis ON cases (diagnosis);
+CREATE INDEX IF NOT EXISTS cases_dob ON cases (dob);
+CREATE TABLE IF NOT EXISTS surveys (
+    case_id TEXT NOT NULL REFERENCES cases (case_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    survey_id TEXT NOT NULL,
+    survey_type TEXT NOT NULL,
+    survey_date TEXT NOT NULL DEFAULT '',
+    revision INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    PRIMARY KEY (case_id, survey_id)
+);
+CREATE INDEX IF NOT EXISTS surveys_type_date ON surveys (survey_type, survey_date);
+CREATE INDEX IF NOT EXISTS surveys_case_type_date ON surveys (case_id, survey_type, survey_date);
+CREATE INDEX IF NOT EXISTS surveys_date ON surveys (survey_date);
+CREATE TABLE IF NOT EXISTS survey_values (
+    case_id TEXT NOT NULL,
+    survey_id TEXT NOT NULL,
+    survey_type TEXT NOT NULL,
+    field_key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (case_id, survey_id, field_key),
+    FOREIGN KEY (case_id, survey_id) REFERENCES surveys (case_id, survey_id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+CREATE INDEX IF NOT EXISTS survey_values_field ON survey_values (survey_type, field_key);
+CREATE TABLE IF NOT EXISTS survey_fields (
+    survey_type TEXT NOT NULL,
+    field_key TEXT NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (survey_type, field_key)
+);
+CREATE TABLE IF NOT EXISTS id_allocator (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    next_id INTEGER NOT NULL
+);
+"""
+
+# Version 1 kept one survey per type and case, keyed by (case_id, survey_type).
+# Its surveys keep their type as survey ID, matching the survey files of the
+# JSON layout, which were named after their type.
+_MIGRATE_FROM_V1 = """
+CREATE TABLE surveys_v2 (
+    case_id TEXT NOT NULL REFERENCES cases (case_id) ON DELETE CASCADE ON UPDATE CASCADE,
+    survey_id TEXT NOT NULL,
+    survey_type TEXT NOT NULL,
+    survey_date TEXT NOT NULL DEFAULT '',
+    revision INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    PRIMARY KEY (case_id, survey_id)
+);
+INSERT INTO surveys_v2 (case_id, survey_id, survey_type, survey_date, revision, data)
+    SELECT case_id, survey_type, survey_type, survey_date, revision, data FROM surveys;
+CREATE TABLE survey_values_v2 (
+    case_id TEXT NOT NULL,
+    survey_id TEXT NOT NULL,
+    survey_type TEXT NOT NULL,
+    field_key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (case_id, survey_id, field_key),
+    FOREIGN KEY (case_id, survey_id) REFERENCES surveys (case_id, survey_id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+INSERT INTO survey_values_v2 (case_id, survey_id, survey_type, field_key, value)
+    SELECT case_id, survey_type, survey_type, field_key, value FROM survey_values;
+DROP TABLE survey_values;
+DROP TABLE surveys;
+ALTER TABLE surveys_v2 RENAME TO surveys;
+ALTER TABLE survey_values_v2 RENAME TO survey_values;
+UPDATE meta SET value = '2' WHERE key = 'schema_version';
+"""
+
+
+def _survey_filename(survey_id):
+    return survey_id + ".json"
+
+
+class SqliteBackend(StorageBackend):
+    """Stores cases and surveys in one SQLite database in the data directory.
+
+    Cases are listed with a single query over indexed columns (case_id, names,
+    diagnosis, dob) without reading the JSON documents, which are kept whole in
+    the data column. Survey answers are also stored normalized per field in
+    survey_values, so field-scoped searches are a lookup on (survey_type,
+    field_key). A case keeps every assessment of a survey type, each under its
+    own survey ID (the survey filename of the JSON layout, without ".json");
+    surveys are stored whole, not as deltas. Each thread uses its own
+    connection; writes run in IMMEDIATE transactions, which also serialize
+    processes sharing the database.
+    """
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, SQLITE_FILENAME)
+        self._local = threading.local()
+        conn = self._connection()
+        self._upgrade_schema(conn)
+        conn.executescript(_SCHEMA)
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SQLITE_SCHEMA_VERSION),))
+
+    def _upgrade_schema(self, conn):
+        """Upgrades a database written by an earlier version of the application."""
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'").fetchone():
+            return  # A new database
+        row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None or row[0] != "1":
+            return
+        # The tables are rebuilt with the foreign keys off, so dropping the old
+        # tables does not cascade; executescript() commits before it runs
+        conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            conn.executescript("BEGIN IMMEDIATE;" + _MIGRATE_FROM_V1 + "COMMIT;")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute("PRAGMA foreign_keys = ON")
+        print(f"Upgraded {self.path} to schema version {SQLITE_SCHEMA_VERSION}")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+            self._local.in_batch = False
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @contextmanager
+    def _write(self):
+        """Runs the block in a write transaction, or in the current batch's transaction."""
+        conn = self._connection()
+        if self._local.in_batch:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def batch(self):
+        conn = self._connection()
+        if self._local.in_batch:
+            yield
+            return
+        with self._write():
+            self._local.in_batch = True
+            try:
+                yield
+            finally:
+                self._local.in_batch = False
+
+    def _case_id_of(self, conn, case_folder_name):
+        row = conn.execute("SELECT case_id FROM cases WHERE folder = ?", (case_folder_name,)).fetchone()
+        return row[0] if row else None
+
+    # --- Cases ---
+
+    def allocate_case_ids(self, count):
+        with self._write() as conn:
+            row = conn.execute("SELECT next_id FROM id_allocator WHERE id = 1").fetchone()
+            if row is None:
+                highest = conn.execute("SELECT MAX(CAST(case_id AS INTEGER)) FROM cases").fetchone()[0]
+                first = (highest or 0) + 1
+                conn.execute("INSERT INTO id_allocator (id, next_id) VALUES (1, ?)", (first + count,))
+            else:
+                first = row[0]
+                conn.execute("UPDATE id_allocator SET next_id = ? WHERE id = 1", (first + count,))
+            return first
+
+    def next_case_id(self):
+        """Returns the ID the next allocation starts from, without allocating it."""
+        conn = self._connection()
+        row = conn.execute("SELECT next_id FROM id_allocator WHERE id = 1").fetchone()
+        highest = conn.execute("SELECT MAX(CAST(case_id AS INTEGER)) FROM cases").fetchone()[0]
+        return max(row[0] if row else 1, (highest or 0) + 1)
+
+    def raise_next_case_id(self, next_id):
+        """Makes sure no ID below next_id is allocated again, e.g. IDs of deleted cases carried over by a migration."""
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO id_allocator (id, next_id) VALUES (1, ?) ON CONFLICT (id) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)",
+                (max(next_id, self.next_case_id()),)
+            )
+
+    def find_case_folder(self, case_id):
+        row = self._connection().execute("SELECT folder FROM cases WHERE case_id = ?", (str(case_id),)).fetchone()
+        return row[0] if row else None
+
+    def save_case(self, case_data, expected_revision):
+        case_id = str(case_data.get("case_id"))
+        child_name = case_data.get("child_name", {}).get("value", "")
+        dob = case_data.get("dob", {}).get("value", "")
+        case_folder_name = f"{case_id} - {child_name} - {dob}"
+
+        with self._write() as conn:
+            row = conn.execute("SELECT folder, data FROM cases WHERE case_id = ?", (case_id,)).fetchone()
+            stored_case_data = json.loads(row[1]) if row else None
+            conflict = check_revision(stored_case_data, case_data, expected_revision)
+            if conflict:
+                return False, conflict, None, None
+
+            case_data = dict(case_data)
+            case_data[REVISION_KEY] = revision_of(stored_case_data) + 1
+            summary = self._put_case_row(conn, case_id, case_folder_name, case_data, time.time_ns())
+        previous_folder = row[0] if row and row[0] != case_folder_name else None
+        return True, "تم حفظ بيانات الحالة بنجاح", summary, previous_folder
+
+    def load_case(self, case_folder_name):
+        row = self._connection().execute("SELECT data FROM cases WHERE folder = ?", (case_folder_name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_case(self, case_folder_name):
+        with self._write() as conn:
+            deleted = conn.execute("DELETE FROM cases WHERE folder = ?", (case_folder_name,)).rowcount
+        if not deleted:
+            return False, f"الحالة غير موجودة: {case_folder_name}"
+        return True, "تم حذف الحالة بنجاح."
+
+    def case_summaries(self):
+        rows = self._connection().execute(
+            "SELECT folder, case_id, child_name, diagnosis, dob, gender, father_name, mother_name, updated_ns, size"
+            " FROM cases ORDER BY rowid"
+        )
+        return [CaseSummary(*row, True) for row in rows]
+
+    # --- Bulk transfer (used by utils.migrate) ---
+
+    def existing_folders(self, case_folder_names):
+        """Returns the subset of case_folder_names (at most a few hundred) that are stored."""
+        case_folder_names = list(case_folder_names)
+        if not case_folder_names:
+            return set()
+        placeholders = ", ".join("?" * len(case_folder_names))
+        rows = self._connection().execute(f"SELECT folder FROM cases WHERE folder IN ({placeholders})", case_folder_names)
+        return {row[0] for row in rows}
+
+    def put_case_records(self, records):
+        """Stores whole cases verbatim (keeping their folder names and revisions) in one transaction.
+        Args:
+            records (list): (folder name, case data, mtime in ns, [(survey ID, survey data)]) tuples.
+        Returns:
+            list: (folder name, message) for the cases that were not stored.
+        """
+        rejected = []
+        with self._write() as conn:
+            for case_folder_name, case_data, mtime, surveys in records:
+                case_id = str(case_data.get("case_id"))
+                row = conn.execute("SELECT folder FROM cases WHERE case_id = ?", (case_id,)).fetchone()
+                if row and row[0] != case_folder_name:
+                    rejected.append((case_folder_name, f"case ID {case_id} is already used by {row[0]}"))
+                    continue
+                self._put_case_row(conn, case_id, case_folder_name, case_data, mtime)
+                conn.execute("DELETE FROM surveys WHERE case_id = ?", (case_id,))
+                for survey_id, survey_data in surveys:
+                    self._put_survey_row(conn, case_id, survey_id, survey_data)
+        return rejected
+
+    def iter_case_records(self, page_size):
+        """Yields all cases in pages of up to page_size (folder name, case data, mtime in ns, [(survey ID, survey data)]) tuples."""
+        conn = self._connection()
+        last_rowid = 0
+        while True:
+            rows = conn.execute(
+                "SELECT rowid, case_id, folder, updated_ns, data FROM cases WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            case_ids = [row[1] for row in rows]
+            surveys = {}
+            for case_id, survey_id, data in conn.execute(
+                    f"SELECT case_id, survey_id, data FROM surveys WHERE case_id IN ({', '.join('?' * len(case_ids))})",
+                    case_ids):
+                surveys.setdefault(case_id, []).append((survey_id, json.loads(data)))
+            yield [(folder, json.loads(data), updated_ns, surveys.get(case_id, []))
+                   for _, case_id, folder, updated_ns, data in rows]
+
+    # --- Surveys ---
+
+    def save_survey(self, case_folder_name, survey_filename, survey_data, expected_revision):
+        survey_id = survey_id_of(survey_filename)
+        with self._write() as conn:
+            case_id = self._case_id_of(conn, case_folder_name)
+            if case_id is None:
+                return False, f"الحالة غير موجودة: {case_folder_name}"
+            row = conn.execute("SELECT data FROM surveys WHERE case_id = ? AND survey_id = ?", (case_id, survey_id)).fetchone()
+            stored_survey_data = json.loads(row[0]) if row else None
+            conflict = check_revision(stored_survey_data, survey_data, expected_revision)
+            if conflict:
+                return False, conflict
+
+            survey_data = dict(survey_data)
+            survey_data[REVISION_KEY] = revision_of(stored_survey_data) + 1
+            self._put_survey_row(conn, case_id, survey_id, survey_data)
+        return True, _survey_filename(survey_id)
+
+    def _put_case_row(self, conn, case_id, case_folder_name, case_data, updated_ns):
+        data = json.dumps(case_data, ensure_ascii=False)
+        summary = summary_from_case_data(case_folder_name, case_data, updated_ns, len(data))
+        conn.execute(
+            "INSERT INTO cases (case_id, folder, child_name, diagnosis, dob, gender, father_name, mother_name,"
+            " revision, updated_ns, size, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (case_id) DO UPDATE SET folder = excluded.folder, child_name = excluded.child_name,"
+            " diagnosis = excluded.diagnosis, dob = excluded.dob, gender = excluded.gender,"
+            " father_name = excluded.father_name, mother_name = excluded.mother_name,"
+            " revision = excluded.revision, updated_ns = excluded.updated_ns, size = excluded.size, data = excluded.data",
+            (case_id, case_folder_name, summary.child_name, summary.diagnosis, summary.dob, summary.gender,
+             summary.father_name, summary.mother_name, revision_of(case_data), summary.mtime, summary.size, data)
+        )
+        return summary
+
+    def _put_survey_row(self, conn, case_id, survey_id, survey_data):
+        survey_type = survey_data.get("survey_type") or survey_id
+        conn.execute(
+            "INSERT INTO surveys (case_id, survey_id, survey_type, survey_date, revision, data) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (case_id, survey_id) DO UPDATE SET survey_type = excluded.survey_type,"
+            " survey_date = excluded.survey_date, revision = excluded.revision, data = excluded.data",
+            (case_id, survey_id, survey_type, survey_data.get("survey_date", ""), revision_of(survey_data),
+             json.dumps(survey_data, ensure_ascii=False))
+        )
+        conn.execute("DELETE FROM survey_values WHERE case_id = ? AND survey_id = ?", (case_id, survey_id))
+        fields = [(key, value_dict) for key, value_dict in survey_data.items()
+                  if isinstance(value_dict, dict) and "value" in value_dict]
+        conn.executemany(
+            "INSERT INTO survey_values (case_id, survey_id, survey_type, field_key, value) VALUES (?, ?, ?, ?, ?)",
+            [(case_id, survey_id, survey_type, key, normalize_arabic(value_dict.get("value"))) for key, value_dict in fields]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO survey_fields (survey_type, field_key, label) VALUES (?, ?, ?)",
+            [(survey_type, key, value_dict.get("ar_key", key)) for key, value_dict in fields]
+        )
+
+    def load_surveys(self, case_folder_name):
+        rows = self._connection().execute(
+            "SELECT s.survey_id, s.data FROM surveys s JOIN cases c ON c.case_id = s.case_id"
+            " WHERE c.folder = ? ORDER BY s.survey_date", (case_folder_name,)
+        )
+        surveys = []
+        for survey_id, data in rows:
+            survey = json.loads(data)
+            survey["_filename"] = survey_id
+            survey.setdefault("survey_date", MISSING_SURVEY_DATE)
+            surveys.append(survey)
+        surveys.sort(key=lambda item: item.get("survey_date"))
+        return surveys
+
+    def survey_headers(self, case_folder_name):
+        rows = self._connection().execute(
+            "SELECT s.survey_id, s.survey_type, s.survey_date, json_extract(s.data, '$.submission_timestamp'), length(CAST(s.data AS BLOB))"
+            " FROM surveys s JOIN cases c ON c.case_id = s.case_id WHERE c.folder = ?", (case_folder_name,)
+        )
+        headers = [SurveyHeader(_survey_filename(survey_id), survey_type, survey_date or MISSING_SURVEY_DATE, timestamp or "", size, 0)
+                   for survey_id, survey_type, survey_date, timestamp, size in rows]
+        headers.sort(key=lambda header: header.survey_date)
+        return headers
+
+    def load_survey(self, case_folder_name, survey_filename):
+        row = self._connection().execute(
+            "SELECT s.data FROM surveys s JOIN cases c ON c.case_id = s.case_id WHERE c.folder = ? AND s.survey_id = ?",
+            (case_folder_name, survey_id_of(survey_filename))
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_survey(self, case_folder_name, survey_filename):
+        with self._write() as conn:
+            case_id = self._case_id_of(conn, case_folder_name)
+            deleted = conn.execute(
+                "DELETE FROM surveys WHERE case_id = ? AND survey_id = ?", (case_id, survey_id_of(survey_filename))
+            ).rowcount if case_id is not None else 0
+        if not deleted:
+            return False, f"الملف المحدد غير موجود: {survey_filename}"
+        return True, "تم حذف الاستبيان بنجاح."
+
+    def case_survey_types(self):
+        survey_types = {}
+        for folder, survey_type in self._connection().execute(
+                "SELECT c.folder, s.survey_type FROM surveys s JOIN cases c ON c.case_id = s.case_id"):
+            survey_types.setdefault(folder, set()).add(survey_type)
+        return survey_types
+
+    def survey_types_of(self, case_folder_name):
+        rows = self._connection().execute(
+            "SELECT s.survey_type FROM surveys s JOIN cases c ON c.case_id = s.case_id WHERE c.folder = ?",
+            (case_folder_name,)
+        )
+        return {row[0] for row in rows}
+
+    def survey_search_fields(self):
+        fields = {}
+        for survey_type, field_key, label in self._connection().execute(
+                "SELECT survey_type, field_key, label FROM survey_fields ORDER BY survey_type, rowid"):
+            fields.setdefault(survey_type, {})[field_key] = label
+        return fields
+
+    def search_surveys(self, text, survey_type=None, field_key=None):
+        query = normalize_arabic(text)
+        if not query:
+            return []
+        sql = ("SELECT c.folder, v.survey_id, v.survey_type, s.survey_date, v.field_key FROM survey_values v"
+               " JOIN surveys s ON s.case_id = v.case_id AND s.survey_id = v.survey_id"
+               " JOIN cases c ON c.case_id = v.case_id WHERE instr(v.value, ?) > 0")
+        params = [query]
+        if survey_type is not None:
+            sql += " AND v.survey_type = ?"
+            params.append(survey_type)
+        if field_key is not None:
+            sql += " AND v.field_key = ?"
+            params.append(field_key)
+        rows = self._connection().execute(sql, params)
+        return sorted((folder, _survey_filename(survey_id), found_type, survey_date, found_key)
+                      for folder, survey_id, found_type, survey_date, found_key in rows)
@@ -0,0 +1,91 @@
+STORAGE_JSON = "json"  # One folder per case with case.json and surveys/*.json (the default)
+STORAGE_SQLITE = "sqlite"  # A single SQLite database in the data directory
+STORAGE_BACKENDS = (STORAGE_JSON, STORAGE_SQLITE)
+
+
+class StorageBackend:
+    """Interface of an alternative store for cases and surveys.
+
+    utils.file_manager keeps its public functions and, when a backend is set,
+    forwards them to it; the folder-per-case JSON layout is implemented by
+    file_manager itself. Cases are identified by their folder name
+    ("<case_id> - <child name> - <dob>") everywhere, also in stores without
+    folders. A case may hold several assessments of a survey type, each
+    identified by its survey ID "<survey_type> - <yyyymmdd-hhmmss>-<random>"
+    (see survey_history.new_survey_filename); surveys saved before that are
+    identified by their survey type alone. The survey filename passed to and
+    returned by a backend is the survey ID plus ".json", also in stores
+    without files (see survey_history.survey_id_of). Backends store every
+    survey whole; delta storage is a detail of the JSON layout. Change
+    notifications are sent by file_manager, not by the backend.
+    """
+    def close(self):
+        pass
+
+    def batch(self):
+        """Returns a context manager grouping the writes inside it into one commit."""
+        raise NotImplementedError
+
+    def allocate_case_ids(self, count):
+        """Reserves count consecutive unused case IDs and returns the first one (int)."""
+        raise NotImplementedError
+
+    def find_case_folder(self, case_id):
+        """Returns the folder name of the case with the given ID, or None."""
+        raise NotImplementedError
+
+    def save_case(self, case_data, expected_revision):
+        """Saves a case, checking expected_revision like file_manager.check_revision.
+        Returns:
+            tuple: (bool, str message, CaseSummary of the saved case or None,
+                    previous folder name if the case was renamed, else None).
+        """
+        raise NotImplementedError
+
+    def load_case(self, case_folder_name):
+        """Returns the case data, or None if there is no such case."""
+        raise NotImplementedError
+
+    def delete_case(self, case_folder_name):
+        """Deletes a case with its surveys. Returns (bool, str message)."""
+        raise NotImplementedError
+
+    def case_summaries(self):
+        """Returns the CaseSummary of every case."""
+        raise NotImplementedError
+
+    def save_survey(self, case_folder_name, survey_filename, survey_data, expected_revision):
+        """Saves a survey under its filename, adding it or replacing that survey. Returns (bool, filename or message)."""
+        raise NotImplementedError
+
+    def load_surveys(self, case_folder_name):
+        """Returns the surveys of a case sorted by survey date, each with a "_filename" key (without ".json")."""
+        raise NotImplementedError
+
+    def survey_headers(self, case_folder_name):
+        """Returns the SurveyHeader of every survey of a case, sorted by survey date, without loading the surveys."""
+        raise NotImplementedError
+
+    def load_survey(self, case_folder_name, survey_filename):
+        """Returns one survey, or None if there is no such survey."""
+        raise NotImplementedError
+
+    def delete_survey(self, case_folder_name, survey_filename):
+        """Deletes one survey. Returns (bool, str message)."""
+        raise NotImplementedError
+
+    def case_survey_types(self):
+        """Returns {case folder name: set of survey types} for the cases with surveys."""
+        raise NotImplementedError
+
+    def survey_types_of(self, case_folder_name):
+        """Returns the set of survey types saved for one case."""
+        raise NotImplementedError
+
+    def survey_search_fields(self):
+        """Returns {survey_type: {field_key: ar_key}} for all saved survey fields."""
+        raise NotImplementedError
+
+    def search_surveys(self, text, survey_type=None, field_key=None):
+        """Returns (case folder name, survey filename, survey_type, survey_date, field_key) tuples."""
+        raise NotImplementedError
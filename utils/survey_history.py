@@ -0,0 +1,123 @@
+import uuid
+from datetime import datetime
+
+# A case keeps every assessment of a survey type, each in its own file named
+# after the type and a unique survey ID, so that follow-up assessments never
+# replace earlier ones. Files written before this existed are named after the
+# survey type alone and are read like any other.
+#
+# Consecutive assessments of a type mostly repeat the same answers, so a new
+# assessment is stored as a delta against the latest earlier one: the answers
+# that changed, plus the survey's own type, date and timestamp,
+#   {"_base": "<filename of the earlier survey>", "survey_type": ..., "balance": {...}}
+# and "_unset" listing the answers of the base it does not have. A delta is
+# resolved by applying it to its resolved base. Chains are kept short, so that
+# loading an assessment reads a bounded number of files.
+BASE_KEY = "_base"
+UNSET_KEY = "_unset"
+MAX_DELTA_CHAIN = 8
+
+
+def new_survey_filename(survey_type):
+    """Returns the filename of a new assessment: its survey type and a unique, time-ordered survey ID."""
+    return f"{survey_type} - {datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}.json"
+
+
+def survey_id_of(survey_filename):
+    """Returns the survey ID of a survey file: its filename without ".json"."""
+    return survey_filename[:-len(".json")] if survey_filename.endswith(".json") else survey_filename
+
+
+def is_delta(stored):
+    return isinstance(stored, dict) and BASE_KEY in stored
+
+
+def _is_answer(key, value):
+    return isinstance(value, dict) and not key.startswith("_")
+
+
+def make_delta(survey_data, base_filename, base_data):
+    """Returns a survey stored as a delta against its resolved base.
+    Args:
+        survey_data (dict): The whole survey.
+        base_filename (str): The filename of the survey it is stored against.
+        base_data (dict): That survey, resolved.
+    Returns:
+        dict: The survey as stored: every answer that differs from the base, and all other keys.
+    """
+    delta = {BASE_KEY: base_filename}
+    for key, value in survey_data.items():
+        if not _is_answer(key, value) or base_data.get(key) != value:
+            delta[key] = value
+    unset = [key for key, value in base_data.items() if _is_answer(key, value) and key not in survey_data]
+    if unset:
+        delta[UNSET_KEY] = unset
+    return delta
+
+
+def apply_delta(stored, base_data):
+    """Returns the whole survey a delta describes, given its resolved base. The keys keep the order of the base."""
+    unset = set(stored.get(UNSET_KEY, ()))
+    survey_data = {}
+    for key, value in base_data.items():
+        if key in stored:
+            survey_data[key] = stored[key]
+        elif _is_answer(key, value) and key not in unset:
+            survey_data[key] = value
+    for key, value in stored.items():
+        if key not in survey_data and key not in (BASE_KEY, UNSET_KEY):
+            survey_data[key] = value
+    return survey_data
+
+
+def _chain(survey_filename, read):
+    """Returns the stored surveys from survey_filename down to the whole survey its deltas apply to, or None."""
+    stored = read(survey_filename)
+    if stored is None:
+        return None
+    chain = [stored]
+    seen = {survey_filename}
+    while is_delta(chain[-1]):
+        base_filename = chain[-1][BASE_KEY]
+        if base_filename in seen:
+            raise ValueError(f"the history of survey {survey_filename} refers back to itself")
+        seen.add(base_filename)
+        base = read(base_filename)
+        if base is None:
+            raise ValueError(f"survey {base_filename}, which {survey_filename} is stored against, is missing")
+        chain.append(base)
+    return chain
+
+
+def _resolve(chain):
+    survey_data = chain.pop()
+    while chain:
+        survey_data = apply_delta(chain.pop(), survey_data)
+    return survey_data
+
+
+def resolve_survey(survey_filename, read):
+    """Loads a survey of a case, whole, whether it is stored whole or as a delta.
+    Args:
+        survey_filename (str): The filename of the survey.
+        read (callable): read(filename) returns a survey file of the same case as
+            stored (decoded, see record_format), or None if there is no such file.
+    Returns:
+        dict or None: The survey, or None if survey_filename does not exist.
+        Raises ValueError if a survey its delta depends on is missing.
+    """
+    chain = _chain(survey_filename, read)
+    return _resolve(chain) if chain is not None else None
+
+
+def stored_survey(survey_data, base_filename, read):
+    """Returns a survey as it is written: as a delta against base_filename (see
+    resolve_survey for read), or whole if there is no base or loading the survey
+    would take more than MAX_DELTA_CHAIN deltas. Raises ValueError like resolve_survey.
+    """
+    if base_filename is None:
+        return survey_data
+    chain = _chain(base_filename, read)
+    if chain is None or len(chain) > MAX_DELTA_CHAIN:
+        return survey_data
+    return make_delta(survey_data, base_filename, _resolve(chain))
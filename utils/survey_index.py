@@ -0,0 +1,228 @@
+import json
+import os
+from contextlib import nullcontext
+
+from .search_index import TrigramIndex, normalize_arabic
+
+SURVEY_INDEX_FILENAME = "survey_index.jsonl"
+SURVEY_INDEX_VERSION = 1
+
+
+class SurveyIndex:
+    """Persistent inverted index over the "value" fields of every saved survey.
+
+    Each survey is a document keyed by (case folder name, survey filename). Every
+    (survey_type, field_key) pair has its own TrigramIndex over the normalized
+    values of that field, so a query scoped to one field of one survey type only
+    looks at that field's postings and matches any part of an answer. Like the
+    case index, the file is an append-only JSON-lines log of "put" and "del"
+    entries after a version header, compacted when it holds too many superseded
+    entries.
+
+    With a lock (a FileLock shared by all processes using the data directory),
+    file updates are serialized, and compaction first reloads the file so that
+    entries appended by other processes are kept.
+    """
+    def __init__(self, data_dir, lock=None):
+        self.index_path = os.path.join(data_dir, SURVEY_INDEX_FILENAME)
+        self.lock = lock
+        self._reset()
+        self.loaded = self._load()
+
+    def _reset(self):
+        self._docs = {}      # {(folder, filename): {"survey_type", "survey_date", "fields": {key: normalized value}}}
+        self._field_indexes = {}  # {(survey_type, field_key): TrigramIndex keyed by (folder, filename)}
+        self._labels = {}    # {survey_type: {field_key: ar_key}}
+        self._lines = 0
+
+    # --- Persistence ---
+
+    def _load(self):
+        """Loads the index file. Returns False if it is missing or has another version."""
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                try:
+                    version = json.loads(f.readline()).get("version")
+                except (ValueError, AttributeError):
+                    version = None
+                if version != SURVEY_INDEX_VERSION:
+                    return False
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A torn line left by an interrupted append
+                    self._lines += 1
+                    doc_key = (entry.get("folder"), entry.get("file"))
+                    if entry.get("op") == "del":
+                        self._remove_doc(doc_key)
+                    else:
+                        self._put_doc(doc_key, entry)
+        except OSError as e:
+            print(f"Error loading survey index {self.index_path}: {e}")
+            return False
+        return True
+
+    def _locked(self):
+        return self.lock if self.lock is not None else nullcontext()
+
+    def _append(self, entries):
+        try:
+            with self._locked():
+                if not os.path.exists(self.index_path):
+                    self._write()
+                    return
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._lines += len(entries)
+                if self._lines > 2 * len(self._docs) + 100:
+                    self._reset()
+                    self._load()
+                    self._write()
+        except Exception as e:
+            print(f"Error updating survey index {self.index_path}: {e}")
+
+    def save(self):
+        """Writes the whole index to a fresh index file."""
+        try:
+            with self._locked():
+                self._write()
+        except Exception as e:
+            print(f"Error writing survey index {self.index_path}: {e}")
+
+    def _write(self):
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"version": SURVEY_INDEX_VERSION}) + "\n")
+                for doc_key, doc in self._docs.items():
+                    f.write(json.dumps(self._entry(doc_key, doc), ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.index_path)
+            self._lines = len(self._docs)
+        except OSError as e:
+            print(f"Error writing survey index {self.index_path}: {e}")
+
+    def _entry(self, doc_key, doc):
+        survey_type = doc["survey_type"]
+        labels = self._labels.get(survey_type, {})
+        return {
+            "op": "put",
+            "folder": doc_key[0],
+            "file": doc_key[1],
+            "survey_type": survey_type,
+            "survey_date": doc["survey_date"],
+            "fields": {key: [labels.get(key, key), value] for key, value in doc["fields"].items()},
+        }
+
+    # --- In-memory index ---
+
+    def _put_doc(self, doc_key, entry):
+        self._remove_doc(doc_key)
+        survey_type = entry.get("survey_type", "")
+        fields = {}
+        labels = self._labels.setdefault(survey_type, {})
+        for key, (label, value) in entry.get("fields", {}).items():
+            fields[key] = value
+            labels.setdefault(key, label)
+            field_index = self._field_indexes.get((survey_type, key))
+            if field_index is None:
+                field_index = self._field_indexes[(survey_type, key)] = TrigramIndex()
+            field_index.add(doc_key, value)
+        self._docs[doc_key] = {"survey_type": survey_type, "survey_date": entry.get("survey_date", ""), "fields": fields}
+
+    def _remove_doc(self, doc_key):
+        doc = self._docs.pop(doc_key, None)
+        if doc is None:
+            return
+        for key in doc["fields"]:
+            self._field_indexes[(doc["survey_type"], key)].remove(doc_key)
+
+    # --- Updates ---
+
+    @staticmethod
+    def entry_from_survey(case_folder_name, survey_filename, survey_data):
+        """Builds the index entry of a survey from its saved data."""
+        fields = {}
+        for key, value_dict in survey_data.items():
+            if isinstance(value_dict, dict) and "value" in value_dict:
+                fields[key] = [value_dict.get("ar_key", key), normalize_arabic(value_dict.get("value"))]
+        return {
+            "op": "put",
+            "folder": case_folder_name,
+            "file": survey_filename,
+            "survey_type": survey_data.get("survey_type", ""),
+            "survey_date": survey_data.get("survey_date", ""),
+            "fields": fields,
+        }
+
+    def put_survey(self, case_folder_name, survey_filename, survey_data, persist=True):
+        """Indexes (or re-indexes) a saved survey."""
+        entry = self.entry_from_survey(case_folder_name, survey_filename, survey_data)
+        self._put_doc((case_folder_name, survey_filename), entry)
+        if persist:
+            self._append([entry])
+
+    def persist_surveys(self, doc_keys):
+        """Appends the entries of surveys indexed with persist=False, given as
+        (case folder name, survey filename), to the index file in one go."""
+        entries = [self._entry(doc_key, self._docs[doc_key]) for doc_key in doc_keys if doc_key in self._docs]
+        if entries:
+            self._append(entries)
+
+    def remove_survey(self, case_folder_name, survey_filename):
+        """Removes a deleted survey from the index."""
+        doc_key = (case_folder_name, survey_filename)
+        if doc_key in self._docs:
+            self._remove_doc(doc_key)
+            self._append([{"op": "del", "folder": case_folder_name, "file": survey_filename}])
+
+    def remove_case(self, case_folder_name):
+        """Removes all surveys of a deleted case from the index."""
+        doc_keys = [doc_key for doc_key in self._docs if doc_key[0] == case_folder_name]
+        for doc_key in doc_keys:
+            self._remove_doc(doc_key)
+        if doc_keys:
+            self._append([{"op": "del", "folder": folder, "file": filename} for folder, filename in doc_keys])
+
+    # --- Queries ---
+
+    def survey_types(self):
+        return sorted(self._labels)
+
+    def case_survey_types(self):
+        """Returns {case folder name: set of survey types} for all indexed surveys."""
+        survey_types = {}
+        for (case_folder_name, _), doc in self._docs.items():
+            survey_types.setdefault(case_folder_name, set()).add(doc["survey_type"])
+        return survey_types
+
+    def field_labels(self, survey_type):
+        """Returns {field_key: ar_key} for the fields seen in surveys of the given type."""
+        return dict(self._labels.get(survey_type, {}))
+
+    def search(self, text, survey_type=None, field_key=None):
+        """Finds surveys whose field value contains the text (after Arabic normalization).
+        Args:
+            text (str): The text to look for anywhere in the answers.
+            survey_type (str): Restrict to one survey type, or None for all.
+            field_key (str): Restrict to one field, or None for all fields.
+        Returns:
+            list: (case folder name, survey filename, survey_type, survey_date, field_key)
+                  tuples, one per matching field.
+        """
+        if not normalize_arabic(text):
+            return []
+
+        results = []
+        for (indexed_type, indexed_key), field_index in self._field_indexes.items():
+            if survey_type is not None and indexed_type != survey_type:
+                continue
+            if field_key is not None and indexed_key != field_key:
+                continue
+            for doc_key in field_index.search(text):
+                results.append((doc_key[0], doc_key[1], indexed_type, self._docs[doc_key]["survey_date"], indexed_key))
+        results.sort()
+        return results
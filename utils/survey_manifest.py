@@ -0,0 +1,106 @@
+import json
+import os
+
+from .atomic_io import write_json_atomic
+from .records import SurveyHeader, MISSING_SURVEY_DATE
+
+# Every case folder keeps a small manifest of its surveys next to case.json, so
+# that listing the surveys of a case only reads one file instead of parsing
+# every survey. It is a cache: each entry records the size and modification
+# time of the survey file it describes, and entries that do not match the file
+# any more (e.g. written by an older version of the application) are rebuilt
+# from the survey itself.
+MANIFEST_FILENAME = "surveys_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _manifest_path(data_dir, case_folder_name):
+    return os.path.join(data_dir, case_folder_name, MANIFEST_FILENAME)
+
+
+def _read_manifest(data_dir, case_folder_name):
+    """Returns {survey filename: [survey_type, survey_date, submission_timestamp, size, mtime]}."""
+    try:
+        with open(_manifest_path(data_dir, case_folder_name), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Error reading the survey manifest of {case_folder_name}: {e}")
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("surveys", {})
+
+
+def _write_manifest(data_dir, case_folder_name, entries):
+    # Not synced: a manifest lost in a crash is rebuilt from the surveys
+    try:
+        write_json_atomic(data_dir, _manifest_path(data_dir, case_folder_name),
+                          {"version": MANIFEST_VERSION, "surveys": entries}, indent=None, durable=False)
+    except OSError as e:
+        print(f"Error writing the survey manifest of {case_folder_name}: {e}")
+
+
+def _entry(survey_filename, survey_data, size, mtime):
+    return [survey_data.get("survey_type") or survey_filename[:-len(".json")], survey_data.get("survey_date") or MISSING_SURVEY_DATE,
+            survey_data.get("submission_timestamp", ""), size, mtime]
+
+
+def survey_headers(data_dir, case_folder_name, load_survey):
+    """Lists the surveys of a case folder from its manifest.
+
+    The surveys folder is listed and every file is checked against its manifest
+    entry; only new or changed surveys are loaded (with load_survey(filename)),
+    and the manifest is updated if anything changed.
+    Returns:
+        list: SurveyHeader tuples sorted by survey date.
+    """
+    surveys_path = os.path.join(data_dir, case_folder_name, "surveys")
+    try:
+        with os.scandir(surveys_path) as it:
+            files = {}
+            for entry in it:
+                if entry.name.endswith(".json") and entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = (st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        return []
+
+    manifest = _read_manifest(data_dir, case_folder_name)
+    changed = False
+    headers = []
+    for survey_filename, (size, mtime) in files.items():
+        entry = manifest.get(survey_filename)
+        if not isinstance(entry, list) or len(entry) != len(SurveyHeader._fields) - 1 or entry[3:] != [size, mtime]:
+            survey_data = load_survey(survey_filename)
+            if survey_data is None:
+                continue
+            entry = manifest[survey_filename] = _entry(survey_filename, survey_data, size, mtime)
+            changed = True
+        headers.append(SurveyHeader(survey_filename, *entry))
+    for survey_filename in [name for name in manifest if name not in files]:
+        del manifest[survey_filename]
+        changed = True
+    if changed:
+        _write_manifest(data_dir, case_folder_name, manifest)
+    headers.sort(key=lambda header: header.survey_date)
+    return headers
+
+
+def put_survey_header(data_dir, case_folder_name, survey_filename, survey_data):
+    """Records a saved survey in the manifest of its case folder."""
+    try:
+        st = os.stat(os.path.join(data_dir, case_folder_name, "surveys", survey_filename))
+    except OSError:
+        return
+    manifest = _read_manifest(data_dir, case_folder_name)
+    manifest[survey_filename] = _entry(survey_filename, survey_data, st.st_size, st.st_mtime_ns)
+    _write_manifest(data_dir, case_folder_name, manifest)
+
+
+def remove_survey_header(data_dir, case_folder_name, survey_filename):
+    """Removes a deleted survey from the manifest of its case folder."""
+    manifest = _read_manifest(data_dir, case_folder_name)
+    if manifest.pop(survey_filename, None) is not None:
+        _write_manifest(data_dir, case_folder_name, manifest)